@@ -1,100 +1,144 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask import (Flask, render_template, request, redirect, url_for, session, flash, g, jsonify, Response,
+                   make_response, stream_with_context, has_request_context, send_file)
+from werkzeug.security import generate_password_hash
+from werkzeug.utils import secure_filename
 from functools import wraps
+import json
 import sqlite3
 import os
 
+import click
+
+import assets
+import autosave
+import bulk
+import chronology
+import compression
+import context
+import database
+import exports
+import generation
+import graph
+import instrumentation
+import integrity
+import manuscripts
+import mentions
+import migrations
+import ordering
+import pagecache
+import pagination
+import passwords
+import progress
+import queryplan
+import revisions
+import search
+import settings
+import stats
+import textstats
+
 app = Flask(__name__)
+# Development only: create_app() replaces it with SECRET_KEY from the environment
 app.secret_key = os.urandom(24)
 
 DATABASE = 'project.db'
 
-# ==================== Database Functions ====================
-
-def get_db():
-    """Get database connection"""
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
-    return conn
+# Defaults; create_app() overrides them from the environment (see settings.py)
+app.config['DATABASE'] = DATABASE
+app.config['DB_POOL_SIZE'] = database.DEFAULT_POOL_SIZE
+app.config['AI_API_URL'] = generation.API_URL
+app.config['AI_API_KEY'] = ''
+app.config['AI_WORKERS'] = generation.WORKERS
+app.config['AI_STREAM'] = True
+# Token budget for project notes sent with AI prompts (0 turns them off); see context.py
+app.config['AI_CONTEXT_TOKENS'] = context.BUDGET
+# Months, seasons and eras for timeline dates; see chronology.Calendar
+app.config['TIMELINE_CALENDAR'] = {}
+app.config['IMPORT_MAX_BYTES'] = 50 * 1024 * 1024
+# Werkzeug refuses larger request bodies with 413 while reading them; a
+# manuscript is the largest upload, so create_app() keeps the two equal
+app.config['MAX_CONTENT_LENGTH'] = app.config['IMPORT_MAX_BYTES']
+app.config['RENDER_CACHE_BYTES'] = pagecache.MAX_BYTES
+# Password hashing pool and login rate limits (0 turns a limit off); see passwords.py
+app.config['PASSWORD_HASH_METHOD'] = passwords.METHOD
+app.config['PASSWORD_WORKERS'] = passwords.WORKERS
+app.config['PASSWORD_MAX_PENDING'] = passwords.MAX_PENDING
+app.config['AUTH_IP_PER_MINUTE'] = passwords.IP_PER_MINUTE
+app.config['AUTH_USER_PER_MINUTE'] = passwords.USER_PER_MINUTE
+# Request/SQL/template timing and /metrics; see instrumentation.py
+app.config['INSTRUMENTATION'] = False
+app.config['SLOW_QUERY_MS'] = instrumentation.SLOW_QUERY_MS
+app.config['PROFILING'] = False
+app.config['PROFILE_SAMPLE_RATE'] = 0.0
+app.config['PROFILE_DIR'] = 'profiles'
+app.config['PROFILE_MAX_FILES'] = instrumentation.PROFILE_MAX_FILES
+app.config['METRICS_TOKEN'] = None
+# gzip/brotli for large dynamic responses; see compression.py
+app.config['COMPRESSION'] = True
+app.config['COMPRESS_MIN_BYTES'] = compression.MIN_BYTES
+instrumentation.init_app(app)
+compression.init_app(app)
+
+def create_app(overrides=None, require_secret=False):
+    """Configure the app from the environment and return it (the WSGI entry point).
+
+    Opens no database connections, so it is safe to call in a pre-fork
+    master before the workers are forked; schema changes are a separate
+    `flask migrate` step. With require_secret, a missing SECRET_KEY is an
+    error rather than a per-process random key, which would sign every
+    worker's sessions differently and log users out on each restart.
+    """
+    loaded = settings.load(app.config)
+    if overrides:
+        app.config.update(overrides)
+        loaded |= set(overrides)
+    app.config['MAX_CONTENT_LENGTH'] = app.config['IMPORT_MAX_BYTES']
+    if 'SECRET_KEY' not in loaded or not app.config['SECRET_KEY']:
+        if require_secret:
+            raise settings.ConfigError('SECRET_KEY is not set; add it to the environment or .env')
+        app.config['SECRET_KEY'] = app.config['SECRET_KEY'] or os.urandom(24)
+        app.logger.warning('SECRET_KEY is not set; using a random key, sessions end on restart')
+    return app
 
-def init_db():
-    """Initialize database with all tables"""
-    with app.app_context():
-        db = get_db()
-
-        # Users table
-        db.execute('''CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            email TEXT UNIQUE NOT NULL,
-            password_hash TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )''')
-
-        # Characters table
-        db.execute('''CREATE TABLE IF NOT EXISTS characters (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            name TEXT NOT NULL,
-            age INTEGER,
-            role TEXT,
-            description TEXT,
-            personality TEXT,
-            background TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
-        )''')
-
-        # Chapters table
-        db.execute('''CREATE TABLE IF NOT EXISTS chapters (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            title TEXT NOT NULL,
-            chapter_number INTEGER NOT NULL,
-            content TEXT,
-            word_count INTEGER DEFAULT 0,
-            status TEXT DEFAULT 'draft',
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
-        )''')
-
-        # Timeline table
-        db.execute('''CREATE TABLE IF NOT EXISTS timeline (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            event_title TEXT NOT NULL,
-            event_date TEXT,
-            description TEXT,
-            chapter_id INTEGER,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
-            FOREIGN KEY (chapter_id) REFERENCES chapters(id) ON DELETE SET NULL
-        )''')
-
-        # Relationships table
-        db.execute('''CREATE TABLE IF NOT EXISTS relationships (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            character1_id INTEGER NOT NULL,
-            character2_id INTEGER NOT NULL,
-            relationship_type TEXT NOT NULL,
-            description TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
-            FOREIGN KEY (character1_id) REFERENCES characters(id) ON DELETE CASCADE,
-            FOREIGN KEY (character2_id) REFERENCES characters(id) ON DELETE CASCADE
-        )''')
-
-        # Create indexes
-        db.execute('CREATE INDEX IF NOT EXISTS idx_characters_user ON characters(user_id)')
-        db.execute('CREATE INDEX IF NOT EXISTS idx_chapters_user ON chapters(user_id)')
-        db.execute('CREATE INDEX IF NOT EXISTS idx_timeline_user ON timeline(user_id)')
-        db.execute('CREATE INDEX IF NOT EXISTS idx_relationships_user ON relationships(user_id)')
+# ==================== Database Functions ====================
 
-        db.commit()
+def get_db(readonly=False):
+    """Get the database connection for the current request.
+
+    The connection is checked out of the process-wide pool on first use and
+    returned to it by close_db() when the request ends, so views must not
+    close it themselves. Read-only views pass readonly=True to use a separate
+    query_only connection that never contends for the write lock.
+    """
+    key = 'db_readonly' if readonly else 'db'
+    if key not in g:
+        pool = database.get_pool(app.config['DATABASE'], readonly=readonly,
+                                 size=app.config['DB_POOL_SIZE'])
+        conn = pool.acquire()
+        if app.config['INSTRUMENTATION']:
+            setattr(g, key, (pool, conn, instrumentation.wrap(conn, app.config['SLOW_QUERY_MS'])))
+        else:
+            setattr(g, key, (pool, conn, conn))
+    return getattr(g, key)[2]
+
+@app.teardown_appcontext
+def close_db(exception=None):
+    """Return the request's connections to the pool"""
+    for key in ('db', 'db_readonly'):
+        checkout = g.pop(key, None)
+        if checkout is not None:
+            pool, conn, _ = checkout
+            pool.release(conn)
+
+def init_db(target=None):
+    """Create or upgrade the database schema; see migrations.py"""
+    db = database.connect(app.config['DATABASE'])
+    try:
+        applied = migrations.migrate(db, get_calendar(), target, log=print)
+        print(f"✅ Database at schema version {migrations.current_version(db)} "
+              f"({len(applied)} migrations applied)")
+        return applied
+    finally:
         db.close()
-        print("✅ Database initialized successfully")
 
 # ==================== Decorators ====================
 
@@ -108,6 +152,45 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+# ==================== Password Hashing ====================
+
+def get_hasher():
+    """The process-wide password hashing pool"""
+    return passwords.get_hasher(app.config['PASSWORD_WORKERS'], app.config['PASSWORD_MAX_PENDING'],
+                                app.config['PASSWORD_HASH_METHOD'])
+
+_auth_limiters = None
+
+def get_auth_limiters():
+    """Per-address and per-username attempt buckets for this process"""
+    global _auth_limiters
+    if _auth_limiters is None:
+        _auth_limiters = (passwords.RateLimiter(app.config['AUTH_IP_PER_MINUTE']),
+                          passwords.RateLimiter(app.config['AUTH_USER_PER_MINUTE']))
+    return _auth_limiters
+
+def admit(username=None):
+    """Spend this attempt's rate limit tokens, before anything is hashed"""
+    by_address, by_username = get_auth_limiters()
+    by_address.take(request.remote_addr or '')
+    if username:
+        by_username.take(username.casefold())
+
+def throttled(e, template=None, endpoint=None):
+    """429 (rate limited) or 503 (hashing pool full) with Retry-After"""
+    if isinstance(e, passwords.RateLimited):
+        flash(f'Too many attempts. Please try again in {e.retry_after} seconds.', 'warning')
+        status = 429
+    else:
+        flash('The server is busy. Please try again in a moment.', 'warning')
+        status = 503
+    if template:
+        response = make_response(render_template(template), status)
+    else:
+        response = redirect(url_for(endpoint))
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
+
 # ==================== Authentication Routes ====================
 
 @app.route('/')
@@ -141,7 +224,8 @@ def register():
                 return redirect(url_for('register'))
 
             # Hash password
-            password_hash = generate_password_hash(password)
+            admit()
+            password_hash = get_hasher().hash(password)
 
             # Insert into database
             db = get_db()
@@ -153,9 +237,9 @@ def register():
                 return redirect(url_for('login'))
             except sqlite3.IntegrityError:
                 flash('Username or email already exists', 'danger')
-            finally:
-                db.close()
 
+        except (passwords.RateLimited, passwords.Busy) as e:
+            return throttled(e, 'register.html')
         except Exception as e:
             flash(f'Registration error: {str(e)}', 'danger')
             print(f"❌ Registration Error: {e}")
@@ -174,11 +258,20 @@ def login():
                 flash('Please enter username and password', 'warning')
                 return redirect(url_for('login'))
 
+            admit(username)
             db = get_db()
             user = db.execute('SELECT * FROM users WHERE username = ?', (username,)).fetchone()
-            db.close()
 
-            if user and check_password_hash(user['password_hash'], password):
+            hasher = get_hasher()
+            if user and hasher.verify(user['password_hash'], password):
+                if hasher.needs_rehash(user['password_hash']):
+                    # Cost parameters changed: store a hash made with the current ones
+                    try:
+                        db.execute('UPDATE users SET password_hash = ? WHERE id = ?',
+                                   (hasher.hash(password), user['id']))
+                        db.commit()
+                    except passwords.Busy:
+                        pass  # next login
                 session['user_id'] = user['id']
                 session['username'] = user['username']
                 flash(f'Welcome back, {username}!', 'success')
@@ -186,6 +279,8 @@ def login():
             else:
                 flash('Invalid username or password', 'danger')
 
+        except (passwords.RateLimited, passwords.Busy) as e:
+            return throttled(e, 'login.html')
         except Exception as e:
             flash('An error occurred during login', 'danger')
             print(f"❌ Login Error: {e}")
@@ -206,21 +301,14 @@ def logout():
 @login_required
 def dashboard():
     """User dashboard"""
-    db = get_db()
+    db = get_db(readonly=True)
+    user_stats = stats.get_stats(db, session['user_id'])
 
-    characters_count = db.execute('SELECT COUNT(*) as count FROM characters WHERE user_id = ?',
-                                  (session['user_id'],)).fetchone()['count']
-    chapters_count = db.execute('SELECT COUNT(*) as count FROM chapters WHERE user_id = ?',
-                                (session['user_id'],)).fetchone()['count']
-    timeline_count = db.execute('SELECT COUNT(*) as count FROM timeline WHERE user_id = ?',
-                                (session['user_id'],)).fetchone()['count']
-
-    db.close()
 
     return render_template('dashboard.html',
-                          characters_count=characters_count,
-                          chapters_count=chapters_count,
-                          timeline_count=timeline_count)
+                          characters_count=user_stats['characters'],
+                          chapters_count=user_stats['chapters'],
+                          timeline_count=user_stats['timeline'])
 
 # ==================== Characters Routes ====================
 
@@ -228,11 +316,23 @@ def dashboard():
 @login_required
 def characters():
     """List all characters"""
-    db = get_db()
-    characters_list = db.execute('SELECT * FROM characters WHERE user_id = ? ORDER BY created_at DESC',
-                                 (session['user_id'],)).fetchall()
-    db.close()
-    return render_template('characters.html', characters=characters_list)
+    db = get_db(readonly=True)
+    characters_list = pagination.seek(
+        db,
+        '''SELECT id, name, age, role, substr(description, 1, 101) as description, created_at
+           FROM characters WHERE user_id = ?''',
+        (session['user_id'],),
+        [('created_at', 'created_at'), ('id', 'id')],
+        descending=True,
+        after=request.args.get('after'),
+        before=request.args.get('before'))
+    appearances = mentions.summary(db, session['user_id'], [c['id'] for c in characters_list])
+    return render_template('characters.html', characters=characters_list, appearances=appearances)
+
+def reindex_mentions(user_id):
+    """Rescan the author's chapters for character mentions in the background"""
+    mentions.invalidate(user_id)
+    mentions.schedule(app.config['DATABASE'], user_id)
 
 @app.route('/add_character', methods=['GET', 'POST'])
 @login_required
@@ -245,6 +345,7 @@ def add_character():
         description = request.form.get('description')
         personality = request.form.get('personality')
         background = request.form.get('background')
+        aliases = request.form.get('aliases', '').strip()
 
         if not name:
             flash('Character name is required', 'warning')
@@ -252,11 +353,12 @@ def add_character():
 
         db = get_db()
         db.execute('''INSERT INTO characters
-                     (user_id, name, age, role, description, personality, background)
-                     VALUES (?, ?, ?, ?, ?, ?, ?)''',
-                  (session['user_id'], name, age, role, description, personality, background))
+                     (user_id, name, aliases, age, role, description, personality, background)
+                     VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+                  (session['user_id'], name, aliases, age, role, description, personality, background))
         db.commit()
-        db.close()
+        graph.invalidate(session['user_id'])
+        reindex_mentions(session['user_id'])
 
         flash('Character added successfully!', 'success')
         return redirect(url_for('characters'))
@@ -276,20 +378,21 @@ def edit_character(id):
         description = request.form.get('description')
         personality = request.form.get('personality')
         background = request.form.get('background')
+        aliases = request.form.get('aliases', '').strip()
 
         db.execute('''UPDATE characters
-                     SET name=?, age=?, role=?, description=?, personality=?, background=?
+                     SET name=?, aliases=?, age=?, role=?, description=?, personality=?, background=?
                      WHERE id=? AND user_id=?''',
-                  (name, age, role, description, personality, background, id, session['user_id']))
+                  (name, aliases, age, role, description, personality, background, id, session['user_id']))
         db.commit()
-        db.close()
+        graph.invalidate(session['user_id'])
+        reindex_mentions(session['user_id'])
 
         flash('Character updated successfully!', 'success')
         return redirect(url_for('characters'))
 
     character = db.execute('SELECT * FROM characters WHERE id=? AND user_id=?',
                           (id, session['user_id'])).fetchone()
-    db.close()
 
     if not character:
         flash('Character not found', 'danger')
@@ -304,7 +407,9 @@ def delete_character(id):
     db = get_db()
     db.execute('DELETE FROM characters WHERE id=? AND user_id=?', (id, session['user_id']))
     db.commit()
-    db.close()
+    graph.invalidate(session['user_id'])
+    # A shorter name the deleted one used to cover may now count
+    reindex_mentions(session['user_id'])
 
     flash('Character deleted successfully!', 'success')
     return redirect(url_for('characters'))
@@ -315,11 +420,21 @@ def delete_character(id):
 @login_required
 def chapters():
     """List all chapters"""
-    db = get_db()
-    chapters_list = db.execute('SELECT * FROM chapters WHERE user_id = ? ORDER BY chapter_number',
-                               (session['user_id'],)).fetchall()
-    db.close()
-    return render_template('chapters.html', chapters=chapters_list)
+    db = get_db(readonly=True)
+    chapters_list = pagination.seek(
+        db,
+        '''SELECT id, title, sort_key, word_count, status, excerpt, created_at
+           FROM chapters WHERE user_id = ?''',
+        (session['user_id'],),
+        [('sort_key', 'sort_key'), ('id', 'id')],
+        after=request.args.get('after'),
+        before=request.args.get('before'))
+    # Numbers are positions in reading order: count once, then step through the page
+    first_number = 1
+    if chapters_list:
+        first = chapters_list.items[0]
+        first_number = ordering.number(db, session['user_id'], first['sort_key'], first['id'])
+    return render_template('chapters.html', chapters=chapters_list, first_number=first_number)
 
 @app.route('/add_chapter', methods=['GET', 'POST'])
 @login_required
@@ -327,42 +442,132 @@ def add_chapter():
     """Add new chapter"""
     if request.method == 'POST':
         title = request.form.get('title', '').strip()
-        chapter_number = request.form.get('chapter_number')
+        # Where to insert it; empty adds it after the last chapter
+        position = request.form.get('chapter_number', type=int)
         content = request.form.get('content', '')
-        word_count = len(content.split()) if content else 0
+        text_stats = textstats.analyze(content)
         status = request.form.get('status', 'draft')
 
-        if not title or not chapter_number:
-            flash('Title and chapter number are required', 'warning')
+        if not title:
+            flash('Title is required', 'warning')
             return redirect(url_for('add_chapter'))
 
         db = get_db()
-        db.execute('''INSERT INTO chapters
-                     (user_id, title, chapter_number, content, word_count, status)
-                     VALUES (?, ?, ?, ?, ?, ?)''',
-                  (session['user_id'], title, chapter_number, content, word_count, status))
+        sort_key = ordering.key_for_position(db, session['user_id'], position)
+        chapter_number = position or ordering.count(db, session['user_id']) + 1
+        cursor = db.execute('''INSERT INTO chapters
+                     (user_id, title, chapter_number, sort_key, content, word_count, char_count,
+                      paragraph_count, sentence_count, reading_minutes, excerpt, status)
+                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                  (session['user_id'], title, chapter_number, sort_key, content, *text_stats, status))
+        revisions.record(db, cursor.lastrowid, session['user_id'], content, text_stats.word_count)
+        mentions.index_chapter(db, session['user_id'], cursor.lastrowid, content)
         db.commit()
-        db.close()
 
         flash('Chapter added successfully!', 'success')
         return redirect(url_for('chapters'))
 
     return render_template('add_chapter.html')
 
+@app.route('/import_manuscript', methods=['GET', 'POST'])
+@login_required
+def import_manuscript():
+    """Import a manuscript file as a run of new chapters"""
+    if request.method == 'POST':
+        upload = request.files.get('manuscript')
+        if upload is None or not upload.filename:
+            flash('Choose a manuscript file to import', 'warning')
+            return redirect(url_for('import_manuscript'))
+        preset = request.form.get('headings', 'chapters')
+        if preset not in manuscripts.HEADING_PRESETS:
+            flash('Choose how chapters are marked in the file', 'warning')
+            return redirect(url_for('import_manuscript'))
+
+        pattern = manuscripts.HEADING_PRESETS[preset]
+        try:
+            imported = manuscripts.import_file(get_db(), session['user_id'], upload.stream,
+                                               upload.filename, pattern)
+        except manuscripts.ManuscriptError as e:
+            flash(f'❌ Import failed: {e}', 'danger')
+            return redirect(url_for('import_manuscript'))
+        reindex_mentions(session['user_id'])
+
+        flash(f'✅ Imported {imported} chapters from {upload.filename}', 'success')
+        return redirect(url_for('chapters'))
+
+    return render_template('import_manuscript.html')
+
+@app.errorhandler(413)
+def request_too_large(e):
+    """Bodies over MAX_CONTENT_LENGTH are refused while they are read"""
+    if request.endpoint == 'import_manuscript':
+        flash(f"File is too large (max {app.config['MAX_CONTENT_LENGTH'] // (1024 * 1024)} MB)", 'danger')
+        return redirect(url_for('import_manuscript'))
+    return e
+
 @app.route('/chapter/<int:id>')
 @login_required
 def chapter_detail(id):
-    """View chapter details"""
-    db = get_db()
-    chapter = db.execute('SELECT * FROM chapters WHERE id=? AND user_id=?',
-                        (id, session['user_id'])).fetchone()
-    db.close()
+    """View chapter details.
 
-    if not chapter:
+    The chapter card is rendered once per saved state and cached; browsers
+    revalidate with the ETag and get a 304 while the chapter is unchanged.
+    """
+    db = get_db(readonly=True)
+    stamp = db.execute('SELECT title, version, updated_at, sort_key FROM chapters WHERE id=? AND user_id=?',
+                       (id, session['user_id'])).fetchone()
+
+    if not stamp:
         flash('Chapter not found', 'danger')
         return redirect(url_for('chapters'))
 
-    return render_template('chapter_detail.html', chapter=chapter)
+    # Moving other chapters changes this one's number, and editing characters
+    # who are named in it changes the cast list, so both are part of the tag
+    number = ordering.number(db, session['user_id'], stamp['sort_key'], id)
+    cast = mentions.for_chapter(db, session['user_id'], id)
+    cache = get_chapter_cache()
+    tag = pagecache.etag(id, stamp['version'], stamp['updated_at'], number, mentions.digest(cast))
+    modified = pagecache.last_modified(stamp['updated_at'])
+    # The navbar shows the username, so a page kept by the browser is only
+    # current for the same author under the same name
+    shell = pagecache.viewer(session['user_id'], session.get('username'))
+    # A pending flash message has to be rendered, so skip the 304 then
+    if '_flashes' not in session and pagecache.is_fresh(request, f'{tag}.{shell}', modified):
+        cache.not_modified += 1
+        response = Response(status=304)
+    else:
+        body = cache.get(id, tag)
+        if body is None:
+            chapter = db.execute('SELECT * FROM chapters WHERE id=? AND user_id=?',
+                                (id, session['user_id'])).fetchone()
+            # Stamp what was actually rendered, in case it changed since
+            tag = pagecache.etag(id, chapter['version'], chapter['updated_at'], number, mentions.digest(cast))
+            modified = pagecache.last_modified(chapter['updated_at'])
+            body = render_template('chapter_body.html', chapter=chapter, number=number)
+            cache.set(id, tag, body, owner=session['user_id'])
+        response = make_response(render_template('chapter_detail.html', title=stamp['title'], body=body,
+                                                  cast=cast))
+
+    response.set_etag(f'{tag}.{shell}')
+    response.last_modified = modified
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+_chapter_cache = None
+
+def get_chapter_cache():
+    """The process-wide cache of rendered chapter cards"""
+    global _chapter_cache
+    if _chapter_cache is None:
+        _chapter_cache = pagecache.FragmentCache(app.config['RENDER_CACHE_BYTES'])
+    return _chapter_cache
+
+@app.route('/api/cache')
+@login_required
+def api_cache_stats():
+    """Hit-rate counters for the rendered chapter cache"""
+    return jsonify({'chapters': get_chapter_cache().stats()})
 
 @app.route('/edit_chapter/<int:id>', methods=['GET', 'POST'])
 @login_required
@@ -372,59 +577,220 @@ def edit_chapter(id):
 
     if request.method == 'POST':
         title = request.form.get('title', '').strip()
-        chapter_number = request.form.get('chapter_number')
+        position = request.form.get('chapter_number', type=int)
         content = request.form.get('content', '')
-        word_count = len(content.split()) if content else 0
+        text_stats = textstats.analyze(content)
         status = request.form.get('status', 'draft')
 
+        previous = db.execute('SELECT content, version, sort_key FROM chapters WHERE id=? AND user_id=?',
+                              (id, session['user_id'])).fetchone()
+        if not previous:
+            flash('Chapter not found', 'danger')
+            return redirect(url_for('chapters'))
+
+        version = request.form.get('version', type=int)
+        if version is not None and version != previous['version'] and content != previous['content']:
+            flash('This chapter was changed elsewhere since you opened it. Save again to overwrite '
+                  'those changes, or check its history first.', 'warning')
+            return render_template('edit_chapter.html', number=position, chapter=dict(
+                previous, id=id, title=title, content=content,
+                word_count=text_stats.word_count, status=status))
+
+        number = ordering.number(db, session['user_id'], previous['sort_key'], id)
         db.execute('''UPDATE chapters
-                     SET title=?, chapter_number=?, content=?, word_count=?, status=?,
-                         updated_at=CURRENT_TIMESTAMP
+                     SET title=?, content=?, word_count=?, char_count=?,
+                         paragraph_count=?, sentence_count=?, reading_minutes=?, excerpt=?, status=?,
+                         version=version + 1, updated_at=CURRENT_TIMESTAMP
                      WHERE id=? AND user_id=?''',
-                  (title, chapter_number, content, word_count, status, id, session['user_id']))
+                  (title, content, *text_stats, status, id, session['user_id']))
+        revisions.record(db, id, session['user_id'], content, text_stats.word_count,
+                         previous=previous['content'] or '')
+        mentions.index_chapter(db, session['user_id'], id, content)
         db.commit()
-        db.close()
+        if position is not None and position != number:
+            ordering.move(db, session['user_id'], id, position=position)
+        get_chapter_cache().invalidate(id)
 
         flash('Chapter updated successfully!', 'success')
         return redirect(url_for('chapter_detail', id=id))
 
     chapter = db.execute('SELECT * FROM chapters WHERE id=? AND user_id=?',
                         (id, session['user_id'])).fetchone()
-    db.close()
 
     if not chapter:
         flash('Chapter not found', 'danger')
         return redirect(url_for('chapters'))
 
-    return render_template('edit_chapter.html', chapter=chapter)
+    return render_template('edit_chapter.html', chapter=chapter,
+                           number=ordering.number(db, session['user_id'], chapter['sort_key'], id))
+
+@app.route('/api/chapters/<int:id>/autosave', methods=['PATCH'])
+@login_required
+def api_autosave_chapter(id):
+    """Apply an editor delta to a chapter"""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or type(data.get('base_version')) is not int:
+        return jsonify({'error': 'base_version is required'}), 400
+    if 'content' in data and not isinstance(data['content'], str):
+        return jsonify({'error': 'content must be a string'}), 400
+
+    try:
+        result = autosave.save(get_db(), id, session['user_id'], data['base_version'],
+                               changes=data.get('changes'), content=data.get('content'))
+    except autosave.Conflict as conflict:
+        return jsonify({'error': 'conflict', 'version': conflict.version,
+                        'content': conflict.content}), 409
+    except autosave.DeltaError as error:
+        return jsonify({'error': str(error)}), 422
+
+    if result is None:
+        return jsonify({'error': 'chapter not found'}), 404
+    if result['revision'] is not None:
+        get_chapter_cache().invalidate(id)
+    return jsonify(result)
+
+@app.route('/api/chapters/<int:id>/mentions')
+@login_required
+def api_chapter_mentions(id):
+    """Characters named in a chapter, most mentioned first"""
+    db = get_db(readonly=True)
+    if not db.execute('SELECT 1 FROM chapters WHERE id=? AND user_id=?', (id, session['user_id'])).fetchone():
+        return jsonify({'error': 'chapter not found'}), 404
+    return jsonify({'chapter_id': id, 'characters': [
+        {'id': row['id'], 'name': row['name'], 'mentions': row['mentions'], 'first_offset': row['first_offset']}
+        for row in mentions.for_chapter(db, session['user_id'], id)]})
+
+@app.route('/api/characters/<int:id>/mentions')
+@login_required
+def api_character_mentions(id):
+    """Chapters a character is named in, in reading order"""
+    db = get_db(readonly=True)
+    if not db.execute('SELECT 1 FROM characters WHERE id=? AND user_id=?', (id, session['user_id'])).fetchone():
+        return jsonify({'error': 'character not found'}), 404
+    return jsonify({'character_id': id, 'chapters': [
+        {'id': row['id'], 'title': row['title'], 'mentions': row['mentions'], 'first_offset': row['first_offset']}
+        for row in mentions.for_character(db, session['user_id'], id)]})
 
 @app.route('/delete_chapter/<int:id>')
 @login_required
 def delete_chapter(id):
     """Delete chapter"""
     db = get_db()
+    # Revisions go with it and linked events lose the link (ON DELETE)
     db.execute('DELETE FROM chapters WHERE id=? AND user_id=?', (id, session['user_id']))
     db.commit()
-    db.close()
+    get_chapter_cache().invalidate(id)
 
     flash('Chapter deleted successfully!', 'success')
     return redirect(url_for('chapters'))
 
+@app.route('/chapter/<int:id>/revisions')
+@login_required
+def chapter_revisions(id):
+    """List the saved revisions of a chapter"""
+    db = get_db(readonly=True)
+    chapter = db.execute('SELECT id, title FROM chapters WHERE id=? AND user_id=?',
+                        (id, session['user_id'])).fetchone()
+
+    if not chapter:
+        flash('Chapter not found', 'danger')
+        return redirect(url_for('chapters'))
+
+    return render_template('revisions.html', chapter=chapter,
+                           revisions=revisions.list_revisions(db, id))
+
+@app.route('/chapter/<int:id>/revisions/<int:revision>')
+@login_required
+def revision_diff(id, revision):
+    """Show what changed in a revision (or between two revisions)"""
+    db = get_db(readonly=True)
+    chapter = db.execute('SELECT id, title FROM chapters WHERE id=? AND user_id=?',
+                        (id, session['user_id'])).fetchone()
+    against = request.args.get('against', revision - 1, type=int)
+
+    new = revisions.reconstruct(db, id, revision) if chapter else None
+    if new is None:
+        flash('Revision not found', 'danger')
+        return redirect(url_for('chapter_revisions', id=id) if chapter else url_for('chapters'))
+
+    old = revisions.reconstruct(db, id, against) if against > 0 else None
+    lines = revisions.diff(old or '', new, f'Revision {against}', f'Revision {revision}')
+    return render_template('revision_diff.html', chapter=chapter, revision=revision,
+                           against=against, lines=list(lines))
+
+@app.route('/chapter/<int:id>/revisions/<int:revision>/restore', methods=['POST'])
+@login_required
+def restore_revision(id, revision):
+    """Make an old revision the chapter's current content"""
+    db = get_db()
+    chapter = db.execute('SELECT content FROM chapters WHERE id=? AND user_id=?',
+                        (id, session['user_id'])).fetchone()
+    content = revisions.reconstruct(db, id, revision) if chapter else None
+
+    if content is None:
+        flash('Revision not found', 'danger')
+        return redirect(url_for('chapters'))
+
+    text_stats = textstats.analyze(content)
+    db.execute('''UPDATE chapters
+                 SET content=?, word_count=?, char_count=?, paragraph_count=?, sentence_count=?,
+                     reading_minutes=?, excerpt=?, version=version + 1, updated_at=CURRENT_TIMESTAMP
+                 WHERE id=? AND user_id=?''',
+              (content, *text_stats, id, session['user_id']))
+    revisions.record(db, id, session['user_id'], content, text_stats.word_count,
+                     previous=chapter['content'] or '')
+    mentions.index_chapter(db, session['user_id'], id, content)
+    db.commit()
+    get_chapter_cache().invalidate(id)
+
+    flash(f'Restored revision {revision}', 'success')
+    return redirect(url_for('chapter_detail', id=id))
+
 # ==================== Timeline Routes ====================
 
 @app.route('/timeline')
 @login_required
 def timeline():
-    """View timeline"""
-    db = get_db()
-    events = db.execute('''SELECT t.*, c.title as chapter_title
-                          FROM timeline t
-                          LEFT JOIN chapters c ON t.chapter_id = c.id
-                          WHERE t.user_id = ?
-                          ORDER BY t.event_date''',
-                       (session['user_id'],)).fetchall()
-    db.close()
-    return render_template('timeline.html', events=events)
+    """View timeline, optionally between two dates or within a chapter range"""
+    db = get_db(readonly=True)
+    calendar = get_calendar()
+    filters = {key: request.args.get(key, '').strip()
+               for key in ('from', 'to', 'chapter_from', 'chapter_to')}
+    query = '''SELECT t.id, t.event_title, t.event_date, t.description, t.sort_key,
+                      c.title as chapter_title
+               FROM timeline t
+               LEFT JOIN chapters c ON t.chapter_id = c.id
+               WHERE t.user_id = ?'''
+    params = [session['user_id']]
+
+    for key, end, op in (('from', False, '>='), ('to', True, '<=')):
+        if filters[key]:
+            bound = calendar.parse(filters[key], end=end)
+            if bound is None:
+                flash(f'Could not read "{filters[key]}" as a date', 'warning')
+                filters[key] = ''
+            else:
+                query += f' AND t.sort_key {op} ?'
+                params.append(bound)
+    for key, op in (('chapter_from', '>='), ('chapter_to', '<=')):
+        if filters[key].isdigit():
+            # Chapter numbers are positions, so filter on the sort key found there
+            bound = ordering.key_at(db, session['user_id'], int(filters[key]))
+            if bound is not None:
+                query += f' AND c.sort_key {op} ?'
+                params.append(bound)
+            elif op == '>=':
+                query += ' AND 0'
+        else:
+            filters[key] = ''
+
+    events = pagination.seek(
+        db, query, params,
+        [('t.sort_key', 'sort_key'), ('t.id', 'id')],
+        after=request.args.get('after'),
+        before=request.args.get('before'))
+    return render_template('timeline.html', events=events, undated=chronology.UNDATED,
+                           filters={key: value for key, value in filters.items() if value})
 
 @app.route('/add_event', methods=['GET', 'POST'])
 @login_required
@@ -434,30 +800,37 @@ def add_event():
         event_title = request.form.get('event_title', '').strip()
         event_date = request.form.get('event_date')
         description = request.form.get('description')
-        chapter_id = request.form.get('chapter_id')
+        chapter_id = request.form.get('chapter_id', type=int)
 
         if not event_title:
             flash('Event title is required', 'warning')
             return redirect(url_for('add_event'))
 
         db = get_db()
+        if chapter_id is not None and not db.execute('SELECT 1 FROM chapters WHERE id = ? AND user_id = ?',
+                                                     (chapter_id, session['user_id'])).fetchone():
+            flash('Chapter not found', 'danger')
+            return redirect(url_for('add_event'))
         db.execute('''INSERT INTO timeline
-                     (user_id, event_title, event_date, description, chapter_id)
-                     VALUES (?, ?, ?, ?, ?)''',
-                  (session['user_id'], event_title, event_date, description, chapter_id))
+                     (user_id, event_title, event_date, description, chapter_id, sort_key)
+                     VALUES (?, ?, ?, ?, ?, ?)''',
+                  (session['user_id'], event_title, event_date, description, chapter_id,
+                   chronology.sort_key(get_calendar(), event_date)))
         db.commit()
-        db.close()
 
         flash('Event added successfully!', 'success')
         return redirect(url_for('timeline'))
 
     db = get_db()
-    chapters_list = db.execute('SELECT id, title, chapter_number FROM chapters WHERE user_id = ?',
+    chapters_list = db.execute('SELECT id, title FROM chapters WHERE user_id = ? ORDER BY sort_key, id',
                                (session['user_id'],)).fetchall()
-    db.close()
 
     return render_template('add_event.html', chapters=chapters_list)
 
+def get_calendar():
+    """The calendar used to order timeline dates"""
+    return chronology.Calendar.from_config(app.config['TIMELINE_CALENDAR'])
+
 @app.route('/delete_event/<int:id>')
 @login_required
 def delete_event(id):
@@ -465,7 +838,6 @@ def delete_event(id):
     db = get_db()
     db.execute('DELETE FROM timeline WHERE id=? AND user_id=?', (id, session['user_id']))
     db.commit()
-    db.close()
 
     flash('Event deleted successfully!', 'success')
     return redirect(url_for('timeline'))
@@ -476,17 +848,21 @@ def delete_event(id):
 @login_required
 def relationships():
     """View relationships"""
-    db = get_db()
-    relationships_list = db.execute('''SELECT r.*,
-                                      c1.name as character1_name,
-                                      c2.name as character2_name
-                                      FROM relationships r
-                                      JOIN characters c1 ON r.character1_id = c1.id
-                                      JOIN characters c2 ON r.character2_id = c2.id
-                                      WHERE r.user_id = ?
-                                      ORDER BY r.created_at DESC''',
-                                   (session['user_id'],)).fetchall()
-    db.close()
+    db = get_db(readonly=True)
+    relationships_list = pagination.seek(
+        db,
+        '''SELECT r.id, r.relationship_type, r.description, r.created_at,
+                  c1.name as character1_name,
+                  c2.name as character2_name
+           FROM relationships r
+           JOIN characters c1 ON r.character1_id = c1.id
+           JOIN characters c2 ON r.character2_id = c2.id
+           WHERE r.user_id = ?''',
+        (session['user_id'],),
+        [('r.created_at', 'created_at'), ('r.id', 'id')],
+        descending=True,
+        after=request.args.get('after'),
+        before=request.args.get('before'))
     return render_template('relationships.html', relationships=relationships_list)
 
 @app.route('/add_relationship', methods=['GET', 'POST'])
@@ -494,8 +870,8 @@ def relationships():
 def add_relationship():
     """Add character relationship"""
     if request.method == 'POST':
-        character1_id = request.form.get('character1_id')
-        character2_id = request.form.get('character2_id')
+        character1_id = request.form.get('character1_id', type=int)
+        character2_id = request.form.get('character2_id', type=int)
         relationship_type = request.form.get('relationship_type', '').strip()
         description = request.form.get('description')
 
@@ -508,12 +884,18 @@ def add_relationship():
             return redirect(url_for('add_relationship'))
 
         db = get_db()
+        owned = db.execute('SELECT COUNT(*) FROM characters WHERE user_id = ? AND id IN (?, ?)',
+                           (session['user_id'], character1_id, character2_id)).fetchone()[0]
+        if owned != 2:
+            flash('Character not found', 'danger')
+            return redirect(url_for('add_relationship'))
+
         db.execute('''INSERT INTO relationships
                      (user_id, character1_id, character2_id, relationship_type, description)
                      VALUES (?, ?, ?, ?, ?)''',
                   (session['user_id'], character1_id, character2_id, relationship_type, description))
         db.commit()
-        db.close()
+        graph.invalidate(session['user_id'])
 
         flash('Relationship added successfully!', 'success')
         return redirect(url_for('relationships'))
@@ -521,7 +903,6 @@ def add_relationship():
     db = get_db()
     characters_list = db.execute('SELECT id, name FROM characters WHERE user_id = ?',
                                  (session['user_id'],)).fetchall()
-    db.close()
 
     return render_template('add_relationship.html', characters=characters_list)
 
@@ -532,11 +913,218 @@ def delete_relationship(id):
     db = get_db()
     db.execute('DELETE FROM relationships WHERE id=? AND user_id=?', (id, session['user_id']))
     db.commit()
-    db.close()
+    graph.invalidate(session['user_id'])
 
     flash('Relationship deleted successfully!', 'success')
     return redirect(url_for('relationships'))
 
+# ==================== Bulk Edit API ====================
+
+def invalidate_bulk(kind, ids):
+    """Drop what the caches hold for rows changed by a batch"""
+    if kind == 'chapters':
+        cache = get_chapter_cache()
+        for chapter_id in ids:
+            cache.invalidate(chapter_id)
+    elif kind in ('characters', 'relationships'):
+        graph.invalidate(session['user_id'])
+    if kind == 'characters':
+        reindex_mentions(session['user_id'])
+
+@app.route('/api/<kind>/bulk-delete', methods=['POST'])
+@login_required
+def api_bulk_delete(kind):
+    """Delete many chapters, characters, events or relationships at once"""
+    if kind not in bulk.TABLES:
+        return jsonify({'error': 'not found'}), 404
+    data = request.get_json(silent=True) or {}
+    try:
+        ids = bulk.parse_ids(data.get('ids'))
+        deleted = bulk.delete(get_db(), kind, session['user_id'], ids)
+    except bulk.BulkError as e:
+        return jsonify({'error': str(e)}), 400
+    invalidate_bulk(kind, ids)
+    return jsonify({'deleted': deleted})
+
+@app.route('/api/chapters/bulk-status', methods=['POST'])
+@login_required
+def api_bulk_status():
+    """Change the status of many chapters at once"""
+    data = request.get_json(silent=True) or {}
+    try:
+        ids = bulk.parse_ids(data.get('ids'))
+        updated = bulk.set_status(get_db(), session['user_id'], ids, data.get('status'))
+    except bulk.BulkError as e:
+        return jsonify({'error': str(e)}), 400
+    invalidate_bulk('chapters', ids)
+    return jsonify({'updated': updated})
+
+@app.route('/api/chapters/<int:id>/move', methods=['POST'])
+@login_required
+def api_move_chapter(id):
+    """Drag and drop: put a chapter after another ({"after": id or null}) or at {"position": n}"""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not ('after' in data or 'position' in data):
+        return jsonify({'error': 'after or position is required'}), 400
+    after, position = data.get('after'), data.get('position')
+    if (after is not None and not isinstance(after, int)) or (position is not None and not isinstance(position, int)):
+        return jsonify({'error': 'after and position must be integers'}), 400
+    try:
+        new_position = ordering.move(get_db(), session['user_id'], id, after_id=after, position=position)
+    except ordering.OrderingError as e:
+        return jsonify({'error': str(e)}), 404
+    get_chapter_cache().invalidate(id)
+    return jsonify({'id': id, 'position': new_position})
+
+@app.route('/api/chapters/reorder', methods=['POST'])
+@login_required
+def api_reorder_chapters():
+    """Reorder chapters within the places they hold"""
+    data = request.get_json(silent=True) or {}
+    try:
+        ids = bulk.parse_ids(data.get('ids'))
+        updated = bulk.reorder(get_db(), session['user_id'], ids)
+    except bulk.BulkError as e:
+        return jsonify({'error': str(e)}), 400
+    invalidate_bulk('chapters', ids)
+    return jsonify({'updated': updated})
+
+# ==================== Relationship Graph API ====================
+
+def graph_character(cast_graph, key):
+    """Read a character id query argument that must be in the graph"""
+    character_id = request.args.get(key, type=int)
+    if character_id is None or character_id not in cast_graph:
+        return None
+    return character_id
+
+@app.route('/api/graph')
+@login_required
+def api_graph():
+    """Size of the cast graph, its clusters and isolated characters"""
+    cast_graph = graph.get_graph(get_db(readonly=True), session['user_id'])
+    components = cast_graph.components()
+    return jsonify({
+        'characters': len(cast_graph),
+        'relationships': cast_graph.edge_count,
+        'components': len(components),
+        'largest_component': len(components[0]) if components else 0,
+        'isolated': [cast_graph.node(i) for i in cast_graph.isolated()],
+    })
+
+@app.route('/api/graph/characters/<int:id>/neighbors')
+@login_required
+def api_graph_neighbors(id):
+    """Characters within ?hops= relationships (default 1, at most 6)"""
+    cast_graph = graph.get_graph(get_db(readonly=True), session['user_id'])
+    if id not in cast_graph:
+        return jsonify({'error': 'character not found'}), 404
+    hops = min(max(request.args.get('hops', 1, type=int), 1), 6)
+    return jsonify({'character': id, 'hops': hops, 'neighbors': cast_graph.within(id, hops)})
+
+@app.route('/api/graph/path')
+@login_required
+def api_graph_path():
+    """Shortest chain of relationships between ?from= and ?to="""
+    cast_graph = graph.get_graph(get_db(readonly=True), session['user_id'])
+    source, target = graph_character(cast_graph, 'from'), graph_character(cast_graph, 'to')
+    if source is None or target is None:
+        return jsonify({'error': 'from and to must be your character ids'}), 400
+    path = cast_graph.shortest_path(source, target)
+    return jsonify({
+        'from': source,
+        'to': target,
+        'path': [cast_graph.node(i) for i in path] if path is not None else None,
+        'length': len(path) - 1 if path is not None else None,
+    })
+
+@app.route('/api/graph/centrality')
+@login_required
+def api_graph_centrality():
+    """Most connected characters (degree centrality)"""
+    cast_graph = graph.get_graph(get_db(readonly=True), session['user_id'])
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 1000)
+    return jsonify({'characters': cast_graph.degree_centrality(limit)})
+
+@app.route('/api/graph/components')
+@login_required
+def api_graph_components():
+    """Clusters of characters connected by relationships, largest first"""
+    cast_graph = graph.get_graph(get_db(readonly=True), session['user_id'])
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 1000)
+    components = cast_graph.components()
+    return jsonify({
+        'count': len(components),
+        'components': [{'size': len(members), 'characters': [cast_graph.node(i) for i in members]}
+                       for members in components[:limit]],
+    })
+
+# ==================== Search Routes ====================
+
+SEARCH_URLS = {
+    'chapter': lambda id: url_for('chapter_detail', id=id),
+    'character': lambda id: url_for('edit_character', id=id),
+    'event': lambda id: url_for('timeline'),
+}
+
+def run_search():
+    """Run the search described by the query string for the current user"""
+    query = request.args.get('q', '').strip()
+    kinds = [kind for kind in request.args.getlist('type') if kind in search.SOURCES] or None
+    limit = max(1, min(request.args.get('limit', 20, type=int), 100))
+
+    results = search.search(get_db(readonly=True), session['user_id'], query, kinds, limit)
+    for result in results:
+        result['url'] = SEARCH_URLS[result['kind']](result['id'])
+    return query, results
+
+@app.route('/search')
+@login_required
+def search_page():
+    """Search chapters, characters and timeline events"""
+    query, results = run_search()
+    return render_template('search.html', query=query, results=results)
+
+@app.route('/api/search')
+@login_required
+def api_search():
+    """Search results as JSON"""
+    query, results = run_search()
+    return jsonify({
+        'query': query,
+        'results': [dict(result, snippet=str(result['snippet'])) for result in results],
+    })
+
+# ==================== Export Routes ====================
+
+@app.route('/export')
+@login_required
+def export():
+    """Choose an export format"""
+    return render_template('export.html')
+
+@app.route('/export/<export_format>')
+@login_required
+def export_download(export_format):
+    """Stream the manuscript (or a full backup) as a download"""
+    if export_format not in exports.FORMATS:
+        flash('Unknown export format', 'warning')
+        return redirect(url_for('export'))
+
+    db = get_db(readonly=True)
+    username = session.get('username', '')
+    title = request.args.get('title', '').strip() or f"{username}'s Manuscript"
+    mimetype, extension = exports.FORMATS[export_format]
+    suffix = '-backup' if export_format == 'backup' else ''
+    filename = secure_filename(f'{title}{suffix}.{extension}') or f'manuscript.{extension}'
+
+    # stream_with_context keeps the request (and its pooled connection)
+    # alive until the last chunk has been sent
+    chunks = exports.export(db, session['user_id'], export_format, title, author=username)
+    return Response(stream_with_context(chunks), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"',
+                             'Cache-Control': 'no-store'})
+
 # ==================== AI Generator Route ====================
 
 @app.route('/ai', methods=['GET', 'POST'])
@@ -551,80 +1139,110 @@ def ai():
             flash('Please enter a prompt', 'warning')
             return render_template('ai.html')
 
-        result = generate_ai_content(prompt, ai_type)
+        notes = prompt_context(prompt) if request.form.get('use_context') else ''
+        job = get_generator().submit(prompt, ai_type, owner=session['user_id'], context=notes)
+        return redirect(url_for('ai', job=job.id))
 
-        return render_template('ai.html', result=result, prompt=prompt, ai_type=ai_type)
+    job = None
+    if request.args.get('job'):
+        job = get_generator().get_job(request.args['job'], owner=session['user_id'])
+        if job is None:
+            flash('That generation has expired, please try again', 'warning')
+            return redirect(url_for('ai'))
 
-    return render_template('ai.html')
+    return render_template('ai.html', job=job, prompt=job.key[2] if job else None,
+                           ai_type=job.key[0] if job else None, notes=job.key[3] if job else None)
 
-def generate_ai_content(prompt, ai_type):
-    """Generate AI content using OpenRouter"""
-    try:
-        import requests
-
-        API_URL = "https://openrouter.ai/api/v1/chat/completions"
-        API_KEY = "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"  # 👈 Add your key
-
-        headers = {
-            "Authorization": f"Bearer {API_KEY}",
-            "HTTP-Referer": "http://localhost:5000",
-            "X-Title": "NarrEyes",
-            "Content-Type": "application/json"
-        }
-
-        # Best models for each type
-        models = {
-            'character': 'meta-llama/llama-4-maverick:free',
-            'scene': 'google/gemini-2.0-flash-exp:free',
-            'dialogue': 'mistralai/mistral-nemo-instruct:free',
-            'description': 'meta-llama/llama-3.1-70b-instruct:free'
-        }
-
-        # System instructions
-        instructions = {
-            'character': "You are a character development expert. Create detailed, realistic character descriptions with personality, background, and motivations.",
-            'scene': "You are a scene-setting expert. Write vivid, immersive scenes using sensory details and atmosphere.",
-            'dialogue': "You are a dialogue coach. Write natural, engaging conversations that reveal character.",
-            'description': "You are a descriptive writer. Create rich, detailed descriptions with vivid imagery."
-        }
-
-        payload = {
-            "model": models.get(ai_type, 'meta-llama/llama-4-maverick:free'),
-            "messages": [
-                {"role": "system", "content": instructions.get(ai_type, "You are a creative writing assistant.")},
-                {"role": "user", "content": prompt}
-            ],
-            "temperature": 0.8,
-            "max_tokens": 800,
-            "top_p": 0.92
-        }
-
-        response = requests.post(API_URL, headers=headers, json=payload, timeout=90)
-
-        if response.status_code == 200:
-            result = response.json()
-            return result['choices'][0]['message']['content'].strip()
-        elif response.status_code == 503:
-            return "⏳ Model is loading. Please wait 30-60 seconds and try again."
-        elif response.status_code == 402:
-            return "💳 OpenRouter credits exhausted. Please use free models."
-        elif response.status_code == 401:
-            return "❌ Invalid API Key. Check your OpenRouter key."
-        else:
-            return f"❌ Error {response.status_code}"
+@app.route('/api/ai/jobs', methods=['POST'])
+@login_required
+def api_ai_submit():
+    """Queue a generation and return its job"""
+    data = request.get_json(silent=True) or {}
+    prompt = str(data.get('prompt', '')).strip()
+    if not prompt:
+        return jsonify({'error': 'prompt is required'}), 400
+
+    notes = prompt_context(prompt) if data.get('use_context', True) else ''
+    job = get_generator().submit(prompt, str(data.get('ai_type', 'character')), owner=session['user_id'],
+                                 context=notes)
+    return jsonify(job.to_dict()), 200 if job.done.is_set() else 202
+
+@app.route('/api/ai/context')
+@login_required
+def api_ai_context():
+    """Preview the project notes that would be sent with a prompt"""
+    prompt = request.args.get('prompt', '').strip()
+    if not prompt:
+        return jsonify({'error': 'prompt is required'}), 400
+    budget = request.args.get('budget', app.config['AI_CONTEXT_TOKENS'], type=int)
+    notes = context.assemble(get_db(readonly=True), session['user_id'], prompt, budget)
+    return jsonify({'context': notes.text, 'tokens': notes.tokens, 'budget': budget, 'items': notes.counts,
+                    'cache': context.cache_stats()})
+
+@app.route('/api/ai/jobs/<job_id>')
+@login_required
+def api_ai_job(job_id):
+    """Poll a generation job"""
+    job = get_generator().get_job(job_id, owner=session['user_id'])
+    if job is None:
+        return jsonify({'error': 'job not found'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/api/ai/jobs/<job_id>/events')
+@login_required
+def api_ai_job_events(job_id):
+    """Server-sent events: text chunks as they are generated, then the result.
+
+    Disconnecting closes this generator, which cancels the upstream call
+    when nobody else is following the job.
+    """
+    job = get_generator().get_job(job_id, owner=session['user_id'])
+    if job is None:
+        return jsonify({'error': 'job not found'}), 404
+
+    owner = session['user_id']
+
+    def stream():
+        # Browsers buffer tiny first responses; a comment opens the stream
+        yield ': connected\n\n'
+        chunks = job.follow(owner)
+        try:
+            for chunk in chunks:
+                if chunk is None:
+                    yield ': waiting\n\n'
+                else:
+                    yield f'event: chunk\ndata: {json.dumps({"text": chunk})}\n\n'
+        finally:
+            chunks.close()
+        yield f'event: {job.status}\ndata: {json.dumps(job.to_dict())}\n\n'
+
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def get_generator():
+    """The process-wide AI generator (HTTP session, job queue and cache)"""
+    return generation.get_generator(app.config['AI_API_URL'], app.config['AI_API_KEY'],
+                                    app.config['AI_WORKERS'], app.config['AI_STREAM'])
+
+def prompt_context(prompt):
+    """Project notes for the signed-in author's prompt, within the configured token budget"""
+    return context.assemble(get_db(readonly=True), session['user_id'], prompt,
+                            app.config['AI_CONTEXT_TOKENS']).text
 
-    except Exception as e:
-        return f"❌ Error: {str(e)}"
+def generate_ai_content(prompt, ai_type):
+    """Generate AI content using OpenRouter, waiting for the result"""
+    notes = prompt_context(prompt) if has_request_context() and 'user_id' in session else ''
+    return get_generator().generate(prompt, ai_type, context=notes)
 
 # ==================== Helper Function ====================
 
 def create_test_user():
     """Create test user for debugging"""
-    db = get_db()
+    db = database.connect(app.config['DATABASE'])
     try:
         existing = db.execute('SELECT * FROM users WHERE username = ?', ('test',)).fetchone()
         if not existing:
-            password_hash = generate_password_hash('test123')
+            password_hash = generate_password_hash('test123', app.config['PASSWORD_HASH_METHOD'])
             db.execute('INSERT INTO users (username, email, password_hash) VALUES (?, ?, ?)',
                       ('test', 'test@narreyes.com', password_hash))
             db.commit()
@@ -640,25 +1258,17 @@ def create_test_user():
 @login_required
 def profile():
     """View user profile"""
-    db = get_db()
+    db = get_db(readonly=True)
     user = db.execute('SELECT * FROM users WHERE id = ?', (session['user_id'],)).fetchone()
 
-    # Get user statistics
-    stats = {
-        'characters': db.execute('SELECT COUNT(*) as count FROM characters WHERE user_id = ?',
-                                (session['user_id'],)).fetchone()['count'],
-        'chapters': db.execute('SELECT COUNT(*) as count FROM chapters WHERE user_id = ?',
-                              (session['user_id'],)).fetchone()['count'],
-        'words': db.execute('SELECT SUM(word_count) as total FROM chapters WHERE user_id = ?',
-                           (session['user_id'],)).fetchone()['total'] or 0,
-        'timeline': db.execute('SELECT COUNT(*) as count FROM timeline WHERE user_id = ?',
-                              (session['user_id'],)).fetchone()['count'],
-        'relationships': db.execute('SELECT COUNT(*) as count FROM relationships WHERE user_id = ?',
-                                   (session['user_id'],)).fetchone()['count']
-    }
-
-    db.close()
-    return render_template('profile.html', user=user, stats=stats)
+    # Get user statistics (kept up to date by the user_stats triggers)
+    user_stats = stats.get_stats(db, session['user_id'])
+
+    # Writing progress, read from the daily rollups
+    streak = progress.streak(db, session['user_id'], user['daily_word_goal'])
+    recent = progress.series(db, session['user_id'], 'day', 14)
+
+    return render_template('profile.html', user=user, stats=user_stats, streak=streak, recent=recent)
 
 @app.route('/edit_profile', methods=['GET', 'POST'])
 @login_required
@@ -682,14 +1292,12 @@ def edit_profile():
 
             if existing:
                 flash('Username or email already taken', 'danger')
-                db.close()
                 return redirect(url_for('edit_profile'))
 
             # Update user info
             db.execute('UPDATE users SET username = ?, email = ? WHERE id = ?',
                       (username, email, session['user_id']))
             db.commit()
-            db.close()
 
             # Update session
             session['username'] = username
@@ -703,7 +1311,6 @@ def edit_profile():
 
     db = get_db()
     user = db.execute('SELECT * FROM users WHERE id = ?', (session['user_id'],)).fetchone()
-    db.close()
 
     return render_template('edit_profile.html', user=user)
 
@@ -730,24 +1337,26 @@ def change_password():
                 return redirect(url_for('change_password'))
 
             # Verify current password
+            admit(session['username'])
             db = get_db()
             user = db.execute('SELECT * FROM users WHERE id = ?', (session['user_id'],)).fetchone()
 
-            if not check_password_hash(user['password_hash'], current_password):
+            hasher = get_hasher()
+            if not hasher.verify(user['password_hash'], current_password):
                 flash('Current password is incorrect', 'danger')
-                db.close()
                 return redirect(url_for('change_password'))
 
             # Update password
-            new_password_hash = generate_password_hash(new_password)
+            new_password_hash = hasher.hash(new_password)
             db.execute('UPDATE users SET password_hash = ? WHERE id = ?',
                       (new_password_hash, session['user_id']))
             db.commit()
-            db.close()
 
             flash('Password changed successfully!', 'success')
             return redirect(url_for('profile'))
 
+        except (passwords.RateLimited, passwords.Busy) as e:
+            return throttled(e, 'change_password.html')
         except Exception as e:
             flash(f'Error changing password: {str(e)}', 'danger')
             print(f"❌ Password Change Error: {e}")
@@ -766,22 +1375,20 @@ def delete_account():
             return redirect(url_for('profile'))
 
         # Verify password
+        admit(session['username'])
         db = get_db()
         user = db.execute('SELECT * FROM users WHERE id = ?', (session['user_id'],)).fetchone()
 
-        if not check_password_hash(user['password_hash'], password):
+        if not get_hasher().verify(user['password_hash'], password):
             flash('Incorrect password', 'danger')
-            db.close()
             return redirect(url_for('profile'))
 
-        # Delete all user data
-        db.execute('DELETE FROM relationships WHERE user_id = ?', (session['user_id'],))
-        db.execute('DELETE FROM timeline WHERE user_id = ?', (session['user_id'],))
-        db.execute('DELETE FROM chapters WHERE user_id = ?', (session['user_id'],))
-        db.execute('DELETE FROM characters WHERE user_id = ?', (session['user_id'],))
+        # Delete all user data; everything else cascades from the user row
         db.execute('DELETE FROM users WHERE id = ?', (session['user_id'],))
         db.commit()
-        db.close()
+        graph.invalidate(session['user_id'])
+        mentions.invalidate(session['user_id'])
+        get_chapter_cache().invalidate_owner(session['user_id'])
 
         # Clear session
         username = session.get('username', 'User')
@@ -790,33 +1397,408 @@ def delete_account():
         flash(f'Account deleted. Goodbye, {username}!', 'info')
         return redirect(url_for('index'))
 
+    except (passwords.RateLimited, passwords.Busy) as e:
+        return throttled(e, endpoint='profile')
     except Exception as e:
         flash(f'Error deleting account: {str(e)}', 'danger')
         print(f"❌ Account Deletion Error: {e}")
         return redirect(url_for('profile'))
 
+# ==================== Writing Progress ====================
+
+def parse_goal(value):
+    """Daily word goal from a form or JSON value; 0 turns the goal off"""
+    try:
+        goal = int(value)
+    except (TypeError, ValueError):
+        raise ValueError('Goal must be a whole number of words') from None
+    if not 0 <= goal <= 100_000:
+        raise ValueError('Goal must be between 0 and 100000 words')
+    return goal
+
+@app.route('/api/progress')
+@login_required
+def api_progress():
+    """Words added and removed per day, week or month, oldest first"""
+    grain = request.args.get('grain', 'day')
+    if grain not in progress.GRAINS:
+        return jsonify({'error': f"grain must be one of {', '.join(progress.GRAINS)}"}), 400
+    periods = request.args.get('periods', 30, type=int)
+    if not 1 <= periods <= progress.MAX_PERIODS:
+        return jsonify({'error': f'periods must be between 1 and {progress.MAX_PERIODS}'}), 400
+    return jsonify({'grain': grain, 'series': progress.series(get_db(readonly=True), session['user_id'],
+                                                             grain, periods)})
+
+@app.route('/api/progress/streak')
+@login_required
+def api_progress_streak():
+    """Current and longest streaks of days meeting the daily goal"""
+    return jsonify(progress.streak(get_db(readonly=True), session['user_id']))
+
+@app.route('/api/progress/goal', methods=['GET', 'POST'])
+@login_required
+def api_progress_goal():
+    """Get or set the daily word goal"""
+    db = get_db()
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        try:
+            goal = parse_goal(data.get('goal'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        progress.set_goal(db, session['user_id'], goal)
+        db.commit()
+    return jsonify({'goal': progress.get_goal(db, session['user_id'])})
+
+@app.route('/profile/goal', methods=['POST'])
+@login_required
+def set_word_goal():
+    """Set the daily word goal from the profile page"""
+    try:
+        goal = parse_goal(request.form.get('goal'))
+    except ValueError as e:
+        flash(str(e), 'warning')
+        return redirect(url_for('profile'))
+    db = get_db()
+    progress.set_goal(db, session['user_id'], goal)
+    db.commit()
+    flash(f'Daily goal set to {goal:,} words' if goal else 'Daily goal turned off', 'success')
+    return redirect(url_for('profile'))
+
+# ==================== Static Assets ====================
+
+_asset_manifest = None
+
+def get_asset_manifest():
+    """Built bundle directories, read once per process (restart after `flask assets-build`)"""
+    global _asset_manifest
+    if _asset_manifest is None:
+        _asset_manifest = assets.load_manifest(app.static_folder)
+    return _asset_manifest
+
+@app.context_processor
+def inject_asset_url():
+    def asset_url(bundle, path):
+        def local(directory, filename):
+            if directory is None:
+                return url_for('static', filename=filename)
+            return url_for('built_asset', filename=f'{directory}/{filename}')
+        return assets.url_for_asset(get_asset_manifest(), bundle, path, local)
+    return {'asset_url': asset_url}
+
+@app.route('/assets/<path:filename>')
+def built_asset(filename):
+    """Fingerprinted file from static/dist, precompressed when the browser accepts it"""
+    found = assets.choose(os.path.join(app.static_folder, assets.DIST), filename, request.accept_encodings)
+    if found is None:
+        return Response('not found\n', status=404, mimetype='text/plain')
+    path, encoding = found
+    response = send_file(path, mimetype=assets.mimetype(filename), max_age=assets.MAX_AGE)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+# ==================== Metrics ====================
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus metrics (only with INSTRUMENTATION on)"""
+    if not app.config['INSTRUMENTATION']:
+        return Response('instrumentation is off\n', status=404, mimetype='text/plain')
+    token = app.config['METRICS_TOKEN']
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return Response('unauthorized\n', status=401, mimetype='text/plain')
+
+    cache = get_chapter_cache().stats()
+    gauges = [(f'narreyes_render_cache_{key}', f'Rendered chapter cache {key}', (), cache[key])
+              for key in ('entries', 'bytes', 'hits', 'misses', 'evictions', 'not_modified')]
+    hasher = get_hasher().stats()
+    gauges += [(f'narreyes_password_hash_{key}', f'Password hashing pool {key}', (), hasher[key])
+               for key in ('pending', 'completed', 'rejected')]
+    gauges += [('narreyes_auth_rate_limited', 'Attempts refused by a rate limit', (('by', by),), limiter.limited)
+               for by, limiter in zip(('address', 'username'), get_auth_limiters())]
+    return Response(instrumentation.render(gauges), mimetype='text/plain; version=0.0.4')
+
+# ==================== CLI Commands ====================
+
+@app.cli.command('stats')
+@click.argument('action', type=click.Choice(['verify', 'rebuild']))
+def stats_command(action):
+    """Verify or rebuild the user_stats counters from the base tables"""
+    db = database.connect(app.config['DATABASE'])
+    try:
+        stats.create_schema(db)
+        db.commit()
+        drift = stats.verify(db)
+        for user_id, counter, stored, actual in drift:
+            click.echo(f'user {user_id}: {counter} stored={stored} actual={actual}')
+        if action == 'rebuild':
+            users = stats.rebuild(db)
+            db.commit()
+            click.echo(f'✅ Rebuilt stats for {users} users')
+        elif drift:
+            raise SystemExit(1)
+        else:
+            click.echo('✅ user_stats matches the base tables')
+    finally:
+        db.close()
+
+@app.cli.command('orphans')
+@click.argument('action', type=click.Choice(['scan', 'repair']))
+def orphans_command(action):
+    """Find or fix rows left dangling while foreign keys were off"""
+    db = database.connect(app.config['DATABASE'])
+    try:
+        if action == 'repair':
+            fixed = integrity.repair(db)
+            for table, reference, count in fixed:
+                click.echo(f'{table}: fixed {count} rows with a missing {reference}')
+            click.echo(f'✅ Repaired {sum(count for _, _, count in fixed)} orphaned rows')
+            return
+        found = integrity.scan(db)
+        for table, reference, count in found:
+            click.echo(f'{table}: {count} rows with a missing {reference}')
+        if found:
+            raise SystemExit(1)
+        click.echo('✅ No orphaned rows')
+    finally:
+        db.close()
+
+@app.cli.command('textstats')
+@click.option('--batch-size', default=500, show_default=True, help='Chapters per transaction')
+def textstats_command(batch_size):
+    """Recompute word counts and text statistics for every chapter"""
+    db = database.connect(app.config['DATABASE'])
+    try:
+        updated = textstats.backfill(db, batch_size)
+        click.echo(f'✅ Recomputed statistics for {updated} chapters')
+    finally:
+        db.close()
+
+@app.cli.command('mentions-rebuild')
+@click.option('--user', 'username', help='Only this author')
+def mentions_rebuild_command(username):
+    """Rescan chapters for character mentions"""
+    db = database.connect(app.config['DATABASE'])
+    try:
+        user_id = None
+        if username:
+            user = db.execute('SELECT id FROM users WHERE username = ?', (username,)).fetchone()
+            if user is None:
+                raise click.ClickException(f'No user named {username}')
+            user_id = user['id']
+        scanned = mentions.rebuild(db, user_id)
+        click.echo(f'✅ Scanned {scanned} chapters for character mentions')
+    finally:
+        db.close()
+
+@app.cli.command('assets-build')
+@click.option('--clean', is_flag=True, help='Delete bundles from earlier builds')
+def assets_build_command(clean):
+    """Fingerprint and precompress static files and front-end dependencies"""
+    manifest = assets.build(app.root_path, app.static_folder, click.echo)
+    if clean:
+        for name in assets.clean(app.static_folder, set(manifest.values())):
+            click.echo(f'Removed {name}')
+    click.echo(f'✅ Built {len(manifest)} of {len(assets.BUNDLES)} asset bundles into static/{assets.DIST}')
+
+@app.cli.command('search-index')
+def search_index_command():
+    """Rebuild the full-text search index from the base tables"""
+    db = database.connect(app.config['DATABASE'])
+    try:
+        search.create_schema(db)
+        search.rebuild(db)
+        db.commit()
+        click.echo('✅ Search index rebuilt')
+    finally:
+        db.close()
+
+@app.cli.command('timeline-backfill')
+@click.option('--batch-size', default=500, show_default=True)
+def timeline_backfill_command(batch_size):
+    """Recompute timeline sort keys (after changing TIMELINE_CALENDAR)"""
+    db = database.connect(app.config['DATABASE'])
+    try:
+        updated = chronology.backfill(db, get_calendar(), batch_size)
+        click.echo(f'✅ Recomputed sort keys for {updated} events')
+    finally:
+        db.close()
+
+@app.cli.command('revisions-compact')
+@click.option('--keep', default=revisions.KEEP_REVISIONS, show_default=True,
+              help='Revisions to keep per chapter')
+def revisions_compact_command(keep):
+    """Delete old chapter revisions beyond the retention limit"""
+    db = database.connect(app.config['DATABASE'])
+    try:
+        deleted = revisions.compact(db, keep)
+        db.commit()
+        db.execute('VACUUM')
+        click.echo(f'✅ Deleted {deleted} old revisions')
+    finally:
+        db.close()
+
+@app.cli.command('progress-compact')
+@click.option('--keep-days', default=progress.KEEP_DAYS, show_default=True,
+              help='Days of raw progress events to keep')
+def progress_compact_command(keep_days):
+    """Delete raw writing progress events older than the rollups need"""
+    db = database.connect(app.config['DATABASE'])
+    try:
+        deleted = progress.compact(db, keep_days)
+        db.commit()
+        click.echo(f'✅ Deleted {deleted} progress events older than {keep_days} days')
+    finally:
+        db.close()
+
+@app.cli.command('chapters-rebalance')
+@click.option('--min-gap', default=2, show_default=True,
+              help='Only rebalance authors with two neighbouring keys closer than this')
+def chapters_rebalance_command(min_gap):
+    """Space out chapter sort keys ahead of time (e.g. from a nightly cron)"""
+    db = database.connect(app.config['DATABASE'])
+    try:
+        crowded = [row[0] for row in db.execute('''
+            SELECT DISTINCT user_id FROM (
+                SELECT user_id, sort_key - LAG(sort_key) OVER (PARTITION BY user_id ORDER BY sort_key, id) AS gap
+                FROM chapters)
+            WHERE gap < ?''', (min_gap,))]
+        moved = 0
+        for user_id in crowded:
+            moved += ordering.rebalance(db, user_id)
+            db.commit()
+        click.echo(f'✅ Rebalanced {len(crowded)} authors ({moved} chapters)')
+    finally:
+        db.close()
+
+@app.cli.command('import-manuscript')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--user', 'username', required=True, help='Author to import the chapters for')
+@click.option('--pattern', default=manuscripts.HEADING_PATTERN, help='Regex for chapter heading lines')
+def import_manuscript_command(path, username, pattern):
+    """Import a .txt, .md or .docx manuscript as chapters"""
+    db = database.connect(app.config['DATABASE'])
+    try:
+        user = db.execute('SELECT id FROM users WHERE username = ?', (username,)).fetchone()
+        if user is None:
+            raise click.ClickException(f'No user named {username}')
+        with open(path, 'rb') as stream:
+            try:
+                imported = manuscripts.import_file(db, user['id'], stream, path, pattern)
+            except manuscripts.ManuscriptError as e:
+                raise click.ClickException(str(e))
+        mentions.rebuild(db, user['id'])
+        click.echo(f'✅ Imported {imported} chapters for {username}')
+    finally:
+        db.close()
+
+@app.cli.command('migrate')
+@click.option('--target', type=int, help='Stop after this migration')
+@click.option('--status', 'show_status', is_flag=True, help='List migrations and exit')
+def migrate_command(target, show_status):
+    """Create or upgrade the database schema (run once per deploy)"""
+    if show_status:
+        db = database.connect(app.config['DATABASE'])
+        try:
+            for version, description, applied_at in migrations.status(db):
+                click.echo(f"{version:>4}  {applied_at or 'pending':<19}  {description}")
+        finally:
+            db.close()
+        return
+    init_db(target)
+    click.echo(f"✅ Database schema ready: {app.config['DATABASE']}")
+
+@app.cli.command('schema-dump')
+@click.argument('path', type=click.Path(dir_okay=False), default='schema.sql')
+@click.option('--check', is_flag=True, help='Fail if the file differs instead of writing it')
+def schema_dump_command(path, check):
+    """Write the migrated schema as SQL (schema.sql by default)"""
+    db = database.connect(':memory:')
+    try:
+        migrations.migrate(db)
+        schema = (f'-- Generated by `flask schema-dump` at schema version {migrations.LATEST}.\n'
+                  f'-- Reference only: create and upgrade databases with `flask migrate`.\n\n'
+                  + migrations.dump_schema(db))
+    finally:
+        db.close()
+    if check:
+        with open(path, encoding='utf-8') as f:
+            if f.read() != schema:
+                raise click.ClickException(f'{path} is out of date; run `flask schema-dump`')
+        click.echo(f'✅ {path} matches schema version {migrations.LATEST}')
+        return
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(schema)
+    click.echo(f'✅ Schema version {migrations.LATEST} written to {path}')
+
+@app.cli.command('explain-queries')
+@click.argument('paths', nargs=-1, type=click.Path(exists=True, dir_okay=False))
+@click.option('--baseline', type=click.Path(dir_okay=False), help='Plans from an earlier run to compare with')
+@click.option('--update-baseline', is_flag=True, help='Save the current plans as the baseline')
+def explain_queries_command(paths, baseline, update_baseline):
+    """Report full-table scans in the query plans of the SQL in app.py"""
+    db = database.connect(app.config['DATABASE'])
+    try:
+        plans = queryplan.check(db, paths or [os.path.join(app.root_path, 'app.py')])
+    finally:
+        db.close()
+
+    scans = [p for p in plans if p.scans]
+    for plan in plans:
+        if plan.error:
+            click.echo(f'?  {plan.statement.function} (line {plan.statement.line}): {plan.error}')
+    for plan in scans:
+        click.echo(f"⚠️  {plan.statement.function} (line {plan.statement.line}) scans {', '.join(plan.scans)}")
+        for step in plan.steps:
+            click.echo(f'      {step}')
+    if baseline and update_baseline:
+        queryplan.save_baseline(plans, baseline)
+        click.echo(f'✅ Saved {len(plans)} plans to {baseline}')
+    elif baseline:
+        for plan, old in queryplan.compare(plans, baseline):
+            click.echo(f'🔀 {plan.statement.function} (line {plan.statement.line}) changed plan:')
+            click.echo(f"      was: {' | '.join(old)}")
+            click.echo(f"      now: {' | '.join(plan.steps)}")
+    click.echo(f'{len(plans)} statements planned, {len(scans)} with full-table scans')
+    if scans:
+        raise SystemExit(1)
+
+@app.cli.command('create-test-user')
+def create_test_user_command():
+    """Add the test/test123 account for local development"""
+    create_test_user()
+
 # ==================== Run Application ====================
 
 if __name__ == '__main__':
-    # Initialize database
-    init_db()
+    # Development server; production runs `gunicorn -c gunicorn.conf.py wsgi:app`
+    create_app()
+    debug = os.environ.get('FLASK_DEBUG', '1') != '0'
+    port = int(os.environ.get('PORT', 5000))
 
-    # Create test user
-    create_test_user()
+    # Schema and test user are separate steps in production (`flask --app wsgi migrate`)
+    init_db()
+    if debug:
+        create_test_user()
 
     # Print startup message
     print("\n" + "="*60)
     print("  🚀 NarrEyes Writing Assistant")
     print("="*60)
-    print("  📍 Server: http://localhost:5000")
-    print("  📍 Local:  http://127.0.0.1:5000")
-    print("="*60)
-    print("  👤 Test Login:")
-    print("     Username: test")
-    print("     Password: test123")
+    print(f"  📍 Server: http://localhost:{port}")
+    print(f"  📍 Local:  http://127.0.0.1:{port}")
     print("="*60)
+    if debug:
+        print("  👤 Test Login:")
+        print("     Username: test")
+        print("     Password: test123")
+        print("="*60)
     print("  Press CTRL+C to stop")
     print("="*60 + "\n")
 
     # Run app
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    app.run(host=os.environ.get('HOST', '0.0.0.0'), port=port, debug=debug)
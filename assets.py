@@ -0,0 +1,185 @@
+"""Fingerprinted, precompressed front-end assets.
+
+Each bundle in BUNDLES is a set of files under one directory: the app's own
+CSS and JS in static/, or a front-end dependency installed by `npm install`
+under node_modules/. `flask assets-build` copies every bundle it finds to
+static/dist/<bundle>-<content hash>/, keeping the bundle's own layout so
+relative references (icon fonts, TinyMCE plugins and skins) still resolve,
+and writes .gz and .br variants of the files that compress. A manifest maps
+each bundle to its current directory.
+
+Because a directory name changes whenever any of its files does, /assets/
+responses are cached by browsers for a year as immutable, and choose()
+picks the precompressed variant the browser accepts, so nothing is
+compressed per request. A bundle that has not been built is linked from
+its CDN (dependencies) or from /static (the app's files), so a checkout
+works before the first build.
+"""
+
+import fnmatch
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+from collections import namedtuple
+
+try:
+    import brotli
+except ImportError:  # optional: only gzip variants are built and served without it
+    brotli = None
+
+DIST = 'dist'
+MANIFEST = 'manifest.json'
+MAX_AGE = 365 * 24 * 3600
+COMPRESSIBLE = ('.css', '.js', '.json', '.svg', '.html', '.txt', '.map', '.ttf', '.eot', '.ico')
+EXCLUDE = ('*.md', '*.d.ts', 'package.json', 'bower.json', 'composer.json')
+MIN_SAVING = 0.1  # keep a compressed variant only if it is at least 10% smaller
+HASH_LENGTH = 10
+
+Bundle = namedtuple('Bundle', ['root', 'files', 'cdn'])
+
+# name -> (directory relative to the project, files or glob patterns in it,
+#          where to link it from until it is built)
+BUNDLES = {
+    'app': Bundle('static', ('style.css', 'main.js'), None),
+    'bootstrap': Bundle('node_modules/bootstrap/dist',
+                        ('css/bootstrap.min.css', 'js/bootstrap.bundle.min.js'),
+                        'https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist'),
+    'bootstrap-icons': Bundle('node_modules/bootstrap-icons/font',
+                              ('bootstrap-icons.min.css', 'fonts/*'),
+                              'https://cdn.jsdelivr.net/npm/bootstrap-icons@1.11.0/font'),
+    'tinymce': Bundle('node_modules/tinymce', ('*',), 'https://cdn.jsdelivr.net/npm/tinymce@6'),
+}
+
+# Content-Encoding -> file suffix, in order of preference
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def bundle_files(root, patterns):
+    """Relative paths of the files under `root` that match `patterns`, sorted"""
+    found = []
+    for directory, _, names in os.walk(root):
+        for name in names:
+            path = os.path.relpath(os.path.join(directory, name), root).replace(os.sep, '/')
+            if any(fnmatch.fnmatch(path, pattern) for pattern in patterns) and \
+                    not any(fnmatch.fnmatch(name, pattern) for pattern in EXCLUDE):
+                found.append(path)
+    return sorted(found)
+
+
+def fingerprint(root, files):
+    """Short hash of the names and contents of a bundle's files"""
+    digest = hashlib.sha256()
+    for path in files:
+        digest.update(path.encode('utf-8') + b'\0')
+        with open(os.path.join(root, path), 'rb') as f:
+            digest.update(f.read())
+        digest.update(b'\0')
+    return digest.hexdigest()[:HASH_LENGTH]
+
+
+def _compressed(data):
+    """{suffix: compressed bytes} for the variants worth keeping"""
+    variants = {'.gz': gzip.compress(data, 9, mtime=0)}
+    if brotli is not None:
+        variants['.br'] = brotli.compress(data, quality=11)
+    return {suffix: body for suffix, body in variants.items() if len(body) <= len(data) * (1 - MIN_SAVING)}
+
+
+def build(project_root, static_folder, log=None):
+    """Copy and compress every bundle whose files exist; returns the manifest"""
+    dist = os.path.join(static_folder, DIST)
+    manifest = {}
+    for name, bundle in BUNDLES.items():
+        root = os.path.join(project_root, bundle.root)
+        files = bundle_files(root, bundle.files) if os.path.isdir(root) else []
+        if not files:
+            if log:
+                log(f'Skipping {name}: nothing at {bundle.root}')
+            continue
+        directory = f'{name}-{fingerprint(root, files)}'
+        target = os.path.join(dist, directory)
+        raw = packed = 0
+        if not os.path.isdir(target):
+            staging = target + '.tmp'
+            shutil.rmtree(staging, ignore_errors=True)
+            for path in files:
+                destination = os.path.join(staging, path)
+                os.makedirs(os.path.dirname(destination), exist_ok=True)
+                shutil.copyfile(os.path.join(root, path), destination)
+                if path.endswith(COMPRESSIBLE):
+                    with open(destination, 'rb') as f:
+                        data = f.read()
+                    for suffix, body in _compressed(data).items():
+                        with open(destination + suffix, 'wb') as f:
+                            f.write(body)
+            # Appears complete or not at all, for workers already serving it
+            os.replace(staging, target)
+        for path in files:
+            size = os.path.getsize(os.path.join(target, path))
+            raw += size
+            packed += min([size] + [os.path.getsize(os.path.join(target, path + suffix))
+                                    for _, suffix in ENCODINGS
+                                    if os.path.exists(os.path.join(target, path + suffix))])
+        manifest[name] = directory
+        if log:
+            log(f'{name}: {len(files)} files, {raw / 1024:.0f} KB -> {packed / 1024:.0f} KB compressed ({directory})')
+
+    os.makedirs(dist, exist_ok=True)
+    with open(os.path.join(dist, MANIFEST + '.tmp'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(os.path.join(dist, MANIFEST + '.tmp'), os.path.join(dist, MANIFEST))
+    return manifest
+
+
+def clean(static_folder, keep):
+    """Remove built bundle directories other than those in `keep`; returns their names"""
+    dist = os.path.join(static_folder, DIST)
+    stale = [name for name in sorted(os.listdir(dist)) if os.path.isdir(os.path.join(dist, name)) and name not in keep]
+    for name in stale:
+        shutil.rmtree(os.path.join(dist, name))
+    return stale
+
+
+def load_manifest(static_folder):
+    try:
+        with open(os.path.join(static_folder, DIST, MANIFEST), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def url_for_asset(manifest, name, path, static_url):
+    """URL of `path` in bundle `name`: built, else its CDN, else under /static.
+
+    `static_url(directory, path)` makes a local URL for a path under
+    /assets (directory is the built bundle) or /static (directory None).
+    """
+    built = manifest.get(name)
+    if built:
+        return static_url(built, path)
+    bundle = BUNDLES[name]
+    if bundle.cdn:
+        return f'{bundle.cdn}/{path}'
+    return static_url(None, path)
+
+
+def choose(dist, filename, accept_encodings):
+    """(file path, Content-Encoding or None) to answer a request for `filename`.
+
+    Returns None when there is no such built file. `accept_encodings` is
+    the request's parsed Accept-Encoding header.
+    """
+    path = os.path.realpath(os.path.join(dist, filename))
+    if not path.startswith(os.path.realpath(dist) + os.sep) or not os.path.isfile(path):
+        return None
+    for encoding, suffix in ENCODINGS:
+        if accept_encodings[encoding] and os.path.isfile(path + suffix):
+            return path + suffix, encoding
+    return path, None
+
+
+def mimetype(filename):
+    return mimetypes.guess_type(filename)[0] or 'application/octet-stream'
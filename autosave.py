@@ -0,0 +1,119 @@
+"""Server-side chapter autosave from small text deltas.
+
+The editor sends only what changed since the version it last saved: a list
+of splices {"at": offset, "delete": count, "insert": text}, applied in
+order. Offsets count UTF-16 code units, as JavaScript string indices do.
+
+Every content write bumps chapters.version. A save names the version it was
+based on and is refused with a Conflict when the chapter has moved on
+(another tab or device saved in between), so nothing is silently lost.
+Rapid saves are coalesced into one history revision per COALESCE_SECONDS.
+"""
+
+import re
+
+import mentions
+import revisions
+import textstats
+
+COALESCE_SECONDS = 120
+MAX_INSERT_CHARS = 2000000
+
+_ASTRAL_RE = re.compile('[\U00010000-\U0010FFFF]')
+
+
+class DeltaError(ValueError):
+    """The delta is malformed or does not fit the base content"""
+
+
+class Conflict(Exception):
+    """The chapter changed since the version the delta was made against"""
+
+    def __init__(self, version, content):
+        super().__init__(f'chapter is at version {version}')
+        self.version = version
+        self.content = content
+
+
+def apply_changes(content, changes):
+    """Apply a list of splices to `content` and return the new text"""
+    if not isinstance(changes, list):
+        raise DeltaError('changes must be a list')
+
+    # Outside the BMP a JavaScript index and a Python index disagree, so
+    # work on UTF-16 code units; plain text (the usual case) skips that
+    wide = bool(_ASTRAL_RE.search(content))
+    text = content.encode('utf-16-le') if wide else content
+    unit = 2 if wide else 1
+
+    for change in changes:
+        try:
+            at, delete = int(change.get('at', 0)), int(change.get('delete', 0))
+            insert = str(change.get('insert', ''))
+        except (AttributeError, TypeError, ValueError):
+            raise DeltaError('each change needs an integer "at" and "delete"')
+        if at < 0 or delete < 0 or at + delete > len(text) // unit:
+            raise DeltaError(f'change at {at} (+{delete}) is outside the text')
+        if len(insert) > MAX_INSERT_CHARS:
+            raise DeltaError('change is too large')
+        if wide:
+            insert = insert.encode('utf-16-le')
+        elif _ASTRAL_RE.search(insert):
+            text, unit, wide = text.encode('utf-16-le'), 2, True
+            insert = insert.encode('utf-16-le')
+        text = text[:at * unit] + insert + text[(at + delete) * unit:]
+
+    return text.decode('utf-16-le') if wide else text
+
+
+def save(db, chapter_id, user_id, base_version, changes=None, content=None):
+    """Apply an autosave to a chapter and commit it.
+
+    Either `changes` (a delta against `base_version`) or the full `content`
+    is given. Returns a dict with the new version, the history revision the
+    save landed in and the chapter's statistics, or None when the chapter
+    does not exist. Raises Conflict or DeltaError.
+    """
+    chapter = db.execute('''SELECT content, version, word_count, char_count FROM chapters
+                            WHERE id = ? AND user_id = ?''',
+                         (chapter_id, user_id)).fetchone()
+    if chapter is None:
+        return None
+    previous = chapter['content'] or ''
+    if chapter['version'] != base_version:
+        raise Conflict(chapter['version'], previous)
+
+    if content is None:
+        content = apply_changes(previous, changes or [])
+    if content == previous:
+        return {
+            'version': chapter['version'],
+            'revision': None,
+            'word_count': chapter['word_count'],
+            'char_count': chapter['char_count'],
+        }
+
+    text_stats = textstats.analyze(content)
+    # The version check is repeated in the UPDATE so a save that raced past
+    # the SELECT above cannot overwrite the other one
+    cursor = db.execute('''UPDATE chapters
+                           SET content=?, word_count=?, char_count=?, paragraph_count=?,
+                               sentence_count=?, reading_minutes=?, excerpt=?,
+                               version=version + 1, updated_at=CURRENT_TIMESTAMP
+                           WHERE id=? AND user_id=? AND version=?''',
+                        (content, *text_stats, chapter_id, user_id, base_version))
+    if cursor.rowcount == 0:
+        db.rollback()
+        current = db.execute('SELECT content, version FROM chapters WHERE id = ?', (chapter_id,)).fetchone()
+        raise Conflict(current['version'], current['content'] or '')
+    revision = revisions.record(db, chapter_id, user_id, content, text_stats.word_count,
+                                previous=previous, coalesce=COALESCE_SECONDS)
+    mentions.index_chapter(db, user_id, chapter_id, content)
+    db.commit()
+
+    return {
+        'version': base_version + 1,
+        'revision': revision,
+        'word_count': text_stats.word_count,
+        'char_count': text_stats.char_count,
+    }
@@ -0,0 +1,132 @@
+"""A local stand-in for the OpenRouter chat completions endpoint.
+
+Answers every POST with a canned completion of `--tokens` words: after
+`--delay` seconds plus `--token-delay` per word, or, for `stream: true`
+requests, as SSE chunks sent `--token-delay` apart after the initial
+`--delay`. It counts requests, TCP connections, tokens sent and streams
+the client hung up on, so the generation pipeline (connection reuse,
+cancellation) can be exercised without an API key or network. Point the
+app at it with
+
+    python benchmarks/ai_stub.py --port 8765 &
+    OPENROUTER_API_URL=http://127.0.0.1:8765/api/v1/chat/completions python app.py
+
+A prompt containing "status:<code>" gets that HTTP status back instead.
+"""
+
+import argparse
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        prompt = payload.get('messages', [{}])[-1].get('content', '')
+        with self.server.lock:
+            self.server.requests += 1
+        time.sleep(self.server.delay)
+
+        status = re.search(r'status:(\d{3})', prompt)
+        if status:
+            self._reply(int(status.group(1)), {'error': {'message': 'stubbed error'}})
+            return
+
+        words = f"Generated by stub for: {prompt}".split()
+        words += [f'word{n}' for n in range(max(0, self.server.tokens - len(words)))]
+        if payload.get('stream'):
+            self._stream(payload.get('model'), words)
+            return
+        time.sleep(self.server.token_delay * len(words))
+        self._count_tokens(len(words))
+        self._reply(200, {
+            'model': payload.get('model'),
+            'choices': [{'message': {'role': 'assistant', 'content': ' '.join(words)}}],
+        })
+
+    def _stream(self, model, words):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        try:
+            self._chunk(': OPENROUTER PROCESSING\n\n')
+            for n, word in enumerate(words):
+                event = {'model': model, 'choices': [{'delta': {'content': (' ' if n else '') + word}}]}
+                self._chunk(f'data: {json.dumps(event)}\n\n')
+                self._count_tokens(1)
+                time.sleep(self.server.token_delay)
+            self._chunk('data: [DONE]\n\n')
+            self.wfile.write(b'0\r\n\r\n')
+        except (BrokenPipeError, ConnectionResetError):
+            with self.server.lock:
+                self.server.cancelled += 1
+            self.close_connection = True
+
+    def _chunk(self, text):
+        data = text.encode()
+        self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+        self.wfile.flush()
+
+    def _count_tokens(self, count):
+        with self.server.lock:
+            self.server.tokens_sent += count
+
+    def _reply(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start(port=0, delay=0.2, token_delay=0.0, tokens=0):
+    """Start the stub in a background thread; returns the server (see .url)"""
+    server = ThreadingHTTPServer(('127.0.0.1', port), StubHandler)
+    server.daemon_threads = True
+    server.delay = delay
+    server.token_delay = token_delay
+    server.tokens = tokens
+    server.requests = 0
+    server.connections = 0
+    server.tokens_sent = 0
+    server.cancelled = 0
+    server.lock = threading.Lock()
+    server.url = f'http://127.0.0.1:{server.server_address[1]}/api/v1/chat/completions'
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--delay', type=float, default=1.0)
+    parser.add_argument('--token-delay', type=float, default=0.05)
+    parser.add_argument('--tokens', type=int, default=200)
+    args = parser.parse_args()
+
+    server = start(args.port, args.delay, args.token_delay, args.tokens)
+    print(f'stub listening on {server.url}')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
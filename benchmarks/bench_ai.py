@@ -0,0 +1,89 @@
+"""AI generation pipeline against the local stub server.
+
+Sends a burst of /ai requests from several clients, half of them repeating
+the same prompts, and reports how long the web requests took, how many
+upstream calls and TCP connections were made, and the cache hit rate. The
+"before" row times the old blocking requests.post() per prompt for the same
+burst.
+
+    python benchmarks/bench_ai.py [--clients 8] [--prompts 40] [--delay 0.5]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import ai_stub  # noqa: E402
+import app as narreyes  # noqa: E402
+import database  # noqa: E402
+import generation  # noqa: E402
+
+
+def blocking_generate(url, prompt, ai_type):
+    """The old generate_ai_content(): one fresh connection per prompt"""
+    response = requests.post(url, json=generation.build_payload(prompt, ai_type), timeout=90)
+    return response.json()['choices'][0]['message']['content']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--prompts', type=int, default=40)
+    parser.add_argument('--delay', type=float, default=0.5)
+    args = parser.parse_args()
+
+    prompts = [f'A lighthouse keeper, take {n % (args.prompts // 2)}' for n in range(args.prompts)]
+
+    stub = ai_stub.start(delay=args.delay)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.clients) as pool:
+        list(pool.map(lambda p: blocking_generate(stub.url, p, 'character'), prompts))
+    before = (time.perf_counter() - start, stub.requests, stub.connections)
+
+    stub.requests = stub.connections = 0
+    narreyes.app.config['AI_API_URL'] = stub.url
+    with tempfile.TemporaryDirectory() as tmp:
+        narreyes.app.config['DATABASE'] = os.path.join(tmp, 'bench.db')
+        narreyes.init_db()
+
+        def client(prompt):
+            web = narreyes.app.test_client()
+            with web.session_transaction() as sess:
+                sess['user_id'] = 1
+            started = time.perf_counter()
+            job = web.post('/api/ai/jobs', json={'prompt': prompt, 'ai_type': 'character'}).get_json()
+            submitted = time.perf_counter() - started
+            while job['status'] in ('queued', 'running'):
+                time.sleep(0.02)
+                job = web.get(f"/api/ai/jobs/{job['id']}").get_json()
+            assert job['status'] == 'done', job
+            return submitted
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(args.clients) as pool:
+            submit_times = list(pool.map(client, prompts))
+        elapsed = time.perf_counter() - start
+        generator = narreyes.get_generator()
+        database.close_pools()
+
+    print(f'{args.prompts} prompts ({args.prompts // 2} distinct), {args.clients} clients, '
+          f'{args.delay:.1f}s upstream latency')
+    print(f"{'mode':<10}{'wall s':>8}{'upstream':>10}{'tcp conns':>11}{'submit ms':>11}")
+    print(f"{'before':<10}{before[0]:>8.2f}{before[1]:>10}{before[2]:>11}{'(blocks)':>11}")
+    print(f"{'after':<10}{elapsed:>8.2f}{stub.requests:>10}{stub.connections:>11}"
+          f"{statistics.median(submit_times) * 1000:>11.1f}")
+    print(f'cache: {generator.cache.hits} hits, {generator.cache.misses} misses')
+    generation.close_generators()
+    stub.shutdown()
+
+
+if __name__ == '__main__':
+    main()
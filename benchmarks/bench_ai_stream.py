@@ -0,0 +1,94 @@
+"""Time-to-first-token of streamed AI generation, and cancellation.
+
+Runs the /ai SSE route against the local stub server twice: with the
+generator in blocking mode (the whole completion arrives in one piece) and
+in streaming mode, and reports the time from submitting a prompt to the
+first text reaching the client and to the full result. Then opens a
+stream, disconnects after a few chunks and checks that the stub stops
+sending tokens.
+
+    python benchmarks/bench_ai_stream.py [--tokens 200] [--token-delay 0.02] [--delay 0.3]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import ai_stub  # noqa: E402
+import app as narreyes  # noqa: E402
+import database  # noqa: E402
+import generation  # noqa: E402
+
+
+def client():
+    web = narreyes.app.test_client()
+    with web.session_transaction() as sess:
+        sess['user_id'] = 1
+    return web
+
+
+def run_once(web, prompt, disconnect_after=None):
+    """Submit a prompt and read its SSE stream; returns (ttft, total, chunks)"""
+    start = time.perf_counter()
+    job = web.post('/api/ai/jobs', json={'prompt': prompt}).get_json()
+    response = web.get(f"/api/ai/jobs/{job['id']}/events", buffered=False)
+    first = None
+    chunks = 0
+    try:
+        for data in response.response:
+            data = data.decode() if isinstance(data, bytes) else data
+            if data.startswith('event: chunk') or data.startswith('event: done'):
+                first = first or time.perf_counter() - start
+            if data.startswith('event: chunk'):
+                chunks += 1
+                if disconnect_after and chunks >= disconnect_after:
+                    break
+    finally:
+        response.close()
+    return first, time.perf_counter() - start, chunks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tokens', type=int, default=200)
+    parser.add_argument('--token-delay', type=float, default=0.02)
+    parser.add_argument('--delay', type=float, default=0.3)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    stub = ai_stub.start(delay=args.delay, token_delay=args.token_delay, tokens=args.tokens)
+    narreyes.app.config['AI_API_URL'] = stub.url
+    with tempfile.TemporaryDirectory() as tmp:
+        narreyes.app.config['DATABASE'] = os.path.join(tmp, 'bench.db')
+        narreyes.init_db()
+        web = client()
+
+        print(f'{args.tokens} tokens, {args.delay:.2f}s before the first, {args.token_delay * 1000:.0f} ms apart')
+        print(f"{'mode':<10}{'ttft ms':>10}{'total ms':>10}")
+        for stream in (False, True):
+            narreyes.app.config['AI_STREAM'] = stream
+            runs = [run_once(web, f'prompt {stream} {n}') for n in range(args.repeat)]
+            print(f"{'stream' if stream else 'blocking':<10}"
+                  f"{statistics.median(r[0] for r in runs) * 1000:>10.0f}"
+                  f"{statistics.median(r[1] for r in runs) * 1000:>10.0f}")
+
+        before = stub.tokens_sent
+        _, _, read = run_once(web, 'walk away', disconnect_after=5)
+        time.sleep(args.token_delay * 20)
+        sent = stub.tokens_sent - before
+        time.sleep(args.token_delay * 20)
+        print(f'disconnect after {read} chunks: stub sent {sent} of {args.tokens} tokens, '
+              f'{stub.tokens_sent - before - sent} more after that, {stub.cancelled} stream(s) cut')
+        database.close_pools()
+
+    generation.close_generators()
+    stub.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+"""Page weight and first-load time before and after the asset pipeline.
+
+Renders a few pages for one author with a `--words`-word chapter through
+the Flask test client, twice:
+
+- before: COMPRESSION off and no built assets, so pages link the app's
+  files under /static and the dependencies on the CDN, as layout.html
+  used to,
+- after: `assets.build()` into a copy of static/, COMPRESSION on, and the
+  browser accepting br and gzip.
+
+For each page it sums the bytes transferred for the HTML and every
+stylesheet, script and font it loads. CDN files are measured from
+node_modules at their gzip size, as the CDN would send them; without
+`npm install` only the HTML and the app's own files are counted. The
+first-load time is a model, not a measurement: round trips (`--rtt`,
+connection and TLS setup for each origin, then one per request wave) plus
+transfer time at `--mbps`. Repeat visits count the requests a browser
+makes to revalidate files it already has, i.e. those without a max-age.
+
+    python benchmarks/bench_assets.py [--words 20000] [--mbps 10] [--rtt 60]
+"""
+
+import argparse
+import gzip
+import os
+import re
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import app as narreyes  # noqa: E402
+import assets  # noqa: E402
+import compression  # noqa: E402
+import database  # noqa: E402
+import textstats  # noqa: E402
+from bench_textstats import manuscript  # noqa: E402
+
+PAGES = ('/dashboard', '/chapter/1', '/edit_chapter/1')
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+_LINK_RE = re.compile(r'<(?:link|script)[^>]+(?:href|src)="([^"]+)"')
+_FONT_RE = re.compile(r'url\("?([^")]+\.woff2)')
+
+
+def seed(path, words):
+    narreyes.app.config['DATABASE'] = path
+    narreyes.init_db()
+    db = database.connect(path)
+    db.execute("INSERT INTO users (id, username, email, password_hash) VALUES (1, 'bench', 'bench@x', 'x')")
+    content = manuscript(words)
+    db.execute('''INSERT INTO chapters
+                  (id, user_id, title, chapter_number, content, word_count, char_count,
+                   paragraph_count, sentence_count, reading_minutes, excerpt)
+                  VALUES (1, 1, 'Bench', 1, ?, ?, ?, ?, ?, ?, ?)''', (content, *textstats.analyze(content)))
+    db.commit()
+    db.close()
+
+
+def cdn_size(url):
+    """gzip size of a CDN file, from its copy in node_modules, or None"""
+    for bundle in assets.BUNDLES.values():
+        if bundle.cdn and url.startswith(bundle.cdn + '/'):
+            path = os.path.join(ROOT, bundle.root, url[len(bundle.cdn) + 1:])
+            if os.path.isfile(path):
+                with open(path, 'rb') as f:
+                    data = f.read()
+                return len(gzip.compress(data, 9)) if path.endswith(assets.COMPRESSIBLE) else len(data)
+    return None
+
+
+def decoded(response):
+    encoding = response.headers.get('Content-Encoding')
+    if encoding == 'br':
+        return compression.brotli.decompress(response.data)
+    if encoding == 'gzip':
+        return gzip.decompress(response.data)
+    return response.data
+
+
+def load(client, page, headers):
+    """(page bytes, [(url, bytes, cached for good)], origins, files not measured)"""
+    response = client.get(page, headers=headers)
+    assert response.status_code == 200, (page, response.status_code)
+    queue = [url for url in _LINK_RE.findall(decoded(response).decode()) if url.endswith(('.css', '.js'))]
+    files, origins, missing = [], {'self'}, 0
+    while queue:
+        url = queue.pop(0)
+        if url.startswith('http'):
+            origins.add(url.split('/')[2])
+            size = cdn_size(url)
+            if size is None:
+                missing += 1
+            else:
+                files.append((url, size, True))
+            continue
+        asset = client.get(url, headers=headers)
+        assert asset.status_code == 200, (url, asset.status_code)
+        files.append((url, len(asset.data), 'immutable' in asset.headers.get('Cache-Control', '')))
+        if url.endswith('.css'):
+            base = url.rsplit('/', 1)[0]
+            queue += [f"{base}/{font.removeprefix('./')}" for font in _FONT_RE.findall(decoded(asset).decode())]
+    return len(response.data), files, origins, missing
+
+
+def first_load(page_bytes, files, origins, mbps, rtt):
+    """Modelled ms: DNS+TCP+TLS for each origin, the page, then one wave for its files"""
+    round_trips = 3 + 1 + (3 * (len(origins) - 1)) + (1 if files else 0)
+    total = page_bytes + sum(size for _, size, _ in files)
+    return round_trips * rtt + total * 8 / (mbps * 1e6) * 1000
+
+
+def report(label, client, headers, args):
+    print(f'\n{label}')
+    print(f"{'page':<18}{'html B':>9}{'files B':>10}{'total KB':>10}{'origins':>9}{'first load ms':>15}"
+          f"{'revalidations':>15}")
+    for page in PAGES:
+        page_bytes, files, origins, missing = load(client, page, headers)
+        revalidate = sum(1 for _, _, kept in files if not kept)
+        total = page_bytes + sum(size for _, size, _ in files)
+        note = f'  ({missing} CDN files not measured)' if missing else ''
+        print(f'{page:<18}{page_bytes:>9}{sum(size for _, size, _ in files):>10}{total / 1024:>10.1f}'
+              f'{len(origins):>9}{first_load(page_bytes, files, origins, args.mbps, args.rtt):>15.0f}'
+              f'{revalidate:>15}{note}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--words', type=int, default=20000)
+    parser.add_argument('--mbps', type=float, default=10.0, help='Bandwidth for the load-time model')
+    parser.add_argument('--rtt', type=float, default=60.0, help='Round-trip time in ms')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        seed(os.path.join(tmp, 'assets.db'), args.words)
+        client = narreyes.app.test_client()
+        with client.session_transaction() as session:
+            session['user_id'] = 1
+            session['username'] = 'bench'
+
+        narreyes.app.config['COMPRESSION'] = False
+        narreyes._asset_manifest = {}
+        report('before: uncompressed pages, /static and CDN links', client, {'Accept-Encoding': 'gzip, br'}, args)
+
+        static = os.path.join(tmp, 'static')
+        shutil.copytree(narreyes.app.static_folder, static, ignore=shutil.ignore_patterns(assets.DIST))
+        manifest = assets.build(ROOT, static, print)
+        narreyes.app.static_folder = static
+        narreyes._asset_manifest = manifest
+        narreyes.app.config['COMPRESSION'] = True
+        report('after: compressed pages, fingerprinted precompressed assets', client,
+               {'Accept-Encoding': 'gzip, br'}, args)
+        print(f'\nmodel: {args.mbps:g} Mbit/s, {args.rtt:g} ms RTT')
+
+
+if __name__ == '__main__':
+    main()
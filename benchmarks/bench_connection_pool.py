@@ -0,0 +1,100 @@
+"""Requests per second on the list routes before and after connection pooling.
+
+"before" swaps get_db() back to the original one-connection-per-call version
+on a database in rollback-journal mode; "after" uses the pooled WAL
+connections. Each mode runs sequentially and with several client threads.
+
+    python benchmarks/bench_connection_pool.py [--requests 2000] [--threads 4]
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import app as narreyes  # noqa: E402
+import database  # noqa: E402
+
+ROUTES = ['/chapters', '/characters', '/dashboard']
+
+
+def legacy_get_db(readonly=False):
+    """get_db() as it was before the pool: a fresh connection every call"""
+    conn = sqlite3.connect(narreyes.app.config['DATABASE'])
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def seed(path, chapters=50, characters=50):
+    narreyes.app.config['DATABASE'] = path
+    narreyes.init_db()
+    db = database.connect(path)
+    db.execute("INSERT INTO users (username, email, password_hash) VALUES ('bench', 'bench@x', 'x')")
+    user_id = db.execute("SELECT id FROM users WHERE username = 'bench'").fetchone()[0]
+    body = '<p>' + ' '.join(['word'] * 2000) + '</p>'
+    db.executemany('INSERT INTO chapters (user_id, title, chapter_number, content, word_count) VALUES (?, ?, ?, ?, ?)',
+                   [(user_id, f'Chapter {n}', n, body, 2000) for n in range(1, chapters + 1)])
+    db.executemany('INSERT INTO characters (user_id, name, role, description) VALUES (?, ?, ?, ?)',
+                   [(user_id, f'Character {n}', 'supporting', 'A character') for n in range(characters)])
+    db.commit()
+    db.close()
+    return user_id
+
+
+def run(route, user_id, total, threads):
+    def worker(count):
+        client = narreyes.app.test_client()
+        with client.session_transaction() as sess:
+            sess['user_id'] = user_id
+            sess['username'] = 'bench'
+        for _ in range(count):
+            response = client.get(route)
+            assert response.status_code == 200, response.status_code
+
+    per_thread = total // threads
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(worker, [per_thread] * threads))
+    return per_thread * threads / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=4)
+    args = parser.parse_args()
+
+    pooled_get_db = narreyes.get_db
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        user_id = seed(path)
+        results = {}
+        for mode in ('before', 'after'):
+            if mode == 'before':
+                conn = sqlite3.connect(path)
+                conn.execute('PRAGMA journal_mode = DELETE')
+                conn.close()
+                narreyes.get_db = legacy_get_db
+            else:
+                narreyes.get_db = pooled_get_db
+            for route in ROUTES:
+                for threads in (1, args.threads):
+                    results[(mode, route, threads)] = run(route, user_id, args.requests, threads)
+            database.close_pools()
+        narreyes.get_db = pooled_get_db
+
+    print(f"{'route':<14}{'threads':>8}{'before rps':>14}{'after rps':>14}{'speedup':>10}")
+    for route in ROUTES:
+        for threads in (1, args.threads):
+            before = results[('before', route, threads)]
+            after = results[('after', route, threads)]
+            print(f'{route:<14}{threads:>8}{before:>14.0f}{after:>14.0f}{after / before:>9.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""AI prompt context assembly on a large project.
+
+Generates one author with a 1M-word manuscript (200 chapters), 500
+characters, 2,000 timeline events and 3,000 relationships, then times
+context.assemble() for a set of prompts: cold (cache cleared, every
+stage runs) and warm (served from the cache), with the time spent in each
+retrieval stage and how many estimated tokens were sent compared with
+pasting the whole project.
+
+    python benchmarks/bench_context.py [--chapters 200] [--words 5000] [--characters 500]
+                                       [--budget 1500] [--repeat 10]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import context  # noqa: E402
+import database  # noqa: E402
+import textstats  # noqa: E402
+from corpus import generate  # noqa: E402
+
+PROMPTS = (
+    'Write a scene where {a} remembers the old house by the river at night',
+    'Dialogue between {a} and {b} about the letter',
+    'Describe the morning {a} walked toward the window again',
+    'What does {b} never say to {a}?',
+    'A quiet scene on the road before the war',
+    'Create a new rival for {a}',
+)
+
+
+def milliseconds(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return (time.perf_counter() - start) * 1000, result
+
+
+def project_tokens(db, user_id):
+    """Estimated tokens of everything an author could paste in by hand"""
+    total = 0
+    for row in db.execute('SELECT content FROM chapters WHERE user_id = ?', (user_id,)):
+        total += context.estimate_tokens(textstats.strip_html(row[0] or ''))
+    for table, columns in (('characters', 'name, description, personality, background'),
+                           ('timeline', 'event_title, event_date, description'),
+                           ('relationships', 'relationship_type, description')):
+        for row in db.execute(f'SELECT {columns} FROM {table} WHERE user_id = ?', (user_id,)):
+            total += context.estimate_tokens(' '.join(str(value) for value in row if value))
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--chapters', type=int, default=200)
+    parser.add_argument('--words', type=int, default=5000)
+    parser.add_argument('--characters', type=int, default=500)
+    parser.add_argument('--events', type=int, default=2000)
+    parser.add_argument('--relationships', type=int, default=3000)
+    parser.add_argument('--budget', type=int, default=context.BUDGET)
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'context.db')
+        start = time.perf_counter()
+        [user_id] = generate(path, users=1, chapters=args.chapters, words=args.words,
+                             characters=args.characters, events=args.events,
+                             relationships=args.relationships)
+        print(f'generated project in {time.perf_counter() - start:.1f}s')
+
+        db = database.connect(path, readonly=True)
+        try:
+            names = [row[0] for row in db.execute(
+                'SELECT name FROM characters WHERE user_id = ? ORDER BY id LIMIT 2', (user_id,))]
+            prompts = [prompt.format(a=names[0], b=names[-1]) for prompt in PROMPTS]
+            whole = project_tokens(db, user_id)
+            print(f'whole project: ~{whole:,} tokens; budget {args.budget}')
+
+            print(f"{'prompt':<44}{'cold ms':>9}{'p95':>8}{'warm ms':>9}{'tokens':>8}  items")
+            stages = {'characters': [], 'events': [], 'passages': []}
+            for prompt in prompts:
+                cold = []
+                for _ in range(args.repeat):
+                    context._cache.clear()
+                    cold.append(milliseconds(context.assemble, db, user_id, prompt, args.budget)[0])
+                warm = [milliseconds(context.assemble, db, user_id, prompt, args.budget)[0]
+                        for _ in range(args.repeat)]
+                notes = context.assemble(db, user_id, prompt, args.budget)
+                print(f'{prompt[:43]:<44}{statistics.median(cold):>9.1f}'
+                      f'{sorted(cold)[int(len(cold) * 0.95) - 1 if len(cold) > 1 else 0]:>8.1f}'
+                      f'{statistics.median(warm):>9.3f}{notes.tokens:>8}  '
+                      + ' '.join(f'{kind[:4]}={n}' for kind, n in notes.counts.items()))
+
+                terms = context.keywords(prompt)
+                stages['characters'].append(milliseconds(context._characters, db, user_id, prompt, terms)[0])
+                stages['events'].append(milliseconds(context._events, db, user_id, terms)[0])
+                stages['passages'].append(milliseconds(context._passages, db, user_id, terms)[0])
+
+            print('median per stage: ' + ', '.join(f'{stage} {statistics.median(times):.1f} ms'
+                                                   for stage, times in stages.items()))
+            print(f'\nexample context ({notes.tokens} tokens):\n{notes.text[:1200]}')
+        finally:
+            db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""Export throughput and peak RSS on a 1M-word manuscript.
+
+Seeds `--chapters` chapters totalling `--words` words of editor HTML, then
+exports them in every format twice, each run in a fresh process so
+ru_maxrss is that run's own peak:
+
+- naive: fetchall() every chapter, build the whole document, then send it,
+- streaming: exports.export(), consumed chunk by chunk as a Response would.
+
+    python benchmarks/bench_export.py [--words 1000000] [--chapters 200]
+"""
+
+import argparse
+import io
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import app as narreyes  # noqa: E402
+import database  # noqa: E402
+import exports  # noqa: E402
+import textstats  # noqa: E402
+from bench_textstats import manuscript  # noqa: E402
+
+FORMATS = ['md', 'txt', 'json', 'epub', 'backup']
+
+
+def seed(path, words, chapters):
+    narreyes.app.config['DATABASE'] = path
+    narreyes.init_db()
+    db = database.connect(path)
+    db.execute("INSERT INTO users (id, username, email, password_hash) VALUES (1, 'bench', 'bench@x', 'x')")
+
+    def rows():
+        for number in range(1, chapters + 1):
+            content = manuscript(words // chapters, seed=number)
+            yield (f'Chapter {number}', number, content, *textstats.analyze(content))
+
+    db.executemany('''INSERT INTO chapters
+                      (user_id, title, chapter_number, content, word_count, char_count,
+                       paragraph_count, sentence_count, reading_minutes, excerpt)
+                      VALUES (1, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', rows())
+    db.commit()
+    db.close()
+
+
+def naive(db, export_format):
+    """Everything in memory first, the way a non-streaming view would do it"""
+    chapters = db.execute('SELECT * FROM chapters WHERE user_id = 1 ORDER BY chapter_number').fetchall()
+    if export_format == 'epub':
+        buffer = io.BytesIO()
+        for chunk in exports.epub(db, 1, 'Bench'):
+            buffer.write(chunk)
+        return buffer.getvalue()
+    if export_format in ('json', 'backup'):
+        return exports.json.dumps({'chapters': [dict(row) for row in chapters]}).encode()
+    render = exports.to_markdown if export_format == 'md' else exports.to_text
+    return ''.join(render(row['content']) for row in chapters).encode()
+
+
+def child(path, method, export_format):
+    db = database.connect(path, readonly=True)
+    start = time.perf_counter()
+    if method == 'naive':
+        size = len(naive(db, export_format))
+    else:
+        size = sum(len(chunk) for chunk in exports.export(db, 1, export_format, 'Bench'))
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KB on Linux
+    print(f'{elapsed} {size} {peak}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--words', type=int, default=1000000)
+    parser.add_argument('--chapters', type=int, default=200)
+    parser.add_argument('--child', nargs=3, metavar=('DB', 'METHOD', 'FORMAT'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(*args.child)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'export.db')
+        seed(path, args.words, args.chapters)
+        print(f'{args.words} words in {args.chapters} chapters')
+        print(f"{'format':<8}{'method':<11}{'time s':>8}{'MB out':>9}{'MB/s':>8}{'peak RSS MB':>13}")
+        for export_format in FORMATS:
+            for method in ('naive', 'streaming'):
+                if method == 'naive' and export_format == 'backup':
+                    continue  # same shape as json
+                output = subprocess.run([sys.executable, __file__, '--child', path, method, export_format],
+                                        capture_output=True, text=True, check=True).stdout.split()
+                elapsed, size, peak = float(output[-3]), int(output[-2]), float(output[-1])
+                print(f'{export_format:<8}{method:<11}{elapsed:>8.2f}{size / 1e6:>9.1f}'
+                      f'{size / 1e6 / elapsed:>8.1f}{peak:>13.1f}')
+
+
+if __name__ == '__main__':
+    main()
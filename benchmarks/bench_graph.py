@@ -0,0 +1,101 @@
+"""Relationship graph queries on a 10k-character, 100k-relationship cast.
+
+Times building the CSR graph from SQLite and each query the graph API
+answers, and compares the two-hop neighbourhood with the recursive SQL
+query an app without the graph would need.
+
+    python benchmarks/bench_graph.py [--characters 10000] [--relationships 100000]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import app as narreyes  # noqa: E402
+import database  # noqa: E402
+import graph  # noqa: E402
+
+TYPES = ['friend', 'rival', 'sibling', 'mentor', 'lover', 'enemy']
+
+
+def seed(path, characters, relationships, rng):
+    narreyes.app.config['DATABASE'] = path
+    narreyes.init_db()
+    db = database.connect(path)
+    db.execute("INSERT INTO users (id, username, email, password_hash) VALUES (1, 'bench', 'bench@x', 'x')")
+    db.executemany('INSERT INTO characters (id, user_id, name, role) VALUES (?, 1, ?, ?)',
+                   [(n, f'Character {n}', 'supporting') for n in range(1, characters + 1)])
+    # A few popular characters and many minor ones, like a real cast
+    weights = [1 / n for n in range(1, characters + 1)]
+    ends = rng.choices(range(1, characters + 1), weights=weights, k=relationships)
+    db.executemany('''INSERT INTO relationships (user_id, character1_id, character2_id, relationship_type)
+                      VALUES (1, ?, ?, ?)''',
+                   [(a, rng.randint(1, characters), rng.choice(TYPES)) for a in ends])
+    db.commit()
+    return db
+
+
+def timed(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--characters', type=int, default=10000)
+    parser.add_argument('--relationships', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    rng = random.Random(10)
+    with tempfile.TemporaryDirectory() as tmp:
+        db = seed(os.path.join(tmp, 'graph.db'), args.characters, args.relationships, rng)
+        build_ms, cast = timed(lambda: graph.build(db, 1), 3)
+        cached_ms, _ = timed(lambda: graph.get_graph(db, 1), args.repeat)
+        storage = sum(a.itemsize * len(a) for a in (cast.ids, cast.indptr, cast.indices))
+
+        source = cast.ids[len(cast) // 2]
+        far = cast.ids[-1]
+        two_hop_sql = '''WITH RECURSIVE reach(id, depth) AS (
+                             SELECT ?, 0
+                             UNION
+                             SELECT CASE WHEN r.character1_id = reach.id THEN r.character2_id
+                                         ELSE r.character1_id END, reach.depth + 1
+                             FROM reach JOIN relationships r
+                               ON r.user_id = 1 AND (r.character1_id = reach.id OR r.character2_id = reach.id)
+                             WHERE reach.depth < 2)
+                         SELECT DISTINCT id FROM reach'''
+
+        rows = [
+            ('build from SQLite', build_ms, f'{len(cast)} nodes, {cast.edge_count} edges, {storage / 1e6:.1f} MB CSR'),
+            ('cached get_graph', cached_ms, ''),
+        ]
+        ms, result = timed(lambda: cast.within(source, 2), args.repeat)
+        rows.append(('2-hop neighbourhood', ms, f'{len(result)} characters'))
+        ms, result = timed(lambda: db.execute(two_hop_sql, (source,)).fetchall(), max(1, args.repeat // 5))
+        rows.append(('2-hop recursive SQL', ms, f'{len(result) - 1} characters'))
+        ms, result = timed(lambda: cast.shortest_path(source, far), args.repeat)
+        rows.append(('shortest path', ms, f'{len(result) - 1 if result else None} hops'))
+        ms, result = timed(lambda: cast.degree_centrality(20), args.repeat)
+        rows.append(('degree centrality', ms, f'top degree {result[0]["degree"]}'))
+        ms, result = timed(cast.components, args.repeat)
+        rows.append(('components', ms, f'{len(result)} components, largest {len(result[0])}'))
+
+        print(f"{'operation':<22}{'ms':>10}  notes")
+        for label, ms, note in rows:
+            print(f'{label:<22}{ms:>10.2f}  {note}')
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
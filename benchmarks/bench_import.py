@@ -0,0 +1,121 @@
+"""Importing a 1M-word manuscript as chapters.
+
+Writes a synthetic `--words`-word manuscript (.txt with "Chapter N" lines,
+or .md with # headings) and imports it twice into fresh databases:
+
+- naive: read the whole file, split it with a regex, then INSERT and
+  commit each chapter the way the add-chapter form does,
+- manuscripts.import_file(): stream paragraphs, one executemany() in one
+  transaction.
+
+Each is timed on its own, then run again under tracemalloc for peak memory.
+
+    python benchmarks/bench_import.py [--words 1000000] [--chapters 200] [--format txt]
+"""
+
+import argparse
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import app as narreyes  # noqa: E402
+import database  # noqa: E402
+import manuscripts  # noqa: E402
+import textstats  # noqa: E402
+from bench_textstats import VOCABULARY  # noqa: E402
+
+
+def write_manuscript(path, words, chapters, file_format, seed=12):
+    """Plain prose paragraphs under a heading per chapter, written line by line"""
+    rng = random.Random(seed)
+    per_chapter = words // chapters
+    with open(path, 'w', encoding='utf-8') as f:
+        for number in range(1, chapters + 1):
+            f.write(f'# Chapter {number}\n\n' if file_format == 'md' else f'Chapter {number}\n\n')
+            written = 0
+            while written < per_chapter:
+                sentences = []
+                for _ in range(rng.randint(2, 6)):
+                    sentence = [rng.choice(VOCABULARY) for _ in range(rng.randint(6, 20))]
+                    sentence[0] = sentence[0].capitalize()
+                    sentences.append(' '.join(sentence) + rng.choice('.!?'))
+                    written += len(sentence)
+                f.write(' '.join(sentences) + '\n\n')
+                if rng.random() < 0.02:
+                    f.write('* * *\n\n')
+
+
+def naive_import(db, user_id, path):
+    """Whole file in memory, one INSERT and commit per chapter"""
+    with open(path, encoding='utf-8') as f:
+        text = f.read()
+    parts = re.split(r'^(?:# )?(Chapter \d+)\s*$', text, flags=re.MULTILINE)
+    for number, index in enumerate(range(1, len(parts), 2), 1):
+        content = ''.join(f'<p>{p.strip()}</p>' for p in parts[index + 1].split('\n\n') if p.strip())
+        db.execute('''INSERT INTO chapters
+                      (user_id, title, chapter_number, content, word_count, char_count,
+                       paragraph_count, sentence_count, reading_minutes, excerpt, status)
+                      VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                   (user_id, parts[index], number, content, *textstats.analyze(content), 'draft'))
+        db.commit()
+    return len(parts) // 2
+
+
+def stream_import(db, user_id, path):
+    with open(path, 'rb') as stream:
+        return manuscripts.import_file(db, user_id, stream, path)
+
+
+def fresh_db(tmp, name):
+    path = os.path.join(tmp, name)
+    narreyes.app.config['DATABASE'] = path
+    narreyes.init_db()
+    db = database.connect(path)
+    db.execute("INSERT INTO users (id, username, email, password_hash) VALUES (1, 'bench', 'bench@x', 'x')")
+    db.commit()
+    return db
+
+
+def run(tmp, label, func, path):
+    db = fresh_db(tmp, f'{label}.db')
+    start = time.perf_counter()
+    chapters = func(db, 1, path)
+    elapsed = time.perf_counter() - start
+    words = db.execute('SELECT SUM(word_count) FROM chapters').fetchone()[0]
+    db.close()
+
+    db = fresh_db(tmp, f'{label}-mem.db')
+    tracemalloc.start()
+    func(db, 1, path)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    db.close()
+    return elapsed, peak, chapters, words
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--words', type=int, default=1000000)
+    parser.add_argument('--chapters', type=int, default=200)
+    parser.add_argument('--format', choices=['txt', 'md'], default='txt')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, f'manuscript.{args.format}')
+        write_manuscript(path, args.words, args.chapters, args.format)
+        print(f'manuscript: {os.path.getsize(path) / 1e6:.1f} MB, {args.chapters} chapters')
+        print(f"{'method':<28}{'time s':>9}{'peak MB':>10}{'chapters':>10}{'words':>10}")
+        for label, func in [('per-chapter commit', naive_import),
+                            ('manuscripts.import_file()', stream_import)]:
+            elapsed, peak, chapters, words = run(tmp, label.split()[0], func, path)
+            print(f'{label:<28}{elapsed:>9.2f}{peak / 1e6:>10.1f}{chapters:>10}{words:>10}')
+
+
+if __name__ == '__main__':
+    main()
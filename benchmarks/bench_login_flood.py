@@ -0,0 +1,202 @@
+"""Latency of other routes during a login flood.
+
+Serves the app from a subprocess with a fixed number of request threads
+(`--threads`, like one gunicorn gthread worker), logs a probe client in
+and requests /dashboard every `--interval` ms: first alone, then while
+`--flood` clients post wrong passwords to /login as fast as they can.
+This is repeated for three configurations:
+
+- inline: hashing in the request threads with no limits (the old views),
+- pool: the hashing process pool with its queue limit, no rate limits,
+- pool + limits: the defaults, token buckets per address and username.
+
+For each it prints the probe's p50/p95/max latency before and during the
+flood, how many probes failed, and what the flood's requests got.
+
+    python benchmarks/bench_login_flood.py [--threads 4] [--flood 16] [--seconds 10]
+"""
+
+import argparse
+import logging
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..'))
+
+import requests  # noqa: E402
+
+import corpus  # noqa: E402
+
+SCENARIOS = (
+    ('inline', {'PASSWORD_WORKERS': '0', 'PASSWORD_MAX_PENDING': '1000',
+                'AUTH_IP_PER_MINUTE': '0', 'AUTH_USER_PER_MINUTE': '0'}),
+    ('pool', {'AUTH_IP_PER_MINUTE': '0', 'AUTH_USER_PER_MINUTE': '0'}),
+    ('pool + limits', {}),
+)
+
+
+def serve(port, threads):
+    """Server process: the app behind `threads` request threads"""
+    from werkzeug.serving import BaseWSGIServer
+
+    import app as narreyes
+    import passwords
+
+    class PooledServer(BaseWSGIServer):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.pool = ThreadPoolExecutor(threads)
+
+        def process_request(self, request, client_address):
+            self.pool.submit(self._handle, request, client_address)
+
+        def _handle(self, request, client_address):
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    def stop(signum, frame):
+        raise SystemExit(0)
+
+    signal.signal(signal.SIGTERM, stop)
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    app = narreyes.create_app(require_secret=True)
+    try:
+        PooledServer('127.0.0.1', port, app).serve_forever()
+    finally:
+        passwords.close_hashers()
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start(path, threads, settings):
+    port = free_port()
+    env = dict(os.environ, DATABASE=path, SECRET_KEY=os.urandom(16).hex(), **settings)
+    process = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--serve', str(port), str(threads)],
+                               env=env, stdout=subprocess.DEVNULL)
+    base = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            requests.get(base + '/login', timeout=5)
+            break
+        except requests.RequestException:
+            time.sleep(0.1)
+    return base, process
+
+
+def log_in(base, username):
+    client = requests.Session()
+    response = client.post(base + '/login', data={'username': username, 'password': corpus.PASSWORD},
+                           allow_redirects=False)
+    assert response.status_code == 302, response.status_code
+    return client
+
+
+def probe(client, base, seconds, interval):
+    """(latencies ms, failures) of GET /dashboard every `interval` ms"""
+    latencies, failures = [], 0
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        start = time.perf_counter()
+        try:
+            response = client.get(base + '/dashboard', timeout=30, allow_redirects=False)
+            if response.status_code != 200:
+                failures += 1
+        except requests.RequestException:
+            failures += 1
+        latencies.append((time.perf_counter() - start) * 1000)
+        time.sleep(max(0.0, interval / 1000 - (time.perf_counter() - start)))
+    return latencies, failures
+
+
+def flood(base, username, clients, stop):
+    statuses = Counter()
+    lock = threading.Lock()
+
+    def attack(n):
+        session = requests.Session()
+        while not stop.is_set():
+            try:
+                status = session.post(base + '/login', data={'username': username, 'password': f'wrong{n}'},
+                                      timeout=30, allow_redirects=False).status_code
+            except requests.RequestException:
+                status = 'error'
+            with lock:
+                statuses[status] += 1
+
+    threads = [threading.Thread(target=attack, args=(n,), daemon=True) for n in range(clients)]
+    for thread in threads:
+        thread.start()
+    return threads, statuses
+
+
+def summary(latencies):
+    ordered = sorted(latencies)
+    return (statistics.median(ordered), ordered[int(len(ordered) * 0.95) - 1 if len(ordered) > 1 else 0],
+            ordered[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=4, help='Request threads in the server')
+    parser.add_argument('--flood', type=int, default=16, help='Concurrent login clients')
+    parser.add_argument('--seconds', type=float, default=10.0)
+    parser.add_argument('--interval', type=float, default=100.0, help='ms between probe requests')
+    parser.add_argument('--serve', nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(int(args.serve[0]), int(args.serve[1]))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'flood.db')
+        [user_id] = corpus.generate(path, users=1, chapters=10, words=500, characters=10, events=10,
+                                    relationships=10)
+        username = f'bench{user_id}'
+        print(f'{args.threads} request threads, {args.flood} flooding clients, {os.cpu_count()} CPUs')
+        print(f"{'configuration':<15}{'quiet p50/p95/max ms':>24}{'flood p50/p95/max ms':>24}"
+              f"{'failed':>8}  flood responses (logins/s)")
+        for label, settings in SCENARIOS:
+            base, process = start(path, args.threads, settings)
+            try:
+                client = log_in(base, username)
+                quiet, _ = probe(client, base, min(3.0, args.seconds), args.interval)
+                stop = threading.Event()
+                threads, statuses = flood(base, username, args.flood, stop)
+                start_time = time.perf_counter()
+                loud, failures = probe(client, base, args.seconds, args.interval)
+                stop.set()
+                elapsed = time.perf_counter() - start_time
+                for thread in threads:
+                    thread.join(35)
+            finally:
+                process.terminate()
+                process.wait()
+            quiet_stats = '/'.join(f'{value:.0f}' for value in summary(quiet))
+            loud_stats = '/'.join(f'{value:.0f}' for value in summary(loud))
+            responses = ', '.join(f'{status}: {count}' for status, count in sorted(statuses.items(), key=str))
+            print(f'{label:<15}{quiet_stats:>24}{loud_stats:>24}{failures:>8}  {responses} '
+                  f'({sum(statuses.values()) / elapsed:.0f}/s)')
+
+
+if __name__ == '__main__':
+    main()
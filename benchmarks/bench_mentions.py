@@ -0,0 +1,151 @@
+"""Character mention scanning: 500 characters across a 1M-word manuscript.
+
+Compares the word-level automaton in mentions.py with searching the text
+once per name (what a straightforward implementation would do) and with
+one big regex alternation, checks that the automaton and the alternation
+find the same mentions, then times a full `mentions.rebuild()` of the
+same manuscript split into chapters in a temporary database.
+
+    python benchmarks/bench_mentions.py [--characters 500] [--words 1000000] [--chapters 200]
+"""
+
+import argparse
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import app as narreyes  # noqa: E402
+import database  # noqa: E402
+import mentions  # noqa: E402
+from bench_textstats import VOCABULARY  # noqa: E402
+
+SYLLABLES = 'an bel cor da el fin gar hal is jor ka lin mar nor os per quin ros sil tor ul vor wen yar zel'.split()
+
+
+def cast(count, rng):
+    """(id, name, aliases) with two-word names; the first name is an alias"""
+    seen = set()
+    characters = []
+    while len(characters) < count:
+        first = ''.join(rng.choice(SYLLABLES) for _ in range(2)).capitalize()
+        last = ''.join(rng.choice(SYLLABLES) for _ in range(3)).capitalize()
+        if (first, last) in seen:
+            continue
+        seen.add((first, last))
+        characters.append((len(characters) + 1, f'{first} {last}', first))
+    return characters
+
+
+def text(words, characters, rng, every=40):
+    """Plain prose with a character name or alias about every `every` words"""
+    names = [name for _, name, _ in characters] + [alias for _, _, alias in characters]
+    parts = []
+    for n in range(words):
+        if n % every == 0:
+            parts.append(rng.choice(names))
+        else:
+            parts.append(rng.choice(VOCABULARY))
+        if n % 15 == 14:
+            parts[-1] += '.'
+    return ' '.join(parts)
+
+
+def pairs(characters):
+    for character_id, name, aliases in characters:
+        yield character_id, name
+        for alias in mentions.split_aliases(aliases):
+            yield character_id, alias
+
+
+def per_name(characters, content):
+    """One case-insensitive whole-word search of the text per name"""
+    found = {}
+    for character_id, name in pairs(characters):
+        for match in re.finditer(r'\b' + re.escape(name) + r'\b', content, re.IGNORECASE):
+            count, first = found.get(character_id, (0, match.start()))
+            found[character_id] = (count + 1, min(first, match.start()))
+    return found
+
+
+def alternation(characters, content):
+    """One regex of every name, longest first, so it also matches leftmost-longest"""
+    owners = {}
+    for character_id, name in pairs(characters):
+        owners.setdefault(name.casefold(), []).append(character_id)
+    pattern = re.compile(r'\b(?:' + '|'.join(re.escape(name) for name in sorted(owners, key=len, reverse=True))
+                         + r')\b', re.IGNORECASE)
+    found = {}
+    for match in pattern.finditer(content):
+        for character_id in owners[match.group().casefold()]:
+            count, first = found.get(character_id, (0, match.start()))
+            found[character_id] = (count + 1, min(first, match.start()))
+    return found
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def seed(path, characters, content, chapters):
+    narreyes.app.config['DATABASE'] = path
+    narreyes.init_db()
+    db = database.connect(path)
+    db.execute("INSERT INTO users (id, username, email, password_hash) VALUES (1, 'bench', 'bench@x', 'x')")
+    db.executemany('INSERT INTO characters (id, user_id, name, aliases) VALUES (?, 1, ?, ?)', characters)
+    words = content.split(' ')
+    size = -(-len(words) // chapters)
+    db.executemany('INSERT INTO chapters (user_id, title, chapter_number, content) VALUES (1, ?, ?, ?)',
+                   [(f'Chapter {n + 1}', n + 1, '<p>' + ' '.join(words[n * size:(n + 1) * size]) + '</p>')
+                    for n in range(chapters)])
+    db.commit()
+    return db
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--characters', type=int, default=500)
+    parser.add_argument('--words', type=int, default=1000000)
+    parser.add_argument('--chapters', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    characters = cast(args.characters, rng)
+    content = text(args.words, characters, rng)
+    print(f'{args.characters} characters ({args.characters * 2} names), '
+          f'{args.words} words ({len(content) / 1e6:.1f} MB)')
+
+    build_time, matcher = timed(mentions.Matcher, list(pairs(characters)))
+    automaton_time, automaton = timed(matcher.scan, content)
+    alternation_time, expected = timed(alternation, characters, content)
+    naive_time, naive = timed(per_name, characters, content)
+
+    print(f"{'method':<26}{'time s':>10}{'characters':>12}{'mentions':>10}")
+    for label, seconds, found in (('search per name', naive_time, naive),
+                                  ('regex alternation', alternation_time, expected),
+                                  ('automaton', automaton_time, automaton)):
+        print(f'{label:<26}{seconds:>10.3f}{len(found):>12}{sum(n for n, _ in found.values()):>10}')
+    print(f'automaton: {len(matcher)} states, built in {build_time * 1000:.1f} ms')
+    # Per-name search also counts "Anna" inside every "Anna Karenina"
+    print('automaton matches alternation:', automaton == expected)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = seed(os.path.join(tmp, 'bench.db'), characters, content, args.chapters)
+        try:
+            rebuild_time, scanned = timed(mentions.rebuild, db, 1)
+            rows = db.execute('SELECT COUNT(*) FROM chapter_mentions').fetchone()[0]
+        finally:
+            db.close()
+    print(f'rebuild: {scanned} chapters, {rows} rows in {rebuild_time:.2f} s '
+          f'({rebuild_time / scanned * 1000:.1f} ms per chapter, HTML stripping included)')
+
+
+if __name__ == '__main__':
+    main()
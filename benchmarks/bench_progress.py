@@ -0,0 +1,141 @@
+"""Writing progress queries over years of saves: rollups against raw events.
+
+Records `--years` years of saves for `--users` authors, `--saves` a day
+each with random word-count changes, through progress.record() so every
+event goes through the rollup trigger, and reports the insert rate. Then
+times, for one author, the chart (30 days, 12 weeks, 12 months) and the
+streak:
+
+- rollups: progress.series() and progress.streak(), reading progress_rollups,
+- events: the same answers from GROUP BY over progress_events, as the
+  endpoints would have to compute them without the rollups,
+
+checks that both agree, and times compaction of events older than
+progress.KEEP_DAYS and the queries again afterwards.
+
+    python benchmarks/bench_progress.py [--users 20] [--years 3] [--saves 30]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import database  # noqa: E402
+import migrations  # noqa: E402
+import progress  # noqa: E402
+
+CHARTS = (('day', 30), ('week', 12), ('month', 12))
+
+
+def seed(db, users, days, saves, until):
+    rng = random.Random(25)
+    db.executemany('INSERT INTO users (id, username, email, password_hash) VALUES (?, ?, ?, ?)',
+                   [(n, f'bench{n}', f'bench{n}@x', 'x') for n in range(1, users + 1)])
+    count = 0
+    start = time.perf_counter()
+    for offset in range(days, -1, -1):
+        day = until - timedelta(days=offset)
+        for user_id in range(1, users + 1):
+            if rng.random() < 0.2:  # a day off
+                continue
+            for _ in range(rng.randint(1, saves * 2)):
+                progress.record(db, user_id, rng.randint(-40, 120), day, rng.randint(1, 40))
+                count += 1
+        db.commit()
+    return count, time.perf_counter() - start
+
+
+def series_from_events(db, user_id, grain, periods, until):
+    """progress.series() computed from the raw events"""
+    keys = [row['period'] for row in progress.series(db, user_id, grain, periods, until)]
+    period = progress._PERIOD_SQL[grain].format(day='day')
+    rows = {row[0]: row for row in db.execute(
+        f'''SELECT {period}, SUM(max(delta, 0)), SUM(max(-delta, 0)), COUNT(*) FROM progress_events
+            WHERE user_id = ? GROUP BY 1''', (user_id,))}
+    return [{'period': key, 'added': rows[key][1] if key in rows else 0,
+             'removed': rows[key][2] if key in rows else 0,
+             'net': rows[key][1] - rows[key][2] if key in rows else 0,
+             'saves': rows[key][3] if key in rows else 0} for key in keys]
+
+
+def streak_from_events(db, user_id, goal, until):
+    """Current and longest streak computed from the raw events"""
+    days = [row[0] for row in db.execute(
+        '''SELECT day FROM progress_events WHERE user_id = ? AND day <= ?
+           GROUP BY day HAVING SUM(max(delta, 0)) >= ? ORDER BY day''',
+        (user_id, until.isoformat(), max(goal, 1)))]
+    longest = run = 0
+    previous = None
+    for day in days:
+        day = date.fromisoformat(day)
+        run = run + 1 if previous is not None and day - previous == timedelta(days=1) else 1
+        longest = max(longest, run)
+        previous = day
+    current = run if previous is not None and until - previous <= timedelta(days=1) else 0
+    return current, longest
+
+
+def timed(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    return (time.perf_counter() - start) / repeat * 1000, result
+
+
+def report(db, until, goal, repeat, check=True):
+    print(f"{'query':<16}{'rollups ms':>12}{'events ms':>12}{'speedup':>9}")
+    for grain, periods in CHARTS:
+        fast, rolled = timed(lambda: progress.series(db, 1, grain, periods, until), repeat)
+        slow, scanned = timed(lambda: series_from_events(db, 1, grain, periods, until), repeat)
+        if check:
+            assert rolled == scanned, (grain, rolled, scanned)
+        print(f'{grain + " x" + str(periods):<16}{fast:>12.2f}{slow:>12.2f}{slow / fast:>8.0f}x')
+    fast, rolled = timed(lambda: progress.streak(db, 1, goal, until), repeat)
+    slow, scanned = timed(lambda: streak_from_events(db, 1, goal, until), repeat)
+    if check:
+        assert (rolled['current'], rolled['longest']) == scanned, (rolled, scanned)
+    print(f"{'streak':<16}{fast:>12.2f}{slow:>12.2f}{slow / fast:>8.0f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--years', type=float, default=3.0)
+    parser.add_argument('--saves', type=int, default=30, help='Average saves per author per day')
+    parser.add_argument('--goal', type=int, default=1500, help='Daily word goal for the streak')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    until = progress.today()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'progress.db')
+        db = database.connect(path)
+        migrations.migrate(db)
+        count, elapsed = seed(db, args.users, int(args.years * 365), args.saves, until)
+        rollups = db.execute('SELECT COUNT(*) FROM progress_rollups').fetchone()[0]
+        print(f'{count:,} events for {args.users} authors over {args.years:g} years: '
+              f'{count / elapsed:,.0f} saves/s with the rollup trigger, {rollups:,} rollup rows')
+        db.execute('ANALYZE')
+
+        print('\nall events kept')
+        report(db, until, args.goal, args.repeat)
+
+        start = time.perf_counter()
+        deleted = progress.compact(db, progress.KEEP_DAYS, until)
+        db.commit()
+        print(f'\ncompacted {deleted:,} events older than {progress.KEEP_DAYS} days '
+              f'in {(time.perf_counter() - start) * 1000:.0f} ms')
+        # The events no longer hold the older periods; only the timings compare
+        report(db, until, args.goal, args.repeat, check=False)
+        db.close()
+        print(f'\ndatabase size {os.path.getsize(path) / 1e6:.1f} MB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""Chapter page latency with and without the rendered-fragment cache.
+
+Views one `--words`-word chapter `--requests` times through the Flask test
+client in three modes:
+
+- uncached: a zero-byte cache, so every view queries and renders the card,
+- cached: the card comes from the FragmentCache, only the layout renders,
+- conditional: the browser sends If-None-Match and gets a 304.
+
+    python benchmarks/bench_render_cache.py [--words 20000] [--requests 500]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import app as narreyes  # noqa: E402
+import database  # noqa: E402
+import pagecache  # noqa: E402
+import textstats  # noqa: E402
+from bench_textstats import manuscript  # noqa: E402
+
+
+def seed(path, words):
+    narreyes.app.config['DATABASE'] = path
+    narreyes.init_db()
+    db = database.connect(path)
+    db.execute("INSERT INTO users (id, username, email, password_hash) VALUES (1, 'bench', 'bench@x', 'x')")
+    content = manuscript(words)
+    db.execute('''INSERT INTO chapters
+                  (id, user_id, title, chapter_number, content, word_count, char_count,
+                   paragraph_count, sentence_count, reading_minutes, excerpt)
+                  VALUES (1, 1, 'Bench', 1, ?, ?, ?, ?, ?, ?, ?)''', (content, *textstats.analyze(content)))
+    db.commit()
+    db.close()
+
+
+def run(client, requests, headers=None, status=200):
+    samples = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        response = client.get('/chapter/1', headers=headers)
+        samples.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == status, response.status_code
+    return statistics.median(samples), sum(samples) / 1000, len(response.data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--words', type=int, default=20000)
+    parser.add_argument('--requests', type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        seed(os.path.join(tmp, 'cache.db'), args.words)
+        client = narreyes.app.test_client()
+        with client.session_transaction() as session:
+            session['user_id'] = 1
+            session['username'] = 'bench'
+
+        narreyes._chapter_cache = pagecache.FragmentCache(0)
+        uncached = run(client, args.requests)
+        narreyes._chapter_cache = pagecache.FragmentCache()
+        etag = client.get('/chapter/1').headers['ETag']
+        cached = run(client, args.requests)
+        conditional = run(client, args.requests, {'If-None-Match': etag}, status=304)
+
+        print(f'{args.words}-word chapter, {args.requests} views each')
+        print(f"{'mode':<14}{'median ms':>11}{'total s':>10}{'bytes':>10}")
+        for label, (median, total, size) in [('uncached', uncached), ('cached', cached),
+                                             ('conditional', conditional)]:
+            print(f'{label:<14}{median:>11.2f}{total:>10.2f}{size:>10}')
+        print(narreyes._chapter_cache.stats())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""Storage and rebuild cost of chapter revision history.
+
+Saves `--revisions` edits of a `--words`-word chapter (each edit rewrites a
+few sentences, appends a paragraph every tenth save) and compares the bytes
+stored by revisions.record() with keeping a full copy of every save, then
+times rebuilding the newest revision and the worst case inside a snapshot
+interval.
+
+    python benchmarks/bench_revisions.py [--words 20000] [--revisions 500]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import database  # noqa: E402
+import revisions  # noqa: E402
+from bench_textstats import manuscript  # noqa: E402
+
+
+def edit(content, rng):
+    """Rewrite a few sentences of the chapter"""
+    sentences = content.split('. ')
+    for _ in range(rng.randint(1, 4)):
+        index = rng.randrange(len(sentences))
+        words = sentences[index].split(' ')
+        words[rng.randrange(len(words))] = rng.choice(['suddenly', 'slowly', 'almost', 'never'])
+        sentences[index] = ' '.join(words)
+    return '. '.join(sentences)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--words', type=int, default=20000)
+    parser.add_argument('--revisions', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    rng = random.Random(6)
+    content = manuscript(args.words)
+    with tempfile.TemporaryDirectory() as tmp:
+        db = database.connect(os.path.join(tmp, 'revisions.db'))
+        revisions.create_schema(db)
+
+        full_bytes = 0
+        record_ms = []
+        previous = None
+        for number in range(args.revisions):
+            if number % 10 == 9:
+                content += '\n' + manuscript(100, seed=number)
+            else:
+                content = edit(content, rng)
+            start = time.perf_counter()
+            revisions.record(db, 1, 1, content, previous=previous)
+            record_ms.append((time.perf_counter() - start) * 1000)
+            previous = content
+            full_bytes += len(content.encode())
+        db.commit()
+
+        stored = db.execute('SELECT SUM(length(data)) FROM chapter_revisions').fetchone()[0]
+        newest = revisions.latest(db, 1)['revision']
+        worst = newest - (newest - 1) % revisions.SNAPSHOT_EVERY - 1  # last revision before a snapshot
+
+        def rebuild(revision):
+            samples = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                revisions.reconstruct(db, 1, revision)
+                samples.append((time.perf_counter() - start) * 1000)
+            return statistics.median(samples)
+
+        assert revisions.reconstruct(db, 1, newest) == content
+        print(f'{newest} revisions of a {len(content) / 1024:.0f} KB chapter')
+        print(f'full copies:        {full_bytes / 1e6:>8.2f} MB')
+        print(f'deltas + snapshots: {stored / 1e6:>8.2f} MB ({full_bytes / stored:.0f}x smaller)')
+        print(f'record median:      {statistics.median(record_ms):>8.2f} ms')
+        print(f'rebuild newest:     {rebuild(newest):>8.2f} ms')
+        print(f'rebuild #{worst:<10} {rebuild(worst):>8.2f} ms '
+              f'({revisions.SNAPSHOT_EVERY - 1} deltas after a snapshot)')
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
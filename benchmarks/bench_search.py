@@ -0,0 +1,100 @@
+"""Full-text search latency on a 1M-word project versus a LIKE scan.
+
+Builds a throwaway database where one author has `--words` words spread over
+chapters (and a second author has the same amount, to check the owner
+scoping), then times search.search() against the `content LIKE '%term%'`
+scan an app without FTS would have to run.
+
+    python benchmarks/bench_search.py [--words 1000000] [--repeat 20]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import app as narreyes  # noqa: E402
+import database  # noqa: E402
+import search  # noqa: E402
+
+CHAPTER_WORDS = 10000
+
+
+def vocabulary(size, rng):
+    syllables = ['ka', 'lo', 'mi', 'ra', 'then', 'dor', 'el', 'wyn', 'ash', 'ber', 'ti', 'on', 'us', 'ia']
+    words = set()
+    while len(words) < size:
+        words.add(''.join(rng.choice(syllables) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+def chapter_html(rng, words, weights):
+    picked = rng.choices(words, weights=weights, k=CHAPTER_WORDS)
+    paragraphs = [' '.join(picked[i:i + 120]) + '.' for i in range(0, CHAPTER_WORDS, 120)]
+    return ''.join(f'<p>{paragraph}</p>' for paragraph in paragraphs)
+
+
+def seed(path, total_words, rng):
+    narreyes.app.config['DATABASE'] = path
+    narreyes.init_db()
+    db = database.connect(path)
+    words = vocabulary(20000, rng)
+    weights = [1 / (rank + 1) for rank in range(len(words))]  # Zipf-like
+    for user in (1, 2):
+        db.execute('INSERT INTO users (id, username, email, password_hash) VALUES (?, ?, ?, ?)',
+                   (user, f'user{user}', f'user{user}@x', 'x'))
+        for number in range(total_words // CHAPTER_WORDS):
+            db.execute('INSERT INTO chapters (user_id, title, chapter_number, content) VALUES (?, ?, ?, ?)',
+                       (user, f'Chapter {number + 1}', number + 1, chapter_html(rng, words, weights)))
+    db.commit()
+    db.execute("INSERT INTO chapters_fts (chapters_fts) VALUES ('optimize')")
+    db.commit()
+    return db, words
+
+
+def timed(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--words', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    rng = random.Random(5)
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        db, words = seed(os.path.join(tmp, 'search.db'), args.words, rng)
+        print(f'indexed {2 * args.words:,} words in {time.perf_counter() - start:.1f}s')
+
+        queries = {
+            'common term': words[0],
+            'rare term': words[5000],
+            'two terms': f'{words[3]} {words[50]}',
+            'prefix': words[10][:3] + '*',
+        }
+        print(f"{'query':<14}{'fts ms':>10}{'like ms':>10}{'hits':>6}")
+        for label, text in queries.items():
+            fts_ms, results = timed(lambda: search.search(db, 1, text, kinds=['chapter']), args.repeat)
+            term = text.split()[0].rstrip('*')
+            # Without an index every match has to be found before it can be ranked
+            like_ms, _ = timed(lambda: db.execute(
+                'SELECT id, title FROM chapters WHERE user_id = ? AND content LIKE ?',
+                (1, f'%{term}%')).fetchall(), max(1, args.repeat // 4))
+            print(f'{label:<14}{fts_ms:>10.2f}{like_ms:>10.2f}{len(results):>6}')
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""Chapter statistics on a 100k-word HTML manuscript.
+
+Compares the old `len(content.split())` word count with textstats.analyze()
+for time per call and peak allocation, and shows how far the old count was
+off because it counted tags and attributes as words.
+
+    python benchmarks/bench_textstats.py [--words 100000] [--repeat 5]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import textstats  # noqa: E402
+
+VOCABULARY = ('the a she he they walked said quietly toward old house river night light '
+              'remember never always window door road morning letter again before').split()
+
+
+def manuscript(words, seed=1):
+    """TinyMCE-style HTML with paragraphs, inline markup and entities"""
+    rng = random.Random(seed)
+    parts = []
+    written = 0
+    while written < words:
+        sentences = []
+        for _ in range(rng.randint(2, 6)):
+            length = rng.randint(6, 20)
+            sentence = [rng.choice(VOCABULARY) for _ in range(length)]
+            sentence[0] = sentence[0].capitalize()
+            if rng.random() < 0.3:
+                sentence[1] = f'<em>{sentence[1]}</em>'
+            if rng.random() < 0.1:
+                sentence[2] = f'<span style="color: #c0392b;">{sentence[2]}</span>'
+            sentences.append(' '.join(sentence) + rng.choice(['.', '.', '!', '?', '&hellip;']))
+            written += length
+        parts.append('<p style="text-align: justify;">' + '&nbsp;'.join(sentences) + '</p>')
+    return '\n'.join(parts)
+
+
+def measure(func, content, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(content)
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    func(content)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--words', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    content = manuscript(args.words)
+    old_time, old_peak = measure(lambda c: len(c.split()), content, args.repeat)
+    new_time, new_peak = measure(textstats.analyze, content, args.repeat)
+    result = textstats.analyze(content)
+
+    print(f'manuscript: {len(content) / 1e6:.2f} MB of HTML')
+    print(f"{'method':<22}{'time ms':>10}{'peak KB':>12}{'words':>10}")
+    print(f"{'str.split()':<22}{old_time * 1000:>10.1f}{old_peak / 1024:>12.0f}{len(content.split()):>10}")
+    print(f"{'textstats.analyze()':<22}{new_time * 1000:>10.1f}{new_peak / 1024:>12.0f}{result.word_count:>10}")
+    print(f'chars={result.char_count} paragraphs={result.paragraph_count} '
+          f'sentences={result.sentence_count} reading={result.reading_minutes} min')
+
+
+if __name__ == '__main__':
+    main()
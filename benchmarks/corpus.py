@@ -0,0 +1,145 @@
+"""Synthetic NarrEyes data: authors with chapters, a cast, a timeline and relationships.
+
+Adds `--users` authors to a database (project.db by default), each with
+`--chapters` chapters of editor-style HTML whose lengths spread around
+`--words` words, `--characters` characters, `--events` timeline events
+with parseable dates and `--relationships` relationships. Everything is
+derived from `--seed`, so the same arguments always produce the same
+corpus. Every author can log in with PASSWORD.
+
+    python benchmarks/corpus.py [--db project.db] [--users 5] [--chapters 40] [--words 2500]
+                                [--characters 60] [--events 150] [--relationships 200] [--seed 16]
+"""
+
+import argparse
+import math
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from werkzeug.security import generate_password_hash  # noqa: E402
+
+import app as narreyes  # noqa: E402
+import chronology  # noqa: E402
+import database  # noqa: E402
+import textstats  # noqa: E402
+from bench_textstats import manuscript  # noqa: E402
+
+PASSWORD = 'bench-password'
+ROLES = ['protagonist', 'antagonist', 'supporting', 'supporting', 'minor', 'minor', 'minor']
+RELATIONSHIP_TYPES = ['friend', 'rival', 'sibling', 'mentor', 'lover', 'enemy', 'parent', 'ally']
+STATUSES = ['draft', 'draft', 'in_progress', 'review', 'published']
+SEASONS = ['Spring', 'Summer', 'Autumn', 'Winter']
+SYLLABLES = ['al', 'bel', 'cor', 'da', 'el', 'fin', 'gar', 'ha', 'is', 'jo', 'ka', 'lin',
+             'mor', 'na', 'or', 'pel', 'ra', 'sa', 'tor', 'ul', 'vin', 'wen', 'ya', 'zel']
+
+
+def name(rng):
+    first = ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 3))).capitalize()
+    last = ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).capitalize()
+    return f'{first} {last}'
+
+
+def event_date(rng):
+    year = rng.randint(1, 40)
+    form = rng.random()
+    if form < 0.4:
+        return f'Year {year}, Day {rng.randint(1, 365)}'
+    if form < 0.8:
+        return f'Year {year}, {rng.choice(SEASONS)}'
+    if form < 0.95:
+        return f'Year {year}'
+    return 'Before the war'  # undated
+
+
+def generate(path, users=5, chapters=40, words=2500, characters=60, events=150,
+             relationships=200, seed=16):
+    """Add a synthetic corpus to the database at `path`; returns the new user ids"""
+    rng = random.Random(seed)
+    narreyes.app.config['DATABASE'] = path
+    narreyes.init_db()
+    calendar = chronology.Calendar()
+    password_hash = generate_password_hash(PASSWORD)  # the same for everyone: hashing is slow
+
+    db = database.connect(path)
+    try:
+        first = db.execute('SELECT COUNT(*) FROM users').fetchone()[0] + 1
+        user_ids = []
+        for n in range(first, first + users):
+            cursor = db.execute('INSERT INTO users (username, email, password_hash) VALUES (?, ?, ?)',
+                                (f'bench{n}', f'bench{n}@bench.local', password_hash))
+            user_id = cursor.lastrowid
+            user_ids.append(user_id)
+
+            def chapter_rows():
+                for number in range(1, chapters + 1):
+                    # Log-normal lengths: most chapters near `words`, a few much longer
+                    length = max(200, int(rng.lognormvariate(math.log(words), 0.45)))
+                    content = manuscript(length, seed=rng.randrange(1 << 30))
+                    yield (user_id, f'{name(rng).split()[0]} {rng.choice(["Returns", "Falls", "Waits", "Remembers"])}',
+                           number, content, *textstats.analyze(content), rng.choice(STATUSES))
+
+            db.executemany('''INSERT INTO chapters
+                              (user_id, title, chapter_number, content, word_count, char_count,
+                               paragraph_count, sentence_count, reading_minutes, excerpt, status)
+                              VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', chapter_rows())
+            chapter_ids = [row[0] for row in db.execute('SELECT id FROM chapters WHERE user_id = ?', (user_id,))]
+
+            db.executemany('''INSERT INTO characters (user_id, name, age, role, description, personality, background)
+                              VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                           [(user_id, name(rng), rng.randint(8, 90), rng.choice(ROLES),
+                             manuscript(rng.randint(20, 80), seed=rng.randrange(1 << 30)),
+                             manuscript(rng.randint(10, 40), seed=rng.randrange(1 << 30)),
+                             manuscript(rng.randint(20, 120), seed=rng.randrange(1 << 30)))
+                            for _ in range(characters)])
+            character_ids = [row[0] for row in db.execute('SELECT id FROM characters WHERE user_id = ?', (user_id,))]
+
+            def event_rows():
+                for number in range(events):
+                    date = event_date(rng)
+                    chapter_id = rng.choice(chapter_ids) if chapter_ids and rng.random() < 0.7 else None
+                    yield (user_id, f'Event {number + 1}', date, f'Something happens ({number + 1}).',
+                           chapter_id, chronology.sort_key(calendar, date))
+
+            db.executemany('''INSERT INTO timeline (user_id, event_title, event_date, description, chapter_id, sort_key)
+                              VALUES (?, ?, ?, ?, ?, ?)''', event_rows())
+
+            if len(character_ids) > 1:
+                # A few central characters take part in most relationships
+                weights = [1 / (i + 1) for i in range(len(character_ids))]
+                pairs = []
+                for _ in range(relationships):
+                    a = rng.choices(character_ids, weights)[0]
+                    b = rng.choice(character_ids)
+                    if a != b:
+                        pairs.append((user_id, a, b, rng.choice(RELATIONSHIP_TYPES), 'Generated'))
+                db.executemany('''INSERT INTO relationships
+                                  (user_id, character1_id, character2_id, relationship_type, description)
+                                  VALUES (?, ?, ?, ?, ?)''', pairs)
+            db.commit()
+        return user_ids
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', default=narreyes.DATABASE)
+    parser.add_argument('--users', type=int, default=5)
+    parser.add_argument('--chapters', type=int, default=40)
+    parser.add_argument('--words', type=int, default=2500)
+    parser.add_argument('--characters', type=int, default=60)
+    parser.add_argument('--events', type=int, default=150)
+    parser.add_argument('--relationships', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=16)
+    args = parser.parse_args()
+
+    user_ids = generate(args.db, args.users, args.chapters, args.words, args.characters,
+                        args.events, args.relationships, args.seed)
+    print(f'✅ Added {len(user_ids)} users to {args.db} (password: {PASSWORD})')
+
+
+if __name__ == '__main__':
+    main()
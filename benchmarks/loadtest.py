@@ -0,0 +1,484 @@
+"""Throughput and latency for every route, in process and over a multi-worker server.
+
+1. A corpus (benchmarks/corpus.py) is generated into a temporary database
+   and the AI endpoint is replaced by benchmarks/ai_stub.py, so the whole
+   run is offline and repeatable.
+2. client: every route in ROUTES is requested `--requests` times through
+   Flask's test client as the first corpus author. Routes that consume
+   something (deletes, logout, delete_account) get a fresh object or user
+   from an untimed setup step.
+3. server: the app is served by `--workers` processes accepting on one
+   shared listening socket (pre-fork, each with its own connection pool),
+   and `--concurrency` keep-alive clients send `--server-requests` to each
+   read-only GET route.
+4. Per-route p50/p95/p99 latency and requests/s are written as JSON to
+   benchmarks/results/. With --compare OLD.json the change in p50 against
+   an earlier run is printed and regressions beyond --threshold are flagged.
+
+    python benchmarks/loadtest.py [--requests 50] [--workers 4] [--concurrency 8]
+                                  [--server-requests 200] [--compare benchmarks/results/OLD.json]
+"""
+
+import argparse
+import io
+import json
+import logging
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..'))
+
+import requests  # noqa: E402
+from werkzeug.security import generate_password_hash  # noqa: E402
+
+import ai_stub  # noqa: E402
+import app as narreyes  # noqa: E402
+import corpus  # noqa: E402
+import database  # noqa: E402
+import revisions  # noqa: E402
+
+RESULTS_DIR = os.path.join(HERE, 'results')
+# Every client logs in at once, as the same author from one address; bench_login_flood.py measures the limits
+UNTHROTTLED = {'AUTH_IP_PER_MINUTE': 0, 'AUTH_USER_PER_MINUTE': 0, 'PASSWORD_MAX_PENDING': 64}
+
+
+class Route:
+    """One request to measure.
+
+    `path`, `data` and `json` are format strings / dicts (or callables
+    taking the values dict) filled from the corpus ids, the iteration
+    number `n` and whatever `setup` returned. `setup` and `after` run
+    untimed around each request.
+    """
+
+    def __init__(self, endpoint, method='GET', path='', data=None, json=None,
+                 setup=None, after=None, label=None):
+        self.endpoint = endpoint
+        self.method = method
+        self.path = path
+        self.data = data
+        self.json = json
+        self.setup = setup
+        self.after = after
+        self.label = label or (endpoint if method == 'GET' else f'{endpoint} {method}')
+
+    @property
+    def read_only(self):
+        return (self.method == 'GET' and self.setup is None and self.after is None
+                and not self.endpoint.startswith('delete_'))
+
+    def build(self, values):
+        def fill(value):
+            if callable(value):
+                return value(values)
+            if isinstance(value, dict):
+                return {key: fill(item) for key, item in value.items()}
+            if isinstance(value, str):
+                return value.format(**values)
+            return value
+        return fill(self.path), fill(self.data), fill(self.json)
+
+
+class Context:
+    """The corpus author the routes run as, plus untimed helpers"""
+
+    def __init__(self, path, user_id):
+        self.db = database.connect(path)
+        self.user_id = user_id
+        self.username = self.db.execute('SELECT username FROM users WHERE id = ?', (user_id,)).fetchone()[0]
+        self.client = narreyes.app.test_client()
+        self.password_hash = generate_password_hash(corpus.PASSWORD)
+        first = lambda table: self.db.execute(  # noqa: E731
+            f'SELECT id FROM {table} WHERE user_id = ? ORDER BY id LIMIT 2', (user_id,)).fetchall()
+        characters = first('characters')
+        self.ids = {
+            'chapter': first('chapters')[0][0],
+            'character': characters[0][0],
+            'character2': characters[1][0],
+            'event': first('timeline')[0][0],
+            'relationship': first('relationships')[0][0],
+        }
+        # Two revisions, so the history, diff and restore routes have work to do
+        chapter = self.db.execute('SELECT content FROM chapters WHERE id = ?', (self.ids['chapter'],)).fetchone()[0]
+        revisions.record(self.db, self.ids['chapter'], user_id, chapter)
+        revisions.record(self.db, self.ids['chapter'], user_id, chapter + '<p>One more paragraph.</p>')
+        self.db.commit()
+        self.login()
+
+    def login(self, user_id=None, username=None):
+        with self.client.session_transaction() as session:
+            session.clear()
+            session['user_id'] = user_id or self.user_id
+            session['username'] = username or self.username
+
+    def clear_flashes(self):
+        with self.client.session_transaction() as session:
+            session.pop('_flashes', None)
+
+    def insert(self, sql, params):
+        cursor = self.db.execute(sql, params)
+        self.db.commit()
+        return cursor.lastrowid
+
+
+# ---- untimed setup steps -------------------------------------------------
+
+def new_character(ctx, n):
+    return {'id': ctx.insert('INSERT INTO characters (user_id, name) VALUES (?, ?)',
+                             (ctx.user_id, f'Temp {n}'))}
+
+
+def new_chapter(ctx, n):
+    return {'id': ctx.insert('INSERT INTO chapters (user_id, title, chapter_number, content) VALUES (?, ?, ?, ?)',
+                             (ctx.user_id, f'Temp {n}', 10000 + n, '<p>Temporary.</p>'))}
+
+
+def new_event(ctx, n):
+    return {'id': ctx.insert('INSERT INTO timeline (user_id, event_title) VALUES (?, ?)',
+                             (ctx.user_id, f'Temp {n}'))}
+
+
+def new_relationship(ctx, n):
+    return {'id': ctx.insert('''INSERT INTO relationships (user_id, character1_id, character2_id, relationship_type)
+                                VALUES (?, ?, ?, 'temp')''',
+                             (ctx.user_id, ctx.ids['character'], ctx.ids['character2']))}
+
+
+def chapter_version(ctx, n):
+    return {'version': ctx.db.execute('SELECT version FROM chapters WHERE id = ?',
+                                      (ctx.ids['chapter'],)).fetchone()[0]}
+
+
+def ai_job(ctx, n):
+    response = ctx.client.post('/api/ai/jobs', json={'prompt': f'setup prompt {n} {time.time_ns()}',
+                                                    'ai_type': 'scene'})
+    return {'job': response.get_json()['id']}
+
+
+def throwaway_user(ctx, n):
+    username = f'gone{n}-{time.time_ns()}'
+    user_id = ctx.insert('INSERT INTO users (username, email, password_hash) VALUES (?, ?, ?)',
+                         (username, f'{username}@bench.local', ctx.password_hash))
+    ctx.login(user_id, username)
+    return {}
+
+
+def relogin(ctx, n):
+    ctx.login()
+
+
+MANUSCRIPT = 'Chapter 1\n\nIt began.\n\nChapter 2\n\nIt went on.\n\nChapter 3\n\nIt ended.\n'
+
+ROUTES = [
+    Route('static', path='/static/style.css'),
+    Route('index', path='/'),
+    Route('register'),
+    Route('register', 'POST', '/register', data={
+        'username': 'reg{n}-{stamp}', 'email': 'reg{n}-{stamp}@bench.local',
+        'password': 'secret1', 'confirm_password': 'secret1'}),
+    Route('login'),
+    Route('login', 'POST', '/login', data={'username': '{username}', 'password': corpus.PASSWORD}),
+    Route('logout', path='/logout', after=relogin),
+    Route('dashboard'),
+    Route('characters'),
+    Route('add_character'),
+    Route('add_character', 'POST', '/add_character', data={
+        'name': 'Bench {n}', 'age': '30', 'role': 'minor', 'description': 'Made by the load test.'}),
+    Route('edit_character', path='/edit_character/{character}'),
+    Route('edit_character', 'POST', '/edit_character/{character}', data={
+        'name': 'Edited {n}', 'age': '31', 'role': 'protagonist'}),
+    Route('delete_character', path='/delete_character/{id}', setup=new_character),
+    Route('chapters'),
+    Route('add_chapter'),
+    Route('add_chapter', 'POST', '/add_chapter', data={
+        'title': 'Bench {n}', 'chapter_number': '{number}', 'content': '<p>Written by the load test {n}.</p>'}),
+    Route('import_manuscript'),
+    Route('import_manuscript', 'POST', '/import_manuscript',
+          data=lambda values: {'manuscript': (io.BytesIO(MANUSCRIPT.encode()), 'bench.txt')}),
+    Route('chapter_detail', path='/chapter/{chapter}'),
+    Route('api_cache_stats', path='/api/cache'),
+    Route('edit_chapter', path='/edit_chapter/{chapter}'),
+    Route('edit_chapter', 'POST', '/edit_chapter/{chapter}', data={
+        'title': 'Edited', 'chapter_number': '1', 'status': 'draft',
+        'content': '<p>Edited by the load test, round {n}.</p>'}),
+    Route('api_autosave_chapter', 'PATCH', '/api/chapters/{chapter}/autosave', setup=chapter_version,
+          json=lambda values: {'base_version': values['version'],
+                               'changes': [{'at': 0, 'delete': 0, 'insert': f'<p>{values["n"]}</p>'}]}),
+    Route('delete_chapter', path='/delete_chapter/{id}', setup=new_chapter),
+    Route('chapter_revisions', path='/chapter/{chapter}/revisions'),
+    Route('revision_diff', path='/chapter/{chapter}/revisions/2'),
+    Route('restore_revision', 'POST', '/chapter/{chapter}/revisions/1/restore'),
+    Route('timeline'),
+    Route('timeline', path='/timeline?from=Year+5&to=Year+20', label='timeline filtered'),
+    Route('add_event'),
+    Route('add_event', 'POST', '/add_event', data={
+        'event_title': 'Bench {n}', 'event_date': 'Year 12, Summer', 'description': 'x'}),
+    Route('delete_event', path='/delete_event/{id}', setup=new_event),
+    Route('relationships'),
+    Route('add_relationship'),
+    Route('add_relationship', 'POST', '/add_relationship', data={
+        'character1_id': '{character}', 'character2_id': '{character2}', 'relationship_type': 'rival'}),
+    Route('delete_relationship', path='/delete_relationship/{id}', setup=new_relationship),
+    Route('api_graph', path='/api/graph'),
+    Route('api_graph_neighbors', path='/api/graph/characters/{character}/neighbors?hops=2'),
+    Route('api_graph_path', path='/api/graph/path?from={character}&to={character2}'),
+    Route('api_graph_centrality', path='/api/graph/centrality'),
+    Route('api_graph_components', path='/api/graph/components'),
+    Route('search_page', path='/search?q=river'),
+    Route('api_search', path='/api/search?q=river+light'),
+    Route('export'),
+    Route('export_download', path='/export/md', label='export_download md'),
+    Route('export_download', path='/export/epub', label='export_download epub'),
+    Route('export_download', path='/export/backup', label='export_download backup'),
+    Route('ai'),
+    Route('ai', 'POST', '/ai', data={'prompt': 'A storm at sea {n} {stamp}', 'ai_type': 'scene'}),
+    Route('api_ai_submit', 'POST', '/api/ai/jobs', json={'prompt': 'Describe a city {n} {stamp}',
+                                                         'ai_type': 'description'}),
+    Route('api_ai_job', path='/api/ai/jobs/{job}', setup=ai_job),
+    Route('api_ai_job_events', path='/api/ai/jobs/{job}/events', setup=ai_job),
+    Route('profile'),
+    Route('edit_profile'),
+    Route('edit_profile', 'POST', '/edit_profile', data={'username': '{username}',
+                                                         'email': '{username}@bench.local'}),
+    Route('change_password'),
+    Route('change_password', 'POST', '/change_password', data={
+        'current_password': corpus.PASSWORD, 'new_password': corpus.PASSWORD,
+        'confirm_password': corpus.PASSWORD}),
+    Route('delete_account', 'POST', '/delete_account', data={'password': corpus.PASSWORD},
+          setup=throwaway_user, after=relogin),
+    Route('metrics', path='/metrics'),
+]
+
+
+def summarize(samples, wall, statuses):
+    samples = sorted(samples)
+    cuts = statistics.quantiles(samples, n=100, method='inclusive') if len(samples) > 1 else samples * 99
+    return {
+        'requests': len(samples),
+        'p50_ms': round(cuts[49], 3),
+        'p95_ms': round(cuts[94], 3),
+        'p99_ms': round(cuts[98], 3),
+        'mean_ms': round(statistics.fmean(samples), 3),
+        'rps': round(len(samples) / wall, 1) if wall else None,
+        'statuses': {str(status): count for status, count in sorted(statuses.items())},
+        'errors': sum(count for status, count in statuses.items() if status >= 500),
+    }
+
+
+def run_client(ctx, routes, count):
+    results = {}
+    for route in routes:
+        samples, statuses, wall = [], {}, 0.0
+        for n in range(count):
+            values = dict(ctx.ids, n=n, stamp=time.time_ns(), number=20000 + n, username=ctx.username)
+            if route.setup:
+                values.update(route.setup(ctx, n))
+            path, data, body = route.build(values)
+            start = time.perf_counter()
+            response = ctx.client.open(path or f'/{route.endpoint}', method=route.method, data=data, json=body)
+            response.get_data()  # drain streamed bodies (exports, SSE) inside the timing
+            elapsed = time.perf_counter() - start
+            response.close()
+            wall += elapsed
+            samples.append(elapsed * 1000)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            if route.after:
+                route.after(ctx, n)
+            ctx.clear_flashes()
+        results[route.label] = summarize(samples, wall, statuses)
+        print(f"  {route.label:<32}{results[route.label]['p50_ms']:>9.2f}{results[route.label]['p95_ms']:>9.2f}"
+              f"{results[route.label]['rps']:>9.0f}  {results[route.label]['statuses']}")
+    return results
+
+
+# ---- pre-fork server ------------------------------------------------------
+
+def serve(fd, port, path, ai_url, secret):
+    """Worker process: serve the app on an inherited listening socket"""
+    from werkzeug.serving import make_server
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    # Every worker has to sign sessions with the same key
+    app = narreyes.create_app({'DATABASE': path, 'AI_API_URL': ai_url, 'SECRET_KEY': secret, **UNTHROTTLED},
+                              require_secret=True)
+    make_server('127.0.0.1', port, app, threaded=True, fd=fd).serve_forever()
+
+
+def start_workers(path, ai_url, workers):
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(256)
+    listener.set_inheritable(True)
+    port = listener.getsockname()[1]
+    secret = os.urandom(24).hex()
+    processes = [subprocess.Popen([sys.executable, os.path.abspath(__file__), '--serve', str(listener.fileno()),
+                                   str(port), path, ai_url, secret],
+                                  pass_fds=[listener.fileno()], stdout=subprocess.DEVNULL)
+                 for _ in range(workers)]
+    base = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            requests.get(base + '/login', timeout=5)
+            break
+        except requests.RequestException:
+            time.sleep(0.1)
+    return base, processes, listener
+
+
+def run_server(base, routes, ctx, total, concurrency):
+    local = threading.local()
+
+    def session():
+        if not hasattr(local, 'client'):
+            local.client = requests.Session()
+            local.client.post(base + '/login', data={'username': ctx.username, 'password': corpus.PASSWORD})
+        return local.client
+
+    def one(path):
+        client = session()
+        start = time.perf_counter()
+        response = client.get(base + path)
+        elapsed = (time.perf_counter() - start) * 1000
+        return elapsed, response.status_code
+
+    results = {}
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(lambda _: session(), range(concurrency * 4)))  # log every thread in
+        for route in routes:
+            path, _, _ = route.build(dict(ctx.ids, n=0, stamp=0, number=0, username=ctx.username))
+            path = path or f'/{route.endpoint}'
+            start = time.perf_counter()
+            measured = list(pool.map(one, [path] * total))
+            wall = time.perf_counter() - start
+            statuses = {}
+            for _, status in measured:
+                statuses[status] = statuses.get(status, 0) + 1
+            results[route.label] = summarize([elapsed for elapsed, _ in measured], wall, statuses)
+            print(f"  {route.label:<32}{results[route.label]['p50_ms']:>9.2f}{results[route.label]['p95_ms']:>9.2f}"
+                  f"{results[route.label]['rps']:>9.0f}  {results[route.label]['statuses']}")
+    return results
+
+
+# ---- results --------------------------------------------------------------
+
+def uncovered_routes():
+    covered = {(route.endpoint, route.method) for route in ROUTES}
+    return sorted(f'{rule.endpoint} {method}' for rule in narreyes.app.url_map.iter_rules()
+                  for method in rule.methods - {'HEAD', 'OPTIONS'} if (rule.endpoint, method) not in covered)
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old_path, results, threshold):
+    with open(old_path) as f:
+        old = json.load(f)
+    print(f"\nChange in p50 against {old_path} ({old['meta'].get('commit')}):")
+    regressions = 0
+    for mode in ('client', 'server'):
+        for label, now in results.get(mode, {}).items():
+            before = old.get(mode, {}).get(label)
+            if not before or not before['p50_ms']:
+                continue
+            change = (now['p50_ms'] - before['p50_ms']) / before['p50_ms'] * 100
+            flag = ''
+            if change > threshold:
+                flag = '  ⚠️  regression'
+                regressions += 1
+            print(f"  {mode:<7}{label:<32}{before['p50_ms']:>9.2f} -> {now['p50_ms']:>9.2f} ms {change:>+7.1f}%{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=50, help='per route, test client')
+    parser.add_argument('--server-requests', type=int, default=200, help='per route, server mode')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--users', type=int, default=3)
+    parser.add_argument('--chapters', type=int, default=40)
+    parser.add_argument('--words', type=int, default=2500)
+    parser.add_argument('--seed', type=int, default=16)
+    parser.add_argument('--skip-server', action='store_true')
+    parser.add_argument('--output', help='results file (default: benchmarks/results/loadtest-<time>.json)')
+    parser.add_argument('--compare', help='earlier results file to compare against')
+    parser.add_argument('--threshold', type=float, default=20.0, help='p50 regression threshold in %%')
+    parser.add_argument('--serve', nargs=5, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        fd, port, path, ai_url, secret = args.serve
+        serve(int(fd), int(port), path, ai_url, secret)
+        return
+
+    stub = ai_stub.start(delay=0.0, token_delay=0.0, tokens=40)
+    narreyes.app.config['AI_API_URL'] = stub.url
+    narreyes.app.config.update(UNTHROTTLED)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'loadtest.db')
+        user_ids = corpus.generate(path, users=args.users, chapters=args.chapters, words=args.words,
+                                   seed=args.seed)
+        ctx = Context(path, user_ids[0])
+        results = {
+            'meta': {
+                'time': datetime.now().isoformat(timespec='seconds'),
+                'commit': git_commit(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'args': {key: value for key, value in vars(args).items() if key != 'serve'},
+            },
+            'uncovered': uncovered_routes(),
+        }
+        if results['uncovered']:
+            print('⚠️  routes without a benchmark:', ', '.join(results['uncovered']))
+
+        print(f"\ntest client, {args.requests} requests per route"
+              f"\n  {'route':<32}{'p50 ms':>9}{'p95 ms':>9}{'req/s':>9}")
+        results['client'] = run_client(ctx, ROUTES, args.requests)
+
+        if not args.skip_server:
+            base, processes, listener = start_workers(path, stub.url, args.workers)
+            try:
+                print(f"\n{args.workers} worker processes, {args.concurrency} clients, "
+                      f"{args.server_requests} requests per route"
+                      f"\n  {'route':<32}{'p50 ms':>9}{'p95 ms':>9}{'req/s':>9}")
+                results['server'] = run_server(base, [route for route in ROUTES if route.read_only],
+                                               ctx, args.server_requests, args.concurrency)
+            finally:
+                for process in processes:
+                    process.terminate()
+                for process in processes:
+                    process.wait()
+                listener.close()
+        ctx.db.close()
+    stub.shutdown()
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    output = args.output or os.path.join(RESULTS_DIR, f"loadtest-{datetime.now():%Y%m%d-%H%M%S}.json")
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f'\n✅ Results written to {output}')
+
+    if args.compare and compare(args.compare, results, args.threshold):
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""Per-process cache of per-author structures that are costly to build.
+
+graph.py keeps each author's relationship graph and mentions.py their
+character-name automaton in a BuildCache. Every entry is stamped with the
+version it was built from, the author's stats.data_version, and a lookup
+with another version is a miss. An edit made through any worker process
+bumps the version in the database, so every process rebuilds on its next
+lookup instead of serving a structure built before the edit. The TTL and
+the size bound (least fresh entry evicted first) only limit memory.
+invalidate(key) drops an entry at once in this process.
+
+A build runs outside the lock, so an invalidate() can land while one is
+in progress; the result is then returned to its caller but not cached,
+since it may predate the change. Only keys with a build in progress are
+tracked for this, so the bookkeeping stays as small as the cache.
+"""
+
+import threading
+import time
+
+
+class BuildCache:
+    """Values built on a miss, with a TTL, a size bound and invalidation"""
+
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self._entries = {}  # key -> (expires, version, value)
+        self._building = {}  # key -> builds in progress
+        self._stale = set()  # keys invalidated while being built
+        self._lock = threading.Lock()
+
+    def get(self, key, build, version=None):
+        """Return the value cached for `key` at `version`, calling build() on a miss"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now and entry[1] == version:
+                return entry[2]
+            self._building[key] = self._building.get(key, 0) + 1
+
+        built = False
+        try:
+            value = build()
+            built = True
+            return value
+        finally:
+            with self._lock:
+                stale = key in self._stale
+                if self._building[key] == 1:
+                    del self._building[key]
+                    self._stale.discard(key)
+                else:
+                    self._building[key] -= 1
+                current = self._entries.get(key)
+                # A slow build from an older version must not replace a newer one
+                newer = current is not None and version is not None and current[1] is not None \
+                    and current[1] > version
+                if built and not stale and not newer:
+                    if len(self._entries) >= self.size and key not in self._entries:
+                        del self._entries[min(self._entries, key=lambda old: self._entries[old][0])]
+                    self._entries[key] = (now + self.ttl, version, value)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+            if key in self._building:
+                self._stale.add(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._stale.update(self._building)
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,86 @@
+"""Batch edits over many rows of one author, each in a single transaction.
+
+The list pages let an author select several chapters, characters, events
+or relationships at once. Every operation here checks ownership in the
+WHERE clause, runs one executemany() and commits once, so a batch either
+applies completely or not at all. Deleting relies on the foreign keys
+(database.PRAGMAS turns them on) to cascade to revisions and
+relationships and to clear timeline links to deleted chapters.
+"""
+
+import ordering
+
+# Tables the bulk-delete endpoint may delete from
+TABLES = frozenset({'chapters', 'characters', 'timeline', 'relationships'})
+
+CHAPTER_STATUSES = ('draft', 'in_progress', 'review', 'published')
+MAX_IDS = 1000
+
+
+class BulkError(ValueError):
+    """The request does not describe a valid batch"""
+
+
+def parse_ids(value):
+    """Distinct ids from a JSON list, in their original order"""
+    if not isinstance(value, list) or not value:
+        raise BulkError('ids must be a non-empty list')
+    if len(value) > MAX_IDS:
+        raise BulkError(f'at most {MAX_IDS} ids per request')
+    if not all(isinstance(item, int) and not isinstance(item, bool) for item in value):
+        raise BulkError('ids must be integers')
+    return list(dict.fromkeys(value))
+
+
+def _run(db, sql, rows):
+    try:
+        cursor = db.executemany(sql, rows)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return cursor.rowcount
+
+
+def delete(db, table, user_id, ids):
+    """Delete the author's rows among `ids`; returns how many went"""
+    if table not in TABLES:
+        raise BulkError(f'cannot bulk delete {table}')
+    return _run(db, f'DELETE FROM {table} WHERE id = ? AND user_id = ?',
+                ((row_id, user_id) for row_id in ids))
+
+
+def set_status(db, user_id, ids, status):
+    """Move the author's chapters among `ids` to `status`"""
+    if status not in CHAPTER_STATUSES:
+        raise BulkError(f'status must be one of {", ".join(CHAPTER_STATUSES)}')
+    return _run(db, '''UPDATE chapters SET status = ?, updated_at = CURRENT_TIMESTAMP
+                       WHERE id = ? AND user_id = ? AND status IS NOT ?''',
+                ((status, row_id, user_id, status) for row_id in ids))
+
+
+def reorder(db, user_id, ids):
+    """Put the chapters `ids` in the given order.
+
+    The chapters swap the sort keys they already hold (see ordering.py), so
+    reordering a selection never moves chapters outside it. Returns how
+    many chapters moved.
+    """
+    placeholders = ', '.join('?' * len(ids))
+
+    def current_keys():
+        return dict(db.execute(f'SELECT id, sort_key FROM chapters WHERE user_id = ? AND id IN ({placeholders})',
+                               (user_id, *ids)).fetchall())
+
+    current = current_keys()
+    if len(current) != len(ids):
+        raise BulkError('unknown chapter id')
+    if len(set(current.values())) < len(ids):
+        # Tied keys are ordered by id, so swapping them would change nothing
+        ordering.rebalance(db, user_id)
+        current = current_keys()
+    slots = sorted(current.values())
+    return _run(db, '''UPDATE chapters SET sort_key = ?, updated_at = CURRENT_TIMESTAMP
+                       WHERE id = ? AND user_id = ?''',
+                ((key, row_id, user_id) for row_id, key in zip(ids, slots)
+                 if current[row_id] != key))
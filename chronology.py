@@ -0,0 +1,184 @@
+"""Sortable keys for free-form timeline dates.
+
+Authors type event dates as they think of them: "1995-04-12", "March 3,
+1820", "Spring 1995", "Year 3, Spring", "Day 12", "300 BC", "Third Age
+3019". A Calendar turns such text into one number,
+
+    sort_key = year * YEAR_SPAN + day of the year
+
+so events sort chronologically with a plain indexed column instead of
+lexically on the text. Dates with slashes are read day first, "12/05/2020"
+being 12 May, or month first when only that reading is a real date
+("05/25/2020"), or year first when they start with the year ("2020/05/12");
+one that fits none of these is undated rather than guessed at. Month names, season names and eras are configurable
+for invented worlds. Text with no date in it gets UNDATED, which sorts after
+every real date.
+"""
+
+import re
+
+YEAR_SPAN = 1000  # more days than any calendar year
+UNDATED = 1e15
+
+GREGORIAN_MONTHS = [
+    ('january', 31), ('february', 29), ('march', 31), ('april', 30), ('may', 31), ('june', 30),
+    ('july', 31), ('august', 31), ('september', 30), ('october', 31), ('november', 30), ('december', 31),
+]
+# Season -> fraction of the year where it starts
+SEASONS = {'winter': 0.0, 'spring': 0.22, 'summer': 0.47, 'autumn': 0.72, 'fall': 0.72}
+# Era -> (direction, year offset). BC years count backwards from 0.
+ERAS = {'bce': (-1, 0), 'bc': (-1, 0), 'ce': (1, 0), 'ad': (1, 0)}
+
+_ISO_RE = re.compile(r'\b(-?\d{1,6})-(\d{1,2})(?:-(\d{1,2}))?\b')
+_SLASH_RE = re.compile(r'\b(\d{1,6})/(\d{1,2})/(\d{1,6})\b')
+_YEAR_RE = re.compile(r'\byear\s+(-?\d+)')
+_DAY_RE = re.compile(r'\bday\s+(\d+)')
+_NUMBER_RE = re.compile(r'-?\d+')
+
+
+class Calendar:
+    """Parser for one world's dates.
+
+    `months` is a list of (name, days); names also match by their first
+    three letters. `seasons` maps a name to the fraction of the year where
+    it starts. `eras` maps a name to (direction, offset): "third age 3019"
+    with {'third age': (1, 6000)} sorts as year 9019.
+    """
+
+    def __init__(self, months=None, seasons=None, eras=None):
+        self.months = [(name.lower(), days) for name, days in (months or GREGORIAN_MONTHS)]
+        self.seasons = {name.lower(): start for name, start in (seasons or SEASONS).items()}
+        self.eras = {name.lower(): tuple(value) for name, value in (eras or ERAS).items()}
+        self.year_days = sum(days for _, days in self.months)
+
+        self._month_start = {}
+        start = 0
+        for number, (name, days) in enumerate(self.months, 1):
+            self._month_start[name] = self._month_start[name[:3]] = (number, start, days)
+            start += days
+        self._month_starts = [self._month_start[name] for name, _ in self.months]
+        self._month_re = self._words_re(self._month_start)
+        self._season_re = self._words_re(self.seasons)
+        self._era_re = self._words_re(self.eras)
+
+    @classmethod
+    def from_config(cls, config):
+        """Build from a dict with optional months/seasons/eras keys"""
+        config = config or {}
+        return cls(config.get('months'), config.get('seasons'), config.get('eras'))
+
+    @staticmethod
+    def _words_re(words):
+        # Longest first, so "third age" wins over "age"
+        names = sorted(words, key=len, reverse=True)
+        return re.compile(r'\b(' + '|'.join(re.escape(name) for name in names) + r')\b') if names else None
+
+    def parse(self, text, end=False):
+        """Sort key for a date, or None when there is no date in `text`.
+
+        With end=True a partial date maps to the last day it covers, so
+        "1995" as the end of a range includes all of 1995.
+        """
+        text = (text or '').lower().strip()
+        if not text:
+            return None
+
+        year = day = None
+        direction, offset = 1, 0
+        era = self._era_re.search(text) if self._era_re else None
+        if era:
+            direction, offset = self.eras[era.group(1)]
+            text = text[:era.start()] + ' ' + text[era.end():]
+
+        iso = _ISO_RE.search(text)
+        if iso and 1 <= int(iso.group(2)) <= len(self.months):
+            year = int(iso.group(1))
+            _, start, days = self._month_starts[int(iso.group(2)) - 1]
+            day = start + (min(int(iso.group(3)), days) - 1 if iso.group(3) else (days - 1 if end else 0))
+            return self._key(year, day, direction, offset)
+
+        slash = _SLASH_RE.search(text)
+        if slash:
+            return self._slash_date(*slash.groups(), direction, offset)
+
+        found = _YEAR_RE.search(text)
+        if found:
+            year = int(found.group(1))
+            text = text[:found.start()] + ' ' + text[found.end():]
+        found = _DAY_RE.search(text)
+        if found:
+            day = int(found.group(1)) - 1
+            text = text[:found.start()] + ' ' + text[found.end():]
+
+        month = self._month_re.search(text) if self._month_re else None
+        season = self._season_re.search(text) if self._season_re else None
+        numbers = [int(number) for number in _NUMBER_RE.findall(text)]
+
+        if month:
+            _, start, days = self._month_start[month.group(1)]
+            # "March 3, 1820" / "3 March 1820": a small number is the day
+            small = [n for n in numbers if 1 <= n <= days]
+            if small:
+                numbers.remove(small[0])
+                day = start + small[0] - 1
+            else:
+                day = start + (days - 1 if end else 0)
+        elif season and day is None:
+            start = self.seasons[season.group(1)]
+            following = sorted(s for s in self.seasons.values() if s > start)
+            stop = following[0] if following else 1.0
+            day = int((stop if end else start) * self.year_days) - (1 if end else 0)
+
+        if year is None and numbers:
+            year = max(numbers, key=abs)
+        if year is None and day is None:
+            return None
+        if day is None:
+            day = self.year_days - 1 if end else 0
+        return self._key(year or 0, day, direction, offset)
+
+    def _slash_date(self, first, second, third, direction, offset):
+        """Key for Y/M/D, D/M/Y or (when only it is valid) M/D/Y; None if no reading is a date"""
+        if len(first) > 2:
+            year, month, day = int(first), int(second), int(third)
+        else:
+            day, month, year = int(first), int(second), int(third)
+            if not self._is_date(month, day) and self._is_date(day, month):
+                day, month = month, day
+        if not self._is_date(month, day):
+            return None
+        _, start, _ = self._month_starts[month - 1]
+        return self._key(year, start + day - 1, direction, offset)
+
+    def _is_date(self, month, day):
+        return 1 <= month <= len(self.months) and 1 <= day <= self._month_starts[month - 1][2]
+
+    def _key(self, year, day, direction, offset):
+        return float((offset + direction * year) * YEAR_SPAN + min(max(day, 0), YEAR_SPAN - 1))
+
+
+def sort_key(calendar, text):
+    """Key to store for an event date: the parsed date, or UNDATED"""
+    key = calendar.parse(text)
+    return UNDATED if key is None else key
+
+
+def backfill(db, calendar, batch_size=500, only_missing=False):
+    """Recompute sort_key for timeline events in id order, committing per batch.
+
+    Returns the number of events updated.
+    """
+    condition = 'AND sort_key IS NULL' if only_missing else ''
+    last_id = 0
+    updated = 0
+    while True:
+        rows = db.execute(f'''SELECT id, event_date FROM timeline
+                              WHERE id > ? {condition} ORDER BY id LIMIT ?''',
+                          (last_id, batch_size)).fetchall()
+        if not rows:
+            return updated
+        db.executemany('UPDATE timeline SET sort_key = ? WHERE id = ?',
+                       [(sort_key(calendar, row['event_date']), row['id']) for row in rows])
+        db.commit()
+        updated += len(rows)
+        last_id = rows[-1]['id']
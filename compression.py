@@ -0,0 +1,81 @@
+"""Compression of large dynamic responses.
+
+Rendered pages such as chapter_detail run to tens of kilobytes of
+repetitive HTML. With app.config['COMPRESSION'] on, init_app() compresses
+every finished response that:
+
+- is a 200 with a text, JSON, JavaScript or SVG body held in memory
+  (streamed responses such as AI generation and file downloads pass
+  through untouched),
+- is at least COMPRESS_MIN_BYTES long,
+- has no Content-Encoding yet and no `Cache-Control: no-transform`,
+
+with brotli when the browser accepts it and the module is installed,
+else gzip. Levels are chosen for speed, not ratio: static files are
+compressed once, at maximum level, by `flask assets-build` (see assets.py)
+and never go through here.
+
+A compressed response gets `Vary: Accept-Encoding` and its ETag is made
+weak, as the bytes differ from the identity response's; pagecache.is_fresh
+compares weakly, so conditional requests still get their 304.
+"""
+
+import gzip
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only without it
+    brotli = None
+
+MIN_BYTES = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+MIMETYPES = ('text/html', 'text/plain', 'text/css', 'text/csv', 'text/markdown', 'application/json',
+             'application/javascript', 'text/javascript', 'image/svg+xml', 'application/xml')
+
+
+def encode(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, GZIP_LEVEL, mtime=0)
+
+
+def negotiate(accept_encodings):
+    """The encoding to use for a request's parsed Accept-Encoding, or None"""
+    if brotli is not None and accept_encodings['br']:
+        return 'br'
+    if accept_encodings['gzip']:
+        return 'gzip'
+    return None
+
+
+def init_app(app):
+    app.config.setdefault('COMPRESSION', True)
+    app.config.setdefault('COMPRESS_MIN_BYTES', MIN_BYTES)
+
+    @app.after_request
+    def compress_response(response):
+        if not app.config['COMPRESSION']:
+            return response
+        if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+                or response.mimetype not in MIMETYPES or 'Content-Encoding' in response.headers
+                or 'no-transform' in response.headers.get('Cache-Control', '')):
+            return response
+        data = response.get_data()
+        if len(data) < app.config['COMPRESS_MIN_BYTES']:
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = negotiate(request.accept_encodings)
+        if encoding is None:
+            return response
+        compressed = encode(data, encoding)
+        if len(compressed) >= len(data):
+            return response
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+        tag, weak = response.get_etag()
+        if tag and not weak:
+            response.set_etag(tag, weak=True)
+        return response
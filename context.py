@@ -0,0 +1,283 @@
+"""Project context for AI prompts, retrieved locally and packed into a token budget.
+
+Before a prompt goes to the model, assemble() picks what the author has
+already written that the prompt is about:
+
+- characters named in the prompt (found with the mention automaton, see
+  mentions.py), then the best bm25 matches in the characters FTS index,
+- the relationships between those characters,
+- timeline events that match the prompt in the timeline FTS index,
+- passages from the best matching chapters: the chapters FTS index picks
+  a few chapters, which are cut into PASSAGE_WORDS-word windows and the
+  windows ranked with BM25 among themselves.
+
+Candidates of all kinds are then taken in order of priority, the kind's
+WEIGHTS entry divided by its rank within the kind, and packed greedily
+until the token budget is spent. Token counts are estimated by
+estimate_tokens(), a fixed rule rather than the model's tokenizer, so
+assembly is deterministic and needs no network.
+
+Assembled contexts are cached per (user, prompt hash, budget,
+data_version). stats.data_version changes on every edit to the project,
+so a cached context is never older than the data it was built from.
+"""
+
+import hashlib
+import math
+import re
+from collections import Counter, namedtuple
+
+import generation
+import mentions
+import search
+import stats
+
+BUDGET = 1500
+CACHE_SIZE = 512
+CACHE_TTL = 600
+MAX_TERMS = 24
+CANDIDATES = 10
+CANDIDATE_CHAPTERS = 8
+PASSAGE_WORDS = 120
+FIELD_CHARS = 240
+K1 = 1.2
+B = 0.75
+
+# kind -> priority of its best candidate, and the section it goes in
+WEIGHTS = {'character': 1.0, 'passage': 0.9, 'event': 0.8, 'relationship': 0.6}
+SECTIONS = (
+    ('character', 'Characters'),
+    ('relationship', 'Relationships'),
+    ('event', 'Timeline'),
+    ('passage', 'From the manuscript'),
+)
+
+STOPWORDS = frozenset('''
+    a about above after again all also am an and any are as at be because been before being
+    below between both but by can could did do does doing down during each few for from
+    further had has have having he her here hers herself him himself his how i if in into is
+    it its itself just me more most my myself no nor not now of off on once only or other our
+    ours out over own same she should so some such than that the their theirs them then there
+    these they this those through to too under until up very was we were what when where
+    which while who whom why will with would you your yours write create make describe give
+    scene character dialogue story chapter please
+'''.split())
+
+Context = namedtuple('Context', ['text', 'tokens', 'counts'])
+Candidate = namedtuple('Candidate', ['priority', 'kind', 'rank', 'text', 'tokens'])
+
+_PIECE_RE = re.compile(r'\w+|[^\w\s]')
+_WORD_RE = re.compile(r'\w+')
+
+_cache = generation.TTLCache(CACHE_SIZE, CACHE_TTL)
+
+
+def estimate_tokens(text):
+    """Roughly what a BPE tokenizer would count: ~4 characters per word piece, 1 per symbol"""
+    return sum((len(piece) + 3) // 4 if piece[0].isalnum() or piece[0] == '_' else 1
+               for piece in _PIECE_RE.findall(text))
+
+
+def stem(word):
+    """Strip a few English endings, so "walked" finds "walks" in a passage"""
+    word = word.lower()
+    for suffix in ("'s", 'ing', 'ed', 'es', 's'):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)]
+    return word
+
+
+def keywords(prompt):
+    """The prompt's distinct content words, in order"""
+    terms = [word.lower() for word in search.parse_terms(prompt)]
+    return list(dict.fromkeys(term.rstrip('*') for term in terms
+                              if term not in STOPWORDS and len(term) > 1))[:MAX_TERMS]
+
+
+def _fts_query(kind, user_id, terms):
+    """Any of the terms, within one author's rows (see search.py)"""
+    return search.scoped_query(kind, user_id, ' OR '.join(f'"{term}"' for term in terms))
+
+
+def _ranked(db, kind, user_id, terms, limit):
+    """Row ids of the best bm25 matches of one FTS mirror"""
+    if not terms:
+        return []
+    fts, _, _, weights = search.SOURCES[kind]
+    rank = f"bm25({fts}, 0.0, {', '.join(str(w) for w in weights)})"
+    return [row[0] for row in db.execute(f'''SELECT rowid FROM {fts} WHERE {fts} MATCH ?
+                                             ORDER BY {rank} LIMIT ?''',
+                                         (_fts_query(kind, user_id, terms), limit))]
+
+
+def _clip(text, limit=FIELD_CHARS):
+    text = ' '.join((text or '').split())
+    if len(text) <= limit:
+        return text
+    return text[:limit].rpartition(' ')[0] + '…'
+
+
+def _line(head, detail=None, separator=': '):
+    return f'- {head}{separator}{detail}' if detail else f'- {head}'
+
+
+def _characters(db, user_id, prompt, terms):
+    """(id, line) for the characters named in the prompt, then the best matches"""
+    named = mentions.get_matcher(db, user_id).scan(prompt)
+    ids = sorted(named, key=lambda character_id: named[character_id][1])
+    ids += [character_id for character_id in _ranked(db, 'character', user_id, terms, CANDIDATES)
+            if character_id not in named]
+    if not ids:
+        return []
+    placeholders = ', '.join('?' * len(ids))
+    rows = {row['id']: row for row in db.execute(
+        f'''SELECT id, name, age, role, description, personality, background FROM characters
+            WHERE user_id = ? AND id IN ({placeholders})''', (user_id, *ids))}
+    lines = []
+    for character_id in ids:
+        row = rows.get(character_id)
+        if row is None:
+            continue
+        about = [row['role']] if row['role'] else []
+        if row['age']:
+            about.append(f"age {row['age']}")
+        head = f"{row['name']} ({', '.join(about)})" if about else row['name']
+        details = '; '.join(f'{label}: {_clip(row[column])}'
+                            for label, column in (('looks', 'description'), ('personality', 'personality'),
+                                                  ('background', 'background'))
+                            if row[column])
+        lines.append((character_id, _line(head, details, ' — ')))
+    return lines
+
+
+def _relationships(db, user_id, character_ids):
+    """Lines for relationships touching the candidate characters, both ends known first"""
+    if not character_ids:
+        return []
+    rank = {character_id: n for n, character_id in enumerate(character_ids)}
+    placeholders = ', '.join('?' * len(character_ids))
+    rows = db.execute(f'''SELECT r.relationship_type, r.description, r.character1_id, r.character2_id,
+                                 a.name AS name1, b.name AS name2
+                          FROM relationships r
+                          JOIN characters a ON a.id = r.character1_id
+                          JOIN characters b ON b.id = r.character2_id
+                          WHERE r.user_id = ? AND (r.character1_id IN ({placeholders})
+                                                   OR r.character2_id IN ({placeholders}))''',
+                      (user_id, *character_ids, *character_ids)).fetchall()
+    unknown = len(character_ids)
+
+    def order(row):
+        ends = sorted((rank.get(row['character1_id'], unknown), rank.get(row['character2_id'], unknown)))
+        return ends[1], ends[0], row['name1'], row['name2']
+
+    return [_line(f"{row['name1']} — {row['relationship_type']} — {row['name2']}", _clip(row['description']))
+            for row in sorted(rows, key=order)[:CANDIDATES * 2]]
+
+
+def _events(db, user_id, terms):
+    ids = _ranked(db, 'event', user_id, terms, CANDIDATES)
+    if not ids:
+        return []
+    placeholders = ', '.join('?' * len(ids))
+    rows = {row['id']: row for row in db.execute(
+        f'SELECT id, event_title, event_date, description FROM timeline WHERE user_id = ? AND id IN ({placeholders})',
+        (user_id, *ids))}
+    lines = []
+    for event_id in ids:
+        row = rows.get(event_id)
+        if row is not None:
+            head = f"[{row['event_date']}] {row['event_title']}" if row['event_date'] else row['event_title']
+            lines.append(_line(head, _clip(row['description'])))
+    return lines
+
+
+def _passages(db, user_id, terms):
+    """Best PASSAGE_WORDS-word windows of the best matching chapters, by BM25"""
+    chapter_ids = _ranked(db, 'chapter', user_id, terms, CANDIDATE_CHAPTERS)
+    if not chapter_ids:
+        return []
+    stems = {stem(term) for term in terms}
+    memo = {}
+
+    def matches(word):
+        """Stems of `word` that are query terms; a chapter repeats few distinct words"""
+        found = memo.get(word)
+        if found is None:
+            found = memo[word] = tuple(s for s in map(stem, _WORD_RE.findall(word)) if s in stems)
+        return found
+
+    # The FTS mirror already holds each chapter as plain text
+    fts, _, (title_column, body_column), _ = search.SOURCES['chapter']
+    windows = []
+    for chapter_id in chapter_ids:
+        title, body = db.execute(f'SELECT {title_column}, {body_column} FROM {fts} WHERE rowid = ?',
+                                 (chapter_id,)).fetchone()
+        words = (body or '').split()
+        for start in range(0, len(words), PASSAGE_WORDS):
+            window = words[start:start + PASSAGE_WORDS]
+            hits = Counter(s for word in window for s in matches(word))
+            windows.append((title, start, window, hits, len(window), start + PASSAGE_WORDS < len(words)))
+    if not windows:
+        return []
+
+    # BM25 with document frequencies taken over the candidate windows
+    frequency = Counter(s for window in windows for s in window[3])
+    average = sum(window[4] for window in windows) / len(windows) or 1
+    idf = {s: math.log(1 + (len(windows) - n + 0.5) / (n + 0.5)) for s, n in frequency.items()}
+    scored = []
+    for title, start, window, hits, length, more in windows:
+        if not hits:
+            continue
+        norm = K1 * (1 - B + B * length / average)
+        score = sum(idf[s] * n * (K1 + 1) / (n + norm) for s, n in hits.items())
+        scored.append((-score, title, start, window, more))
+    scored.sort(key=lambda item: item[:3])
+    return [_line(title, ('…' if start else '') + ' '.join(window) + ('…' if more else ''))
+            for _, title, start, window, more in scored[:CANDIDATES]]
+
+
+def candidates(db, user_id, prompt):
+    """Every Candidate for a prompt, before packing"""
+    terms = keywords(prompt)
+    characters = _characters(db, user_id, prompt, terms)
+    found = {
+        'character': [line for _, line in characters],
+        'relationship': _relationships(db, user_id, [character_id for character_id, _ in characters]),
+        'event': _events(db, user_id, terms),
+        'passage': _passages(db, user_id, terms),
+    }
+    return [Candidate(WEIGHTS[kind] / (rank + 1), kind, rank, text, estimate_tokens(text) + 1)
+            for kind, lines in found.items() for rank, text in enumerate(lines)]
+
+
+def pack(items, budget):
+    """Greedily take the highest priority candidates that still fit; returns a Context"""
+    headers = {kind: f'{title}:' for kind, title in SECTIONS}
+    chosen = {kind: [] for kind, _ in SECTIONS}
+    used = 0
+    for item in sorted(items, key=lambda item: (-item.priority, item.kind, item.rank)):
+        cost = item.tokens + (0 if chosen[item.kind] else estimate_tokens(headers[item.kind]) + 2)
+        if used + cost > budget:
+            continue
+        chosen[item.kind].append(item)
+        used += cost
+    blocks = ['\n'.join([headers[kind]] + [item.text for item in sorted(chosen[kind], key=lambda i: i.rank)])
+              for kind, _ in SECTIONS if chosen[kind]]
+    return Context('\n\n'.join(blocks), used, {kind: len(chosen[kind]) for kind, _ in SECTIONS})
+
+
+def assemble(db, user_id, prompt, budget=BUDGET):
+    """The Context to send with `prompt`, from the cache when the project has not changed"""
+    if budget <= 0 or not prompt:
+        return Context('', 0, {kind: 0 for kind, _ in SECTIONS})
+    digest = hashlib.sha1(prompt.encode('utf-8')).hexdigest()
+    key = (user_id, digest, budget, stats.data_version(db, user_id))
+    context = _cache.get(key)
+    if context is None:
+        context = pack(candidates(db, user_id, prompt), budget)
+        _cache.set(key, context)
+    return context
+
+
+def cache_stats():
+    return {'size': len(_cache), 'hits': _cache.hits, 'misses': _cache.misses}
@@ -0,0 +1,182 @@
+"""SQLite connection management for NarrEyes.
+
+Opening a connection and applying pragmas on every request is slow, and the
+default rollback journal makes readers wait for writers. This module keeps a
+small pool of pre-warmed connections per database file, in WAL mode, that
+app.py checks out once per request (see get_db / close_db).
+"""
+
+import queue
+import sqlite3
+import threading
+
+import textstats
+
+# Pragmas applied to every new connection
+PRAGMAS = (
+    ('synchronous', 'NORMAL'),     # safe with WAL, avoids an fsync per commit
+    ('cache_size', -16000),        # 16 MB page cache per connection
+    ('mmap_size', 134217728),      # 128 MB memory-mapped reads
+    ('busy_timeout', 5000),        # wait up to 5s for a lock instead of failing
+    ('temp_store', 'MEMORY'),
+    ('foreign_keys', 'ON'),        # enforce REFERENCES and run the ON DELETE actions
+)
+
+DEFAULT_POOL_SIZE = 8
+DEFAULT_ACQUIRE_TIMEOUT = 10
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes free within the acquire timeout"""
+
+
+def connect(path, readonly=False):
+    """Open a configured connection to the database at `path`"""
+    if readonly:
+        conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True, check_same_thread=False)
+    else:
+        conn = sqlite3.connect(path, check_same_thread=False)
+        # journal_mode is persistent, but setting it needs a writable handle
+        conn.execute('PRAGMA journal_mode = WAL')
+
+    conn.row_factory = sqlite3.Row
+    # Used by the full-text search triggers to index chapter HTML as text
+    conn.create_function('strip_html', 1, textstats.strip_html, deterministic=True)
+    for name, value in PRAGMAS:
+        conn.execute(f'PRAGMA {name} = {value}')
+    if readonly:
+        conn.execute('PRAGMA query_only = ON')
+    return conn
+
+
+class ConnectionPool:
+    """Bounded pool of connections to one database file.
+
+    At most `size` connections are ever open. Callers that find the pool
+    exhausted block for up to `timeout` seconds. A size of 0 disables pooling:
+    every acquire opens a new connection and every release closes it.
+    """
+
+    def __init__(self, path, size=DEFAULT_POOL_SIZE, readonly=False,
+                 timeout=DEFAULT_ACQUIRE_TIMEOUT):
+        self.path = path
+        self.size = size
+        self.readonly = readonly
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def prewarm(self, count=None):
+        """Open connections ahead of the first requests"""
+        count = self.size if count is None else min(count, self.size)
+        warmed = []
+        while len(warmed) < count:
+            with self._lock:
+                if self._created >= self.size:
+                    break
+                self._created += 1
+            try:
+                warmed.append(connect(self.path, self.readonly))
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+        for conn in warmed:
+            self._idle.put(conn)
+        return len(warmed)
+
+    def acquire(self):
+        """Check a connection out of the pool"""
+        if self.size == 0:
+            return connect(self.path, self.readonly)
+
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            can_create = self._created < self.size
+            if can_create:
+                self._created += 1
+        if can_create:
+            try:
+                return connect(self.path, self.readonly)
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise PoolTimeout(f'No database connection free after {self.timeout}s')
+
+    def release(self, conn):
+        """Return a connection, discarding any uncommitted work"""
+        if self.size == 0:
+            conn.close()
+            return
+
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            # Broken connection: drop it and let the pool open a new one
+            with self._lock:
+                self._created -= 1
+            conn.close()
+            return
+        self._idle.put(conn)
+
+    def close_all(self):
+        """Close every idle connection (used on shutdown and in benchmarks)"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._created -= 1
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(path, readonly=False, size=DEFAULT_POOL_SIZE):
+    """Return the process-wide pool for `path`, creating it on first use"""
+    key = (path, readonly)
+    pool = _pools.get(key)
+    if pool is None or pool.size != size:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None or pool.size != size:
+                if pool is not None:
+                    pool.close_all()
+                pool = ConnectionPool(path, size=size, readonly=readonly)
+                pool.prewarm()
+                _pools[key] = pool
+    return pool
+
+
+def close_pools():
+    """Close all pools in this process"""
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close_all()
+        _pools.clear()
+
+
+def add_column(db, table, column, declaration):
+    """Add a column to an existing table if it is not there yet.
+
+    Returns True when the column was added, so callers can backfill it.
+    """
+    columns = {row[1] for row in db.execute(f'PRAGMA table_info({table})')}
+    if column in columns:
+        return False
+    db.execute(f'ALTER TABLE {table} ADD COLUMN {column} {declaration}')
+    return True
@@ -0,0 +1,363 @@
+"""Stream a manuscript out as EPUB, Markdown, plain text or JSON.
+
+Every exporter is a generator. Chapters are read one row at a time from a
+cursor in reading order and turned into output as they go by, so a
+Flask Response can send the book in chunks and peak memory is one chapter,
+not the whole book. EPUB is a zip written into an in-memory sink that is
+drained after every chapter. Because the sink cannot seek, each entry
+carries a data descriptor, which every EPUB reader accepts.
+
+backup() is a full-project JSON dump (profile, characters, chapters,
+timeline, relationships) read inside one transaction, so it is a
+consistent snapshot even while the author keeps writing.
+"""
+
+import json
+import re
+import uuid
+import zipfile
+from datetime import datetime, timezone
+from html.parser import HTMLParser
+
+from markupsafe import escape
+
+CHUNK_SIZE = 64 * 1024
+BACKUP_VERSION = 1
+
+# format -> (mimetype, file extension); Werkzeug adds the charset to text/*
+FORMATS = {
+    'epub': ('application/epub+zip', 'epub'),
+    'md': ('text/markdown', 'md'),
+    'txt': ('text/plain', 'txt'),
+    'json': ('application/json', 'json'),
+    'backup': ('application/json', 'json'),
+}
+
+_SPACE_RE = re.compile(r'\s+')
+_MD_ESCAPE_RE = re.compile(r'([\\`*_\[\]<>])')
+
+
+def _md_escape(text):
+    return _MD_ESCAPE_RE.sub(r'\\\1', text)
+
+
+class _Renderer(HTMLParser):
+    """Rewrite chapter HTML from the editor as Markdown, text or XHTML.
+
+    Only the structure the editor produces is kept: paragraphs, headings,
+    emphasis, line breaks, quotes, lists and scene breaks. XHTML output is
+    always well-formed, whatever the input looked like.
+    """
+
+    BLOCKS = {'p', 'div', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'blockquote', 'li', 'pre', 'ul', 'ol'}
+    XHTML_TAGS = {'b': 'strong', 'strong': 'strong', 'i': 'em', 'em': 'em', 'u': 'u', 's': 's',
+                  'sub': 'sub', 'sup': 'sup', 'p': 'p', 'div': 'p', 'h1': 'h2', 'h2': 'h3',
+                  'h3': 'h4', 'h4': 'h5', 'h5': 'h6', 'h6': 'h6', 'blockquote': 'blockquote',
+                  'ul': 'ul', 'ol': 'ol', 'li': 'li', 'pre': 'pre'}
+
+    def __init__(self, mode):
+        super().__init__(convert_charrefs=True)
+        self.mode = mode
+        self.out = []
+        self.block = []
+        self.prefix = ''
+        self.quote = 0
+        self.open = []
+        self.skip = 0
+
+    def render(self, html):
+        self.feed(html or '')
+        self.close()
+        self.flush()
+        while self.open:
+            self.out.append(f'</{self.open.pop()}>')
+        text = ''.join(self.out)
+        self.out = []
+        return text
+
+    def flush(self):
+        text = ''.join(self.block).strip()
+        self.block = []
+        if text:
+            quote = '> ' * self.quote if self.mode == 'md' else '    ' * self.quote
+            self.out.append(f'{quote}{self.prefix}{text}\n\n')
+        self.prefix = ''
+
+    def handle_starttag(self, tag, attrs):
+        classes = (dict(attrs).get('class') or '').split()
+        if self.mode == 'xhtml':
+            if tag == 'br' or tag == 'hr':
+                self.out.append(f'<{tag}/>')
+            elif tag in self.XHTML_TAGS:
+                name = self.XHTML_TAGS[tag]
+                kept = ' '.join(c for c in classes if c.replace('-', '').isalnum())
+                self.out.append(f'<{name} class="{kept}">' if kept else f'<{name}>')
+                self.open.append(name)
+            return
+
+        if tag in self.BLOCKS:
+            self.flush()
+            if tag == 'blockquote':
+                self.quote += 1
+            elif tag == 'li':
+                self.prefix = '- '
+            elif tag[0] == 'h' and self.mode == 'md':
+                self.prefix = '#' * min(int(tag[1]) + 2, 6) + ' '
+            if 'scene-break' in classes:
+                self.out.append('* * *\n\n')
+                self.skip += 1
+        elif tag == 'br':
+            self.block.append('  \n' if self.mode == 'md' else '\n')
+        elif tag == 'hr':
+            self.flush()
+            self.out.append('* * *\n\n')
+        elif self.mode == 'md' and tag in ('strong', 'b'):
+            self.block.append('**')
+        elif self.mode == 'md' and tag in ('em', 'i'):
+            self.block.append('*')
+
+    def handle_endtag(self, tag):
+        if self.mode == 'xhtml':
+            name = self.XHTML_TAGS.get(tag)
+            if name in self.open:
+                # Close anything left open inside it, so the output nests
+                while self.open:
+                    last = self.open.pop()
+                    self.out.append(f'</{last}>')
+                    if last == name:
+                        break
+            return
+
+        if tag in self.BLOCKS:
+            if self.skip:
+                self.skip -= 1
+                self.block = []
+            self.flush()
+            if tag == 'blockquote' and self.quote:
+                self.quote -= 1
+        elif self.mode == 'md' and tag in ('strong', 'b'):
+            self.block.append('**')
+        elif self.mode == 'md' and tag in ('em', 'i'):
+            self.block.append('*')
+
+    def handle_data(self, data):
+        if self.mode == 'xhtml':
+            self.out.append(str(escape(data)))
+            return
+        if self.skip:
+            return
+        data = _SPACE_RE.sub(' ', data)
+        if not self.block:
+            data = data.lstrip()
+        if self.mode == 'md':
+            data = _md_escape(data)
+        self.block.append(data)
+
+
+def to_markdown(html):
+    return _Renderer('md').render(html)
+
+
+def to_text(html):
+    return _Renderer('txt').render(html)
+
+
+def to_xhtml(html):
+    return _Renderer('xhtml').render(html)
+
+
+def iter_chapters(db, user_id, columns='id, title, content'):
+    """Yield the author's chapters in reading order, one dict at a time.
+
+    chapter_number is the position in that order, as shown in the app.
+    """
+    cursor = db.execute(f'''SELECT {columns} FROM chapters WHERE user_id = ?
+                            ORDER BY sort_key, id''', (user_id,))
+    for number, row in enumerate(cursor, 1):
+        chapter = dict(zip(row.keys(), row))
+        chapter['chapter_number'] = number
+        yield chapter
+
+
+def buffered(pieces, size=CHUNK_SIZE):
+    """Join small strings into chunks of about `size` characters"""
+    chunk = []
+    length = 0
+    for piece in pieces:
+        chunk.append(piece)
+        length += len(piece)
+        if length >= size:
+            yield ''.join(chunk)
+            chunk, length = [], 0
+    if chunk:
+        yield ''.join(chunk)
+
+
+def _heading(chapter):
+    return f"Chapter {chapter['chapter_number']}: {chapter['title']}"
+
+
+def markdown(db, user_id, title):
+    yield f'# {_md_escape(title)}\n\n'
+    for chapter in iter_chapters(db, user_id):
+        yield f'## {_md_escape(_heading(chapter))}\n\n'
+        yield to_markdown(chapter['content'])
+
+
+def text(db, user_id, title):
+    yield f'{title}\n{"=" * len(title)}\n\n'
+    for chapter in iter_chapters(db, user_id):
+        heading = _heading(chapter)
+        yield f'\n{heading}\n{"-" * len(heading)}\n\n'
+        yield to_text(chapter['content'])
+
+
+def _timestamp():
+    return datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def _json_array(rows, drop=()):
+    first = True
+    for row in rows:
+        item = {key: row[key] for key in row.keys() if key not in drop}
+        yield ('' if first else ',\n') + json.dumps(item, ensure_ascii=False)
+        first = False
+
+
+def chapters_json(db, user_id, title):
+    """The manuscript as {"title", "exported_at", "chapters": [...]}"""
+    yield json.dumps({'title': title, 'exported_at': _timestamp()}, ensure_ascii=False)[:-1]
+    yield ', "chapters": [\n'
+    yield from _json_array(iter_chapters(
+        db, user_id, 'id, title, status, word_count, content, created_at, updated_at'))
+    yield '\n]}\n'
+
+
+# Section -> query for backup(); every table is dumped in full except user_id
+BACKUP_SECTIONS = {
+    'characters': 'SELECT * FROM characters WHERE user_id = ? ORDER BY id',
+    'chapters': 'SELECT * FROM chapters WHERE user_id = ? ORDER BY sort_key, id',
+    'timeline': 'SELECT * FROM timeline WHERE user_id = ? ORDER BY id',
+    'relationships': 'SELECT * FROM relationships WHERE user_id = ? ORDER BY id',
+}
+
+
+def backup(db, user_id, title=None):
+    """Full-project JSON backup, read as one consistent snapshot"""
+    started = not db.in_transaction
+    if started:
+        db.execute('BEGIN')
+    try:
+        user = db.execute('SELECT id, username, email, created_at FROM users WHERE id = ?',
+                          (user_id,)).fetchone()
+        header = {'format': 'narreyes-backup', 'version': BACKUP_VERSION,
+                  'exported_at': _timestamp(), 'user': dict(user) if user else None}
+        yield json.dumps(header, ensure_ascii=False)[:-1]
+        for section, query in BACKUP_SECTIONS.items():
+            yield f',\n"{section}": [\n'
+            yield from _json_array(db.execute(query, (user_id,)), drop=('user_id',))
+            yield '\n]'
+        yield '}\n'
+    finally:
+        if started:
+            db.rollback()
+
+
+class _ZipSink:
+    """Write-only file object that hands back whatever was written since the last drain"""
+
+    def __init__(self):
+        self.parts = []
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.parts)
+        self.parts = []
+        return data
+
+
+_XHTML_PAGE = '''<?xml version="1.0" encoding="utf-8"?>
+<!DOCTYPE html>
+<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops">
+<head><meta charset="utf-8"/><title>{title}</title></head>
+<body>
+'''
+
+_CONTAINER = '''<?xml version="1.0" encoding="utf-8"?>
+<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">
+  <rootfiles><rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/></rootfiles>
+</container>
+'''
+
+
+def epub(db, user_id, title, author=''):
+    """EPUB 3 book, one XHTML document per chapter, yielded as zip bytes"""
+    sink = _ZipSink()
+    book = zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED)
+    # The mimetype entry must come first and be stored uncompressed
+    book.writestr('mimetype', 'application/epub+zip', compress_type=zipfile.ZIP_STORED)
+    book.writestr('META-INF/container.xml', _CONTAINER)
+    yield sink.drain()
+
+    contents = []  # (file name, heading): small even for thousands of chapters
+    for number, chapter in enumerate(iter_chapters(db, user_id), 1):
+        name = f'chapter-{number:04d}.xhtml'
+        heading = str(escape(_heading(chapter)))
+        with book.open(f'OEBPS/{name}', 'w') as page:
+            page.write(_XHTML_PAGE.format(title=heading).encode())
+            page.write(f'<h1>{heading}</h1>\n'.encode())
+            page.write(to_xhtml(chapter['content']).encode())
+            page.write(b'\n</body>\n</html>\n')
+        contents.append((name, heading))
+        yield sink.drain()
+
+    title, author = str(escape(title)), str(escape(author))
+    nav = ''.join(f'      <li><a href="{name}">{heading}</a></li>\n' for name, heading in contents)
+    book.writestr('OEBPS/nav.xhtml', _XHTML_PAGE.format(title=title) +
+                  f'<nav epub:type="toc" id="toc"><h1>{title}</h1>\n    <ol>\n{nav}    </ol>\n</nav>\n'
+                  '</body>\n</html>\n')
+    manifest = ''.join(f'    <item id="c{i}" href="{name}" media-type="application/xhtml+xml"/>\n'
+                       for i, (name, _) in enumerate(contents, 1))
+    spine = ''.join(f'    <itemref idref="c{i}"/>\n' for i in range(1, len(contents) + 1))
+    book.writestr('OEBPS/content.opf', f'''<?xml version="1.0" encoding="utf-8"?>
+<package xmlns="http://www.idpf.org/2007/opf" version="3.0" unique-identifier="book-id">
+  <metadata xmlns:dc="http://purl.org/dc/elements/1.1/">
+    <dc:identifier id="book-id">urn:uuid:{uuid.uuid4()}</dc:identifier>
+    <dc:title>{title}</dc:title>
+    <dc:creator>{author}</dc:creator>
+    <dc:language>en</dc:language>
+    <meta property="dcterms:modified">{_timestamp()}</meta>
+  </metadata>
+  <manifest>
+    <item id="nav" href="nav.xhtml" media-type="application/xhtml+xml" properties="nav"/>
+{manifest}  </manifest>
+  <spine>
+{spine}  </spine>
+</package>
+''')
+    book.close()
+    yield sink.drain()
+
+
+EXPORTERS = {
+    'epub': epub,
+    'md': markdown,
+    'txt': text,
+    'json': chapters_json,
+    'backup': backup,
+}
+
+
+def export(db, user_id, export_format, title, author=''):
+    """Chunks (bytes) of the export in `export_format`"""
+    if export_format == 'epub':
+        yield from epub(db, user_id, title, author)
+        return
+    for chunk in buffered(EXPORTERS[export_format](db, user_id, title)):
+        yield chunk.encode()
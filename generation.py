@@ -0,0 +1,371 @@
+"""AI text generation through OpenRouter, off the request thread.
+
+A Generator owns one keep-alive HTTP session (so TLS handshakes are paid
+once per worker connection, not once per prompt), a small thread pool that
+works through generation jobs, and an LRU cache with a TTL keyed by
+(ai_type, model, prompt, context), where context is the project notes
+sent along with the prompt (see context.py). Submitting a prompt returns
+a Job at once:
+
+- a cached result comes back as a finished job,
+- a prompt that is already being generated returns the running job, so
+  identical requests share one upstream call,
+- anything else is queued for the pool.
+
+With streaming on, the worker asks for `stream: true` and appends each
+chunk to the job as it arrives, so the page can show the first words long
+before the completion is finished. When the last browser following a
+streaming job goes away, and no other owner of the job is waiting for it
+by polling, the upstream response is closed, which stops the model from
+spending more tokens on it.
+
+Failed or cancelled generations are reported on the job but never cached.
+The upstream URL is configurable, so everything can run against a local
+stub server (see benchmarks/ai_stub.py).
+"""
+
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+API_URL = 'https://openrouter.ai/api/v1/chat/completions'
+WORKERS = 4
+CACHE_SIZE = 256
+CACHE_TTL = 3600
+JOB_TTL = 600
+TIMEOUT = (5, 90)  # connect, read
+
+# Best models for each type
+MODELS = {
+    'character': 'meta-llama/llama-4-maverick:free',
+    'scene': 'google/gemini-2.0-flash-exp:free',
+    'dialogue': 'mistralai/mistral-nemo-instruct:free',
+    'description': 'meta-llama/llama-3.1-70b-instruct:free'
+}
+DEFAULT_MODEL = 'meta-llama/llama-4-maverick:free'
+
+# System instructions
+INSTRUCTIONS = {
+    'character': "You are a character development expert. Create detailed, realistic character descriptions with personality, background, and motivations.",
+    'scene': "You are a scene-setting expert. Write vivid, immersive scenes using sensory details and atmosphere.",
+    'dialogue': "You are a dialogue coach. Write natural, engaging conversations that reveal character.",
+    'description': "You are a descriptive writer. Create rich, detailed descriptions with vivid imagery."
+}
+DEFAULT_INSTRUCTION = "You are a creative writing assistant."
+CONTEXT_INTRO = ("Notes from the author's project follow. Stay consistent with them where they are "
+                 "relevant and ignore them where they are not.\n\n")
+
+# Upstream status codes with a message for the author
+STATUS_MESSAGES = {
+    503: "⏳ Model is loading. Please wait 30-60 seconds and try again.",
+    402: "💳 OpenRouter credits exhausted. Please use free models.",
+    401: "❌ Invalid API Key. Check your OpenRouter key.",
+}
+
+
+class GenerationError(Exception):
+    """The upstream call failed; the message is shown to the author"""
+
+
+class Cancelled(Exception):
+    """Everyone following a streaming job disconnected"""
+
+
+def build_payload(prompt, ai_type, context=''):
+    messages = [{"role": "system", "content": INSTRUCTIONS.get(ai_type, DEFAULT_INSTRUCTION)}]
+    if context:
+        messages.append({"role": "system", "content": CONTEXT_INTRO + context})
+    messages.append({"role": "user", "content": prompt})
+    return {
+        "model": MODELS.get(ai_type, DEFAULT_MODEL),
+        "messages": messages,
+        "temperature": 0.8,
+        "max_tokens": 800,
+        "top_p": 0.92
+    }
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after `ttl` seconds"""
+
+    def __init__(self, size=CACHE_SIZE, ttl=CACHE_TTL):
+        self.size = size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None and item[0] > time.monotonic():
+                self._items.move_to_end(key)
+                self.hits += 1
+                return item[1]
+            if item is not None:
+                del self._items[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        with self._lock:
+            self._items[key] = (time.monotonic() + self.ttl, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+
+class Job:
+    """One generation request, shared by everyone who asked for the same prompt"""
+
+    def __init__(self, key):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.status = 'queued'
+        self.result = None
+        self.error = None
+        self.cached = False
+        self.created = time.monotonic()
+        self.first_chunk = None
+        self.owners = set()
+        self.waiting = set()  # owners who asked for the job and are not following its stream
+        self.chunks = []
+        self.listeners = 0
+        self.cancelled = False
+        self.done = threading.Event()
+        self._changed = threading.Condition()
+
+    def append(self, text):
+        with self._changed:
+            if self.first_chunk is None:
+                self.first_chunk = time.monotonic()
+            self.chunks.append(text)
+            self._changed.notify_all()
+
+    def finish(self, result=None, error=None, status=None):
+        with self._changed:
+            self.result = result
+            self.error = error
+            self.status = status or ('error' if error else 'done')
+            self.done.set()
+            self._changed.notify_all()
+
+    def wait(self, timeout=None):
+        return self.done.wait(timeout)
+
+    def join(self, owner):
+        with self._changed:
+            self.owners.add(owner)
+            self.waiting.add(owner)
+
+    def follow(self, owner=None, heartbeat=15):
+        """Yield chunks as they arrive until the job ends.
+
+        None is yielded whenever `heartbeat` seconds pass without news, so
+        an SSE response can send a keep-alive. Closing the generator (the
+        client went away) cancels the job if nobody else is following it
+        and no other owner is waiting for it by polling.
+        """
+        with self._changed:
+            self.listeners += 1
+            self.waiting.discard(owner)
+        sent = 0
+        try:
+            while True:
+                with self._changed:
+                    if sent == len(self.chunks) and not self.done.is_set():
+                        self._changed.wait(heartbeat)
+                    new = self.chunks[sent:]
+                    finished = self.done.is_set()
+                sent += len(new)
+                for chunk in new:
+                    yield chunk
+                if finished and sent == len(self.chunks):
+                    return
+                if not new:
+                    yield None
+        finally:
+            with self._changed:
+                self.listeners -= 1
+                if self.listeners == 0 and not self.waiting and not self.done.is_set():
+                    self.cancelled = True
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'status': self.status,
+            'result': self.result,
+            'error': self.error,
+            'cached': self.cached,
+            'ttft_ms': round((self.first_chunk - self.created) * 1000) if self.first_chunk else None,
+        }
+
+
+class Generator:
+    """Keep-alive HTTP session, job queue and result cache for one upstream API"""
+
+    def __init__(self, api_url=API_URL, api_key='', workers=WORKERS, stream=True,
+                 cache_size=CACHE_SIZE, cache_ttl=CACHE_TTL, referer='http://localhost:5000'):
+        self.api_url = api_url
+        self.stream = stream
+        self.cache = TTLCache(cache_size, cache_ttl)
+        self.upstream_calls = 0
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({
+            "Authorization": f"Bearer {api_key}",
+            "HTTP-Referer": referer,
+            "X-Title": "NarrEyes",
+            "Content-Type": "application/json"
+        })
+
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix='ai')
+        self._jobs = {}
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def cache_key(prompt, ai_type, context=''):
+        return (ai_type, MODELS.get(ai_type, DEFAULT_MODEL), prompt, context)
+
+    def submit(self, prompt, ai_type, owner=None, context=''):
+        """Queue a prompt (or join or answer it from cache) and return its Job"""
+        key = self.cache_key(prompt, ai_type, context)
+        with self._lock:
+            self._prune()
+            job = self._inflight.get(key)
+            if job is None or job.cancelled:
+                job = Job(key)
+                cached = self.cache.get(key)
+                if cached is not None:
+                    job.cached = True
+                    job.finish(cached)
+                else:
+                    self._inflight[key] = job
+                    self._executor.submit(self._run, job, prompt, ai_type, context)
+                self._jobs[job.id] = job
+            job.join(owner)
+        return job
+
+    def get_job(self, job_id, owner=None):
+        job = self._jobs.get(job_id)
+        if job is None or owner not in job.owners:
+            return None
+        return job
+
+    def generate(self, prompt, ai_type, timeout=None, context=''):
+        """Blocking helper: submit and wait, returning the text or an error message"""
+        job = self.submit(prompt, ai_type, context=context)
+        if not job.wait(timeout):
+            return "⏳ Still generating, please try again shortly."
+        return job.result if job.status == 'done' else job.error
+
+    def _run(self, job, prompt, ai_type, context=''):
+        if job.cancelled:
+            job.finish(error="Generation cancelled.", status='cancelled')
+            self._forget(job)
+            return
+        job.status = 'running'
+        try:
+            payload = build_payload(prompt, ai_type, context)
+            if self.stream:
+                result = self._request_stream(payload, job)
+            else:
+                result = self._request(payload)
+            self.cache.set(job.key, result)
+            job.finish(result)
+        except Cancelled:
+            job.finish(error="Generation cancelled.", status='cancelled')
+        except GenerationError as e:
+            job.finish(error=str(e))
+        except Exception as e:
+            job.finish(error=f"❌ Error: {str(e)}")
+        finally:
+            self._forget(job)
+
+    def _forget(self, job):
+        with self._lock:
+            if self._inflight.get(job.key) is job:
+                del self._inflight[job.key]
+
+    def _request(self, payload):
+        self.upstream_calls += 1
+        response = self.session.post(self.api_url, json=payload, timeout=TIMEOUT)
+        if response.status_code == 200:
+            return response.json()['choices'][0]['message']['content'].strip()
+        raise GenerationError(STATUS_MESSAGES.get(response.status_code, f"❌ Error {response.status_code}"))
+
+    def _request_stream(self, payload, job):
+        """Relay an SSE chat completion into `job`, returning the full text"""
+        self.upstream_calls += 1
+        with self.session.post(self.api_url, json=dict(payload, stream=True),
+                               timeout=TIMEOUT, stream=True) as response:
+            if response.status_code != 200:
+                response.content  # drain the error body so the connection is reused
+                raise GenerationError(STATUS_MESSAGES.get(response.status_code,
+                                                          f"❌ Error {response.status_code}"))
+            for line in response.iter_lines(decode_unicode=True):
+                if job.cancelled:
+                    # Leaving the with block drops the connection mid-stream,
+                    # which is how the upstream learns to stop
+                    raise Cancelled()
+                if not line or not line.startswith('data:'):
+                    continue  # blank separators and ": processing" comments
+                data = line[5:].strip()
+                if data == '[DONE]':
+                    continue  # read on to the end so the connection can be reused
+                event = json.loads(data)
+                if 'error' in event:
+                    raise GenerationError(f"❌ Error: {event['error'].get('message', 'stream failed')}")
+                text = (event.get('choices') or [{}])[0].get('delta', {}).get('content')
+                if text:
+                    job.append(text)
+        return ''.join(job.chunks).strip()
+
+    def _prune(self):
+        """Forget finished jobs nobody has looked at for JOB_TTL seconds"""
+        cutoff = time.monotonic() - JOB_TTL
+        for job_id in [job_id for job_id, job in self._jobs.items()
+                       if job.done.is_set() and job.created < cutoff]:
+            del self._jobs[job_id]
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self.session.close()
+
+
+_generators = {}
+_generators_lock = threading.Lock()
+
+
+def get_generator(api_url, api_key, workers=WORKERS, stream=True):
+    """Return the process-wide Generator for an upstream, creating it once"""
+    with _generators_lock:
+        generator = _generators.get((api_url, api_key, stream))
+        if generator is None:
+            generator = _generators[(api_url, api_key, stream)] = Generator(api_url, api_key, workers, stream)
+        return generator
+
+
+def close_generators():
+    with _generators_lock:
+        for generator in _generators.values():
+            generator.close()
+        _generators.clear()
@@ -0,0 +1,44 @@
+"""gunicorn settings: gunicorn -c gunicorn.conf.py wsgi:app
+
+A pre-forking master with WEB_CONCURRENCY worker processes (default
+2 x CPUs + 1), each running GUNICORN_THREADS threads so that long AI
+streams and autosave polls do not hold a whole process. The app is
+imported once in the master and forked copy-on-write; create_app() opens
+no connections, and every worker builds its own SQLite pools and AI
+thread pool on first use.
+"""
+
+import multiprocessing
+import os
+
+bind = os.environ.get('BIND', f"0.0.0.0:{os.environ.get('PORT', '8000')}")
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+preload_app = True
+
+# AI generation streams can run for a minute or more
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+graceful_timeout = 30
+keepalive = 5
+
+# Recycle workers now and then so caches and fragmentation cannot grow without bound
+max_requests = 2000
+max_requests_jitter = 200
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.environ.get('LOG_LEVEL', 'info')
+
+
+def worker_exit(server, worker):
+    """Close the worker's connections, AI threads, hashing pool and mention rescans on shutdown"""
+    import database
+    import generation
+    import mentions
+    import passwords
+
+    generation.close_generators()
+    passwords.close_hashers()
+    mentions.shutdown()
+    database.close_pools()
@@ -0,0 +1,309 @@
+"""Opt-in request, SQL and template timing for NarrEyes.
+
+With app.config['INSTRUMENTATION'] on, init_app() records for every
+request:
+
+- its latency, per endpoint and method, in a bucketed histogram from
+  which p50/p95/p99 are estimated,
+- how many SQL statements it ran and how long they took, through an
+  InstrumentedConnection that get_db() hands out instead of the pooled
+  sqlite3 connection; statements slower than SLOW_QUERY_MS are logged,
+- the time spent rendering each template, via Flask's template signals.
+
+Everything is exposed in the Prometheus text format by render(), which
+app.py serves at /metrics. When INSTRUMENTATION is off the hooks return
+at once and get_db() hands out the bare connection.
+
+For a closer look at one request, PROFILING turns on cProfile: a request
+with ?_profile=1 (or a random PROFILE_SAMPLE_RATE share of requests) runs
+under the profiler and its stats are written to PROFILE_DIR as a .prof
+file, readable with `python -m pstats` or snakeviz. Only one request is
+profiled at a time. ?_profile=1 is honoured for the METRICS_TOKEN bearer
+when a token is set, otherwise for logged-in users, and no more profiles
+are written once PROFILE_DIR holds PROFILE_MAX_FILES of them.
+"""
+
+import cProfile
+import logging
+import os
+import random
+import re
+import threading
+import time
+from bisect import bisect_left
+
+from flask import before_render_template, g, request, session, template_rendered
+
+logger = logging.getLogger('narreyes.instrumentation')
+
+# Upper bounds in seconds; the last bucket is +Inf
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+QUANTILES = (0.5, 0.95, 0.99)
+SLOW_QUERY_MS = 100
+PROFILE_MAX_FILES = 100
+
+_SPACE_RE = re.compile(r'\s+')
+
+
+class Histogram:
+    """Prometheus-style cumulative histogram with quantile estimates"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Estimate by linear interpolation inside the bucket holding rank q"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                lower = self.buckets[i - 1] if i else 0.0
+                if i == len(self.buckets):
+                    return lower  # +Inf bucket: the best we can say is "above the last bound"
+                return lower + (self.buckets[i] - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+
+class Metrics:
+    """Thread-safe registry of labelled histograms and counters"""
+
+    def __init__(self):
+        self.histograms = {}  # (name, labels) -> Histogram
+        self.counters = {}    # (name, labels) -> number
+        self._lock = threading.Lock()
+
+    def observe(self, name, labels, value, buckets=LATENCY_BUCKETS):
+        key = (name, labels)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def inc(self, name, labels, amount=1):
+        with self._lock:
+            self.counters[(name, labels)] = self.counters.get((name, labels), 0) + amount
+
+    def clear(self):
+        with self._lock:
+            self.histograms.clear()
+            self.counters.clear()
+
+    def snapshot(self, name):
+        """{labels: (p50, p95, p99, count)} for one histogram, for humans"""
+        with self._lock:
+            return {labels: (*(h.quantile(q) for q in QUANTILES), h.count)
+                    for (metric, labels), h in self.histograms.items() if metric == name}
+
+
+metrics = Metrics()
+
+# name -> (type, help); histograms also get a <name>_quantile summary
+METRIC_HELP = {
+    'narreyes_request_duration_seconds': ('histogram', 'Request latency by endpoint'),
+    'narreyes_requests_total': ('counter', 'Requests by endpoint and status'),
+    'narreyes_db_queries_per_request': ('histogram', 'SQL statements run per request'),
+    'narreyes_db_query_duration_seconds': ('histogram', 'Time in SQL per request'),
+    'narreyes_db_slow_queries_total': ('counter', 'Statements slower than the slow-query threshold'),
+    'narreyes_template_render_seconds': ('histogram', 'Template render time'),
+}
+
+
+def _labels(labels, **extra):
+    pairs = [*labels, *extra.items()]
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{str(value)}"'.replace('\n', ' ') for key, value in pairs) + '}'
+
+
+def render(extra_gauges=()):
+    """All metrics in the Prometheus text exposition format.
+
+    `extra_gauges` is an iterable of (name, help, labels, value) read at
+    scrape time, e.g. cache counters owned by other modules.
+    """
+    lines = []
+    with metrics._lock:
+        histograms = sorted(metrics.histograms.items(), key=lambda item: str(item[0]))
+        counters = sorted(metrics.counters.items(), key=lambda item: str(item[0]))
+
+    described = set()
+
+    def describe(name, kind=None):
+        if name not in described:
+            described.add(name)
+            metric_type, help_text = METRIC_HELP.get(name, ('gauge', ''))
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind or metric_type}')
+
+    for (name, labels), histogram in histograms:
+        describe(name)
+        cumulative = 0
+        for bound, count in zip((*histogram.buckets, '+Inf'), histogram.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{_labels(labels, le=bound)} {cumulative}')
+        lines.append(f'{name}_sum{_labels(labels)} {histogram.sum:.6f}')
+        lines.append(f'{name}_count{_labels(labels)} {histogram.count}')
+    for (name, labels), histogram in histograms:
+        describe(f'{name}_quantile', 'gauge')
+        for q in QUANTILES:
+            lines.append(f'{name}_quantile{_labels(labels, quantile=q)} {histogram.quantile(q):.6f}')
+    for (name, labels), value in counters:
+        describe(name)
+        lines.append(f'{name}{_labels(labels)} {value}')
+    for name, help_text, labels, value in extra_gauges:
+        if name not in described:
+            described.add(name)
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} gauge')
+        lines.append(f'{name}{_labels(labels)} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+class InstrumentedConnection:
+    """sqlite3 connection proxy that times every statement of a request"""
+
+    def __init__(self, connection, slow_query_ms=SLOW_QUERY_MS):
+        self._connection = connection
+        self._slow = slow_query_ms / 1000
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+    def __enter__(self):
+        return self._connection.__enter__()
+
+    def __exit__(self, *exc):
+        return self._connection.__exit__(*exc)
+
+    def _timed(self, method, sql, *args):
+        start = time.perf_counter()
+        try:
+            return method(sql, *args)
+        finally:
+            elapsed = time.perf_counter() - start
+            if 'query_count' in g:
+                g.query_count += 1
+                g.query_seconds += elapsed
+            if elapsed >= self._slow:
+                endpoint = (request.endpoint if request else None) or 'unmatched'
+                metrics.inc('narreyes_db_slow_queries_total', (('endpoint', endpoint),))
+                logger.warning('slow query (%.1f ms) in %s: %s', elapsed * 1000, endpoint,
+                               _SPACE_RE.sub(' ', sql).strip()[:300])
+
+    def execute(self, sql, parameters=()):
+        return self._timed(self._connection.execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self._timed(self._connection.executemany, sql, seq_of_parameters)
+
+    def executescript(self, script):
+        return self._timed(self._connection.executescript, script)
+
+
+_profile_lock = threading.Lock()
+
+
+def _may_request_profile(app):
+    """Whether this request may ask for ?_profile=1, like /metrics when a token is set"""
+    token = app.config.get('METRICS_TOKEN')
+    if token:
+        return request.headers.get('Authorization') == f'Bearer {token}'
+    return 'user_id' in session
+
+
+def _profiles_full(app):
+    directory = app.config['PROFILE_DIR']
+    try:
+        written = sum(1 for name in os.listdir(directory) if name.endswith('.prof'))
+    except FileNotFoundError:
+        return False
+    return written >= app.config['PROFILE_MAX_FILES']
+
+
+def init_app(app):
+    """Register the request and template hooks on `app`"""
+    app.config.setdefault('INSTRUMENTATION', False)
+    app.config.setdefault('SLOW_QUERY_MS', SLOW_QUERY_MS)
+    app.config.setdefault('PROFILING', False)
+    app.config.setdefault('PROFILE_SAMPLE_RATE', 0.0)
+    app.config.setdefault('PROFILE_DIR', 'profiles')
+    app.config.setdefault('PROFILE_MAX_FILES', PROFILE_MAX_FILES)
+
+    @app.before_request
+    def start_timer():
+        if not app.config['INSTRUMENTATION']:
+            return
+        g.request_start = time.perf_counter()
+        g.query_count = 0
+        g.query_seconds = 0.0
+        if app.config['PROFILING'] and (
+                (request.args.get('_profile') == '1' and _may_request_profile(app)) or
+                random.random() < app.config['PROFILE_SAMPLE_RATE']):
+            # cProfile allows one active profiler per process on 3.12+
+            if _profile_lock.acquire(blocking=False):
+                if _profiles_full(app):
+                    _profile_lock.release()
+                    logger.warning('not profiling %s: %s already holds %d profiles', request.path,
+                                   app.config['PROFILE_DIR'], app.config['PROFILE_MAX_FILES'])
+                    return
+                g.profiler = cProfile.Profile()
+                g.profiler.enable()
+
+    @app.teardown_request
+    def record_request(exception=None):
+        if 'request_start' not in g:
+            return
+        elapsed = time.perf_counter() - g.pop('request_start')
+        labels = (('endpoint', request.endpoint or 'unmatched'), ('method', request.method))
+        metrics.observe('narreyes_request_duration_seconds', labels, elapsed)
+        metrics.observe('narreyes_db_queries_per_request', labels, g.query_count, QUERY_COUNT_BUCKETS)
+        metrics.observe('narreyes_db_query_duration_seconds', labels, g.query_seconds)
+        status = 500 if exception is not None else g.get('response_status', 200)
+        metrics.inc('narreyes_requests_total', (*labels, ('status', status)))
+
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            profiler.disable()
+            _profile_lock.release()
+            os.makedirs(app.config['PROFILE_DIR'], exist_ok=True)
+            path = os.path.join(app.config['PROFILE_DIR'],
+                                f'{request.endpoint or "unmatched"}-{time.time_ns()}.prof')
+            profiler.dump_stats(path)
+            logger.info('profiled %s %s in %.1f ms -> %s', request.method, request.path,
+                        elapsed * 1000, path)
+
+    @app.after_request
+    def remember_status(response):
+        if 'request_start' in g:
+            g.response_status = response.status_code
+        return response
+
+    def start_render(sender, template, context, **extra):
+        if app.config['INSTRUMENTATION']:
+            g.setdefault('render_starts', []).append(time.perf_counter())
+
+    def finish_render(sender, template, context, **extra):
+        starts = g.get('render_starts')
+        if starts:
+            metrics.observe('narreyes_template_render_seconds', (('template', template.name),),
+                            time.perf_counter() - starts.pop())
+
+    before_render_template.connect(start_render, app, weak=False)
+    template_rendered.connect(finish_render, app, weak=False)
+
+
+def wrap(connection, slow_query_ms=SLOW_QUERY_MS):
+    return InstrumentedConnection(connection, slow_query_ms)
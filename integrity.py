@@ -0,0 +1,90 @@
+"""Find and repair rows orphaned while foreign keys were not enforced.
+
+Until database.PRAGMAS turned on foreign_keys, the ON DELETE clauses in
+the schema did nothing: deleting a chapter left timeline events pointing
+at it, deleting a character left relationships whose inner JOIN no longer
+matched, and some events were saved with '' as their chapter. A reference
+to another author's row is treated the same as a missing one.
+
+scan() counts each kind of orphan and repair() fixes them the way the
+foreign keys would have: delete the dependent rows, or clear the link for
+timeline events. repair() runs with foreign keys off, since the rows it
+deletes are already invalid, then rebuilds user_stats. See
+`flask orphans scan|repair`.
+"""
+
+import stats
+
+# (table, what it lost, condition, repair); in dependency order so that
+# rows removed by one check are seen by the later ones
+ORPHANS = [
+    ('characters', 'user', 'NOT EXISTS (SELECT 1 FROM users u WHERE u.id = characters.user_id)', 'DELETE'),
+    ('chapters', 'user', 'NOT EXISTS (SELECT 1 FROM users u WHERE u.id = chapters.user_id)', 'DELETE'),
+    ('timeline', 'user', 'NOT EXISTS (SELECT 1 FROM users u WHERE u.id = timeline.user_id)', 'DELETE'),
+    ('relationships', 'user', 'NOT EXISTS (SELECT 1 FROM users u WHERE u.id = relationships.user_id)', 'DELETE'),
+    ('relationships', 'character',
+     '''NOT EXISTS (SELECT 1 FROM characters c WHERE c.id = relationships.character1_id
+                                               AND c.user_id = relationships.user_id)
+        OR NOT EXISTS (SELECT 1 FROM characters c WHERE c.id = relationships.character2_id
+                                                  AND c.user_id = relationships.user_id)''', 'DELETE'),
+    ('timeline', 'chapter',
+     '''chapter_id IS NOT NULL
+        AND NOT EXISTS (SELECT 1 FROM chapters c WHERE c.id = timeline.chapter_id
+                                                 AND c.user_id = timeline.user_id)''',
+     'SET chapter_id = NULL'),
+    ('chapter_revisions', 'chapter',
+     '''NOT EXISTS (SELECT 1 FROM chapters c WHERE c.id = chapter_revisions.chapter_id
+                                             AND c.user_id = chapter_revisions.user_id)''', 'DELETE'),
+    ('chapter_mentions', 'user',
+     'NOT EXISTS (SELECT 1 FROM users u WHERE u.id = chapter_mentions.user_id)', 'DELETE'),
+    ('chapter_mentions', 'chapter',
+     '''NOT EXISTS (SELECT 1 FROM chapters c WHERE c.id = chapter_mentions.chapter_id
+                                             AND c.user_id = chapter_mentions.user_id)''', 'DELETE'),
+    ('chapter_mentions', 'character',
+     '''NOT EXISTS (SELECT 1 FROM characters c WHERE c.id = chapter_mentions.character_id
+                                               AND c.user_id = chapter_mentions.user_id)''', 'DELETE'),
+    ('progress_events', 'user',
+     'NOT EXISTS (SELECT 1 FROM users u WHERE u.id = progress_events.user_id)', 'DELETE'),
+    ('progress_rollups', 'user',
+     'NOT EXISTS (SELECT 1 FROM users u WHERE u.id = progress_rollups.user_id)', 'DELETE'),
+]
+
+
+def _checks(db):
+    """The ORPHANS entries whose table exists; migration 10 runs before later tables do"""
+    tables = {row[0] for row in db.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    return [check for check in ORPHANS if check[0] in tables]
+
+
+def scan(db):
+    """[(table, lost reference, count)] for every kind of orphan found"""
+    found = []
+    for table, reference, condition, _ in _checks(db):
+        count = db.execute(f'SELECT COUNT(*) FROM {table} WHERE {condition}').fetchone()[0]
+        if count:
+            found.append((table, reference, count))
+    return found
+
+
+def repair(db):
+    """Fix every orphan in one transaction; returns [(table, lost reference, rows fixed)]"""
+    db.commit()
+    db.execute('PRAGMA foreign_keys = OFF')  # only takes effect outside a transaction
+    try:
+        fixed = []
+        for table, reference, condition, action in _checks(db):
+            if action == 'DELETE':
+                cursor = db.execute(f'DELETE FROM {table} WHERE {condition}')
+            else:
+                cursor = db.execute(f'UPDATE {table} {action} WHERE {condition}')
+            if cursor.rowcount:
+                fixed.append((table, reference, cursor.rowcount))
+        if fixed:
+            stats.rebuild(db)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.execute('PRAGMA foreign_keys = ON')
+    return fixed
@@ -0,0 +1,196 @@
+"""Import a whole manuscript as chapters.
+
+A manuscript (.txt, .md or .docx) is read as a stream of paragraphs and cut
+into chapters wherever a heading appears: Markdown `#`/`##` headings, Word
+"Heading 1/2" and "Title" paragraphs, or lines matching HEADING_PATTERN
+("Chapter 12", "Part Two", "Prologue", ...). Each chapter is turned into
+the same simple HTML the editor produces and its statistics are computed
+as it goes by.
+
+Chapters are generated one at a time and fed straight into executemany(),
+so memory is bounded by the longest chapter rather than the file, and the
+whole import is a single transaction: it lands completely or not at all.
+"""
+
+import html as html_entities
+import io
+import os
+import re
+import zipfile
+from xml.etree.ElementTree import iterparse
+
+from markupsafe import escape
+
+import ordering
+import textstats
+
+HEADING_PATTERN = r'^(chapter|chapitre|part|book|prologue|epilogue|interlude)\b[\w\s.:,\'-]{0,80}$'
+FORMATS = ('txt', 'md', 'docx')
+
+# Heading patterns offered by the import form, by name. Uploads never
+# supply their own regex: one with catastrophic backtracking would hold a
+# request thread for as long as it likes. None cuts at markup headings only.
+HEADING_PRESETS = {
+    'chapters': HEADING_PATTERN,
+    'numbers': r'^(\d{1,4}|[ivxlcdm]{1,8})\.?$',
+    'headings': None,
+}
+
+_MD_HEADING_RE = re.compile(r'^(#{1,2})\s+(.+?)\s*#*\s*$')
+_MD_STRONG_RE = re.compile(r'(\*\*|__)(?=\S)(.+?)(?<=\S)\1')
+_MD_EM_RE = re.compile(r'(\*|_)(?=\S)(.+?)(?<=\S)\1')
+_SCENE_BREAK_RE = re.compile(r'^\s*([*#~-]\s*){3,}$')
+
+_W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+_DOCX_HEADING_STYLES = {'title', 'heading1', 'heading2'}
+
+
+class ManuscriptError(ValueError):
+    """The file cannot be imported"""
+
+
+def detect_format(filename):
+    extension = os.path.splitext(filename or '')[1].lower().lstrip('.')
+    if extension in ('markdown', 'mdown'):
+        extension = 'md'
+    if extension not in FORMATS:
+        raise ManuscriptError(f'Unsupported file type ".{extension}" (use {", ".join(FORMATS)})')
+    return extension
+
+
+def _text_lines(stream):
+    """Decoded lines of a binary or text stream"""
+    if isinstance(stream, io.TextIOBase):
+        return stream
+    return io.TextIOWrapper(stream, encoding='utf-8-sig', errors='replace', newline=None)
+
+
+def _text_paragraphs(stream, markdown):
+    """(is_heading, html) for each blank-line separated paragraph"""
+    lines = []
+    for line in _text_lines(stream):
+        line = line.rstrip()
+        heading = _MD_HEADING_RE.match(line) if markdown else None
+        if heading or not line:
+            if lines:
+                yield False, _paragraph_html(' '.join(lines), markdown)
+                lines = []
+            if heading:
+                yield True, heading.group(2)
+            continue
+        lines.append(line.strip())
+    if lines:
+        yield False, _paragraph_html(' '.join(lines), markdown)
+
+
+def _paragraph_html(text, markdown):
+    if _SCENE_BREAK_RE.match(text):
+        return '<p class="scene-break">* * *</p>'
+    html = str(escape(text))
+    if markdown:
+        html = _MD_EM_RE.sub(r'<em>\2</em>', _MD_STRONG_RE.sub(r'<strong>\2</strong>', html))
+    return f'<p>{html}</p>'
+
+
+def _docx_paragraphs(stream):
+    """(is_heading, html) for each paragraph of a .docx, parsed incrementally"""
+    try:
+        archive = zipfile.ZipFile(stream)
+        document = archive.open('word/document.xml')
+    except (zipfile.BadZipFile, KeyError):
+        raise ManuscriptError('Not a valid .docx file')
+
+    with archive, document:
+        style = None
+        texts = []
+        open_elements = []  # the path from the root, to find a paragraph's parent
+        for event, element in iterparse(document, events=('start', 'end')):
+            if event == 'start':
+                open_elements.append(element)
+                if element.tag == _W + 'p':
+                    style, texts = None, []
+                continue
+            open_elements.pop()
+            if element.tag == _W + 'pStyle':
+                style = (element.get(_W + 'val') or '').lower().replace(' ', '')
+            elif element.tag == _W + 't':
+                texts.append(element.text or '')
+            elif element.tag == _W + 'tab':
+                texts.append(' ')
+            elif element.tag == _W + 'p':
+                text = ''.join(texts).strip()
+                # Drop the finished paragraph from the tree, not just its
+                # contents, so memory stays flat on large documents
+                element.clear()
+                if open_elements:
+                    open_elements[-1].remove(element)
+                if not text:
+                    continue
+                if style in _DOCX_HEADING_STYLES:
+                    yield True, text
+                else:
+                    yield False, _paragraph_html(text, markdown=False)
+
+
+def read_chapters(stream, file_format, pattern=HEADING_PATTERN, default_title='Chapter 1'):
+    """Yield (title, html) for each chapter of a manuscript stream"""
+    if file_format == 'docx':
+        paragraphs = _docx_paragraphs(stream)
+    else:
+        paragraphs = _text_paragraphs(stream, markdown=file_format == 'md')
+    try:
+        heading_re = re.compile(pattern, re.IGNORECASE) if pattern else None
+    except re.error as e:
+        raise ManuscriptError(f'Invalid heading pattern: {e}')
+
+    title = None
+    body = []
+    for is_heading, html in paragraphs:
+        if not is_heading and heading_re is not None and html.startswith('<p>'):
+            # A short paragraph like "Chapter 12" is a heading in plain text
+            text = html_entities.unescape(html[3:-4])
+            if len(text) <= 100 and heading_re.match(text):
+                is_heading, html = True, text
+        if is_heading:
+            if body or title is not None:
+                yield title or default_title, ''.join(body)
+            title, body = html.strip(), []
+        else:
+            body.append(html)
+    if body or title is not None:
+        yield title or default_title, ''.join(body)
+
+
+def import_chapters(db, user_id, chapters, status='draft'):
+    """Insert (title, html) chapters after the author's last chapter.
+
+    Everything is written by one executemany() in one transaction. Returns
+    the number of chapters imported.
+    """
+    # sort_key is left to the trigger that appends new chapters (see ordering.py)
+    first = ordering.count(db, user_id) + 1
+    count = 0
+
+    def rows():
+        nonlocal count
+        for number, (title, content) in enumerate(chapters, first):
+            count += 1
+            yield (user_id, title[:200], number, content, *textstats.analyze(content), status)
+
+    try:
+        db.executemany('''INSERT INTO chapters
+                          (user_id, title, chapter_number, content, word_count, char_count,
+                           paragraph_count, sentence_count, reading_minutes, excerpt, status)
+                          VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', rows())
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return count
+
+
+def import_file(db, user_id, stream, filename, pattern=HEADING_PATTERN):
+    """Import a manuscript file object; returns the number of chapters"""
+    file_format = detect_format(filename)
+    default_title = os.path.splitext(os.path.basename(filename))[0] or 'Chapter 1'
+    return import_chapters(db, user_id, read_chapters(stream, file_format, pattern, default_title))
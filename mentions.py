@@ -0,0 +1,305 @@
+"""Which characters appear in which chapters, found by one pass over the text.
+
+Each author's character names and aliases are compiled into one
+Aho-Corasick automaton over words. Scanning a chapter walks its words
+once, whatever the size of the cast, instead of searching the text again
+for every name. Names match whole words, ignoring case, and a longer name
+wins over a shorter one starting at the same word ("Anna Karenina" is not
+also counted as "Anna"). Two characters with the same name are both
+credited.
+
+For every chapter the chapter_mentions table keeps how often each
+character is named and the offset of the first mention in the chapter's
+plain text. Saving a chapter rescans only that chapter. Changing a
+character changes the automaton, so all the author's chapters are
+rescanned, in a background thread, by schedule().
+
+Automata are cached per author in this process like the cast graph
+(graph.py), stamped with the author's stats.data_version. A rename saved
+through one worker bumps the version, so a chapter saved through another
+right after is scanned with a fresh automaton, not the old names.
+invalidate() only frees the entry early; the TTL only bounds memory.
+"""
+
+import re
+import sqlite3
+import threading
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import buildcache
+import database
+import stats
+import textstats
+
+CACHE_TTL = 60
+CACHE_SIZE = 64
+
+_WORD_RE = re.compile(r'\w+')
+_ALIAS_SPLIT_RE = re.compile(r'[,;\n]')
+
+
+def split_aliases(aliases):
+    """The names in a comma-, semicolon- or line-separated alias list"""
+    return [alias.strip() for alias in _ALIAS_SPLIT_RE.split(aliases or '') if alias.strip()]
+
+
+def _words(name):
+    return tuple(word.casefold() for word in _WORD_RE.findall(name))
+
+
+class Matcher:
+    """Aho-Corasick automaton whose alphabet is words"""
+
+    def __init__(self, names):
+        # names: (character_id, name) pairs; one character may have several
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [()]  # state -> ((character_id, length in words), ...) ending here
+        self.longest = 0
+        for character_id, name in names:
+            words = _words(name)
+            if not words:
+                continue
+            state = 0
+            for word in words:
+                following = self.goto[state].get(word)
+                if following is None:
+                    following = len(self.goto)
+                    self.goto[state][word] = following
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append(())
+                state = following
+            if (character_id, len(words)) not in self.out[state]:
+                self.out[state] += ((character_id, len(words)),)
+            self.longest = max(self.longest, len(words))
+
+        # Failure links, breadth first: the longest proper suffix that is
+        # also a path from the root. A state also reports what its suffix does.
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for word, following in self.goto[state].items():
+                queue.append(following)
+                fallback = self.fail[state]
+                while fallback and word not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                target = self.goto[fallback].get(word, 0)
+                self.fail[following] = target if target != following else 0
+                self.out[following] += self.out[self.fail[following]]
+
+    def __len__(self):
+        return len(self.goto) - 1
+
+    def scan(self, text):
+        """{character_id: (mentions, offset of the first one)} in plain `text`"""
+        goto, fail, out = self.goto, self.fail, self.out
+        root = goto[0]
+        if not root:
+            return {}
+        starts = deque(maxlen=self.longest)  # offsets of the last few words
+        spans = []
+        state = 0
+        for index, match in enumerate(_WORD_RE.finditer(text)):
+            word = match.group().casefold()
+            if not state and word not in root:
+                continue  # the common case: a word that starts no name
+            starts.append((index, match.start()))
+            while state and word not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(word, 0)
+            for character_id, length in out[state]:
+                first_word, offset = starts[-length]
+                spans.append((first_word, -length, offset, character_id))
+
+        # Leftmost-longest, non-overlapping: sorting puts the longest name
+        # first among those starting at a word, and ties are the same name
+        found = {}
+        covered = chosen = None
+        for first_word, negative_length, offset, character_id in sorted(spans):
+            if (first_word, negative_length) != chosen:
+                if covered is not None and first_word < covered:
+                    continue
+                chosen = (first_word, negative_length)
+                covered = first_word - negative_length
+            count, first = found.get(character_id, (0, offset))
+            found[character_id] = (count + 1, min(first, offset))
+        return found
+
+
+def build(db, user_id):
+    cursor = db.cursor()
+    cursor.row_factory = None
+    names = []
+    for character_id, name, aliases in cursor.execute(
+            'SELECT id, name, aliases FROM characters WHERE user_id = ?', (user_id,)):
+        names.append((character_id, name))
+        names.extend((character_id, alias) for alias in split_aliases(aliases))
+    return Matcher(names)
+
+
+_cache = buildcache.BuildCache(CACHE_SIZE, CACHE_TTL)
+
+
+def get_matcher(db, user_id):
+    """Return the author's automaton, building it on a cache miss"""
+    return _cache.get(user_id, lambda: build(db, user_id), stats.data_version(db, user_id))
+
+
+def invalidate(user_id):
+    """Drop the author's cached automaton after their characters change"""
+    _cache.invalidate(user_id)
+
+
+def index_chapter(db, user_id, chapter_id, content, matcher=None):
+    """Replace the stored mentions of one chapter; the caller commits"""
+    if matcher is None:
+        matcher = get_matcher(db, user_id)
+    found = matcher.scan(textstats.strip_html(content)) if content else {}
+    db.execute('DELETE FROM chapter_mentions WHERE chapter_id = ?', (chapter_id,))
+    db.executemany('''INSERT INTO chapter_mentions (chapter_id, character_id, user_id, mentions, first_offset)
+                      VALUES (?, ?, ?, ?, ?)''',
+                   ((chapter_id, character_id, user_id, count, offset)
+                    for character_id, (count, offset) in found.items()))
+    return len(found)
+
+
+def rebuild(db, user_id=None):
+    """Rescan every chapter of one author (or of everyone).
+
+    Each chapter is committed on its own, so saves are never kept waiting
+    for a whole manuscript. A chapter deleted meanwhile is skipped. Returns
+    the number of chapters scanned.
+    """
+    if user_id is None:
+        users = [row[0] for row in db.execute('SELECT id FROM users ORDER BY id').fetchall()]
+    else:
+        users = [user_id]
+    scanned = 0
+    for author in users:
+        matcher = build(db, author)
+        chapter_ids = [row[0] for row in db.execute('SELECT id FROM chapters WHERE user_id = ?', (author,))]
+        for chapter_id in chapter_ids:
+            row = db.execute('SELECT content FROM chapters WHERE id = ?', (chapter_id,)).fetchone()
+            if row is None:
+                continue
+            try:
+                index_chapter(db, author, chapter_id, row[0], matcher)
+                db.commit()
+            except sqlite3.IntegrityError:
+                db.rollback()  # the chapter or a character went since the SELECT
+                continue
+            scanned += 1
+    return scanned
+
+
+# ==================== Background rescans ====================
+
+_executor = None
+_queued = set()
+_futures = set()
+_queue_lock = threading.Lock()
+
+
+def _run(path, user_id):
+    with _queue_lock:
+        # Changes made from here on need another pass, so let them queue one
+        _queued.discard((path, user_id))
+    db = database.connect(path)
+    try:
+        rebuild(db, user_id)
+    finally:
+        db.close()
+
+
+def schedule(path, user_id):
+    """Rescan the author's chapters in the background, once per burst of edits"""
+    global _executor
+    with _queue_lock:
+        if (path, user_id) in _queued:
+            return
+        if _executor is None:
+            # One thread: SQLite has a single writer anyway
+            _executor = ThreadPoolExecutor(1, thread_name_prefix='mentions')
+        _queued.add((path, user_id))
+        future = _executor.submit(_run, path, user_id)
+        _futures.add(future)
+    future.add_done_callback(_futures.discard)
+
+
+def wait(timeout=None):
+    """Block until the rescans queued so far have finished"""
+    with _queue_lock:
+        pending = list(_futures)
+    for future in pending:
+        future.result(timeout)
+
+
+def shutdown():
+    """Finish queued rescans and stop the thread"""
+    global _executor
+    with _queue_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=True)
+
+
+# ==================== Queries ====================
+
+def for_chapter(db, user_id, chapter_id):
+    """Characters named in a chapter, most mentioned first"""
+    return db.execute('''SELECT c.id, c.name, c.role, m.mentions, m.first_offset
+                         FROM chapter_mentions m JOIN characters c ON c.id = m.character_id
+                         WHERE m.chapter_id = ? AND m.user_id = ?
+                         ORDER BY m.mentions DESC, m.first_offset''', (chapter_id, user_id)).fetchall()
+
+
+def digest(rows):
+    """Short tag for a list of for_chapter() rows, to fold into the page's ETag"""
+    return f'm{zlib.crc32(repr([tuple(row) for row in rows]).encode()):08x}'
+
+
+def for_character(db, user_id, character_id):
+    """Chapters a character is named in, in reading order"""
+    return db.execute('''SELECT ch.id, ch.title, m.mentions, m.first_offset
+                         FROM chapter_mentions m JOIN chapters ch ON ch.id = m.chapter_id
+                         WHERE m.character_id = ? AND m.user_id = ?
+                         ORDER BY ch.sort_key, ch.id''', (character_id, user_id)).fetchall()
+
+
+def summary(db, user_id, character_ids, chapters_shown=3):
+    """{character_id: {'chapters', 'mentions', 'first': [(chapter id, title)]}} for the character cards"""
+    if not character_ids:
+        return {}
+    placeholders = ', '.join('?' * len(character_ids))
+    result = {}
+    for row in db.execute(f'''SELECT m.character_id, m.mentions, ch.id, ch.title
+                              FROM chapter_mentions m JOIN chapters ch ON ch.id = m.chapter_id
+                              WHERE m.character_id IN ({placeholders}) AND m.user_id = ?
+                              ORDER BY ch.sort_key, ch.id''', (*character_ids, user_id)):
+        entry = result.setdefault(row[0], {'chapters': 0, 'mentions': 0, 'first': []})
+        entry['chapters'] += 1
+        entry['mentions'] += row[1]
+        if len(entry['first']) < chapters_shown:
+            entry['first'].append((row[2], row[3]))
+    return result
+
+
+def create_schema(db):
+    """Character aliases and the chapter_mentions table"""
+    database.add_column(db, 'characters', 'aliases', 'TEXT')
+    db.execute('''CREATE TABLE IF NOT EXISTS chapter_mentions (
+        chapter_id INTEGER NOT NULL,
+        character_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        mentions INTEGER NOT NULL,
+        first_offset INTEGER NOT NULL,
+        PRIMARY KEY (chapter_id, character_id),
+        FOREIGN KEY (chapter_id) REFERENCES chapters(id) ON DELETE CASCADE,
+        FOREIGN KEY (character_id) REFERENCES characters(id) ON DELETE CASCADE,
+        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+    ) WITHOUT ROWID''')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_mentions_character ON chapter_mentions(character_id)')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_mentions_user ON chapter_mentions(user_id)')
@@ -0,0 +1,272 @@
+"""Numbered schema migrations for NarrEyes.
+
+The schema is defined once, by the MIGRATIONS below, applied in order by
+migrate(). Each applied migration is recorded in the schema_version table,
+so `flask migrate` only runs what a database has not seen yet, and
+`flask migrate --status` shows where a database stands. A database
+created before schema_version existed has no rows there and simply
+replays every migration, which is why they must be idempotent.
+
+Rules for new migrations:
+
+- append with the next number; never edit or renumber a shipped one,
+- idempotent: CREATE ... IF NOT EXISTS and database.add_column(), so a
+  migration interrupted half-way can run again,
+- online: add tables, indexes and columns with a default. ADD COLUMN only
+  rewrites the schema, and backfills commit per batch, so the app keeps
+  serving while `flask migrate` runs. Never rebuild a table in place.
+
+Whenever something was applied, migrate() runs ANALYZE so the planner has
+statistics for the new indexes, then PRAGMA optimize.
+"""
+
+import time
+from collections import namedtuple
+
+import chronology
+import database
+import integrity
+import mentions
+import ordering
+import progress
+import revisions
+import search
+import stats
+import textstats
+
+Migration = namedtuple('Migration', ['version', 'description', 'apply'])
+
+MIGRATIONS = []
+
+
+def migration(version, description):
+    """Register the decorated function as migration number `version`"""
+    def register(apply):
+        expected = len(MIGRATIONS) + 1
+        if version != expected:
+            raise ValueError(f'migration {version} registered out of order, expected {expected}')
+        MIGRATIONS.append(Migration(version, description, apply))
+        return apply
+    return register
+
+
+@migration(1, 'Users, characters, chapters, timeline and relationships')
+def _base_tables(db, calendar):
+    db.execute('''CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE NOT NULL,
+        email TEXT UNIQUE NOT NULL,
+        password_hash TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )''')
+    db.execute('''CREATE TABLE IF NOT EXISTS characters (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        age INTEGER,
+        role TEXT,
+        description TEXT,
+        personality TEXT,
+        background TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+    )''')
+    db.execute('''CREATE TABLE IF NOT EXISTS chapters (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        title TEXT NOT NULL,
+        chapter_number INTEGER NOT NULL,
+        content TEXT,
+        word_count INTEGER DEFAULT 0,
+        status TEXT DEFAULT 'draft',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+    )''')
+    db.execute('''CREATE TABLE IF NOT EXISTS timeline (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        event_title TEXT NOT NULL,
+        event_date TEXT,
+        description TEXT,
+        chapter_id INTEGER,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+        FOREIGN KEY (chapter_id) REFERENCES chapters(id) ON DELETE SET NULL
+    )''')
+    db.execute('''CREATE TABLE IF NOT EXISTS relationships (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        character1_id INTEGER NOT NULL,
+        character2_id INTEGER NOT NULL,
+        relationship_type TEXT NOT NULL,
+        description TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+        FOREIGN KEY (character1_id) REFERENCES characters(id) ON DELETE CASCADE,
+        FOREIGN KEY (character2_id) REFERENCES characters(id) ON DELETE CASCADE
+    )''')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_characters_user ON characters(user_id)')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_chapters_user ON chapters(user_id)')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_timeline_user ON timeline(user_id)')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_relationships_user ON relationships(user_id)')
+
+
+@migration(2, 'Keyset pagination indexes for the list pages')
+def _pagination_indexes(db, calendar):
+    db.execute('CREATE INDEX IF NOT EXISTS idx_chapters_user_number ON chapters(user_id, chapter_number)')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_characters_user_created ON characters(user_id, created_at)')
+    db.execute('DROP INDEX IF EXISTS idx_timeline_user_date')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_relationships_user_created ON relationships(user_id, created_at)')
+
+
+@migration(3, 'Chapter text statistics and plain-text excerpt')
+def _chapter_text_stats(db, calendar):
+    added = [database.add_column(db, 'chapters', column, 'INTEGER DEFAULT 0')
+             for column in ('char_count', 'paragraph_count', 'sentence_count', 'reading_minutes')]
+    added.append(database.add_column(db, 'chapters', 'excerpt', 'TEXT'))
+    if any(added):
+        db.commit()
+        textstats.backfill(db)
+
+
+@migration(4, 'Chapter version for autosave conflict checks')
+def _chapter_version(db, calendar):
+    database.add_column(db, 'chapters', 'version', 'INTEGER NOT NULL DEFAULT 1')
+
+
+@migration(5, 'Chronological sort key for timeline events')
+def _timeline_sort_key(db, calendar):
+    if database.add_column(db, 'timeline', 'sort_key', 'REAL'):
+        db.commit()
+        chronology.backfill(db, calendar)
+    db.execute('CREATE INDEX IF NOT EXISTS idx_timeline_user_sort ON timeline(user_id, sort_key, id)')
+
+
+@migration(6, 'Per-user counters maintained by triggers')
+def _user_stats(db, calendar):
+    stats.create_schema(db)
+
+
+@migration(7, 'Full-text search mirrors')
+def _search(db, calendar):
+    search.create_schema(db)
+
+
+@migration(8, 'Chapter revision history')
+def _revisions(db, calendar):
+    revisions.create_schema(db)
+
+
+@migration(9, 'Indexes for chapter and character foreign keys')
+def _foreign_key_indexes(db, calendar):
+    # Events linked to a chapter, and the ON DELETE SET NULL when it goes
+    db.execute('CREATE INDEX IF NOT EXISTS idx_timeline_chapter ON timeline(chapter_id)')
+    # Relationships of a character, from either side, and their ON DELETE CASCADE
+    db.execute('CREATE INDEX IF NOT EXISTS idx_relationships_chars ON relationships(character1_id, character2_id)')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_relationships_char2 ON relationships(character2_id)')
+
+
+@migration(10, 'Repair rows orphaned while foreign keys were off')
+def _repair_orphans(db, calendar):
+    integrity.repair(db)
+
+
+@migration(11, 'Gap-spaced chapter sort keys')
+def _chapter_sort_keys(db, calendar):
+    ordering.create_schema(db)
+
+
+@migration(12, 'Character aliases and the chapter mention index')
+def _chapter_mentions(db, calendar):
+    mentions.create_schema(db)
+    db.commit()
+    mentions.rebuild(db)
+
+
+@migration(13, 'Per-user data version for caches of derived data')
+def _data_version(db, calendar):
+    stats.create_version_schema(db)
+
+
+@migration(14, 'Writing progress events and daily, weekly and monthly rollups')
+def _writing_progress(db, calendar):
+    progress.create_schema(db)
+    db.commit()
+    progress.backfill(db)
+
+
+@migration(15, 'Re-sort timeline dates written with slashes')
+def _slash_dates(db, calendar):
+    # These were keyed by their year alone before Calendar.parse read them
+    rows = db.execute("SELECT id, event_date FROM timeline WHERE event_date LIKE '%/%'").fetchall()
+    db.executemany('UPDATE timeline SET sort_key = ? WHERE id = ?',
+                   [(chronology.sort_key(calendar, row['event_date']), row['id']) for row in rows])
+
+
+LATEST = MIGRATIONS[-1].version
+
+
+def create_schema(db):
+    db.execute('''CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        description TEXT NOT NULL,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        duration_ms INTEGER
+    )''')
+
+
+def current_version(db):
+    """Highest applied migration, 0 for a new or pre-migration database"""
+    create_schema(db)
+    return db.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version').fetchone()[0]
+
+
+def status(db):
+    """[(version, description, applied_at or None)] for every migration"""
+    create_schema(db)
+    applied = {row[0]: row[1] for row in db.execute('SELECT version, applied_at FROM schema_version')}
+    return [(m.version, m.description, applied.get(m.version)) for m in MIGRATIONS]
+
+
+def pending(db):
+    current = current_version(db)
+    return [m for m in MIGRATIONS if m.version > current]
+
+
+def migrate(db, calendar=None, target=None, log=None):
+    """Apply pending migrations up to `target` (the latest by default).
+
+    Each migration is committed together with its schema_version row.
+    Returns the applied Migration records.
+    """
+    calendar = calendar if calendar is not None else chronology.Calendar()
+    applied = []
+    for m in pending(db):
+        if target is not None and m.version > target:
+            break
+        if log:
+            log(f'Applying {m.version}: {m.description}')
+        start = time.perf_counter()
+        m.apply(db, calendar)
+        db.execute('INSERT INTO schema_version (version, description, duration_ms) VALUES (?, ?, ?)',
+                   (m.version, m.description, int((time.perf_counter() - start) * 1000)))
+        db.commit()
+        applied.append(m)
+    if applied:
+        db.execute('ANALYZE')
+        db.commit()
+    db.execute('PRAGMA optimize')
+    return applied
+
+
+def dump_schema(db):
+    """The schema as SQL, in a stable order, without SQLite's own tables"""
+    rows = db.execute('''SELECT type, name, sql FROM sqlite_master
+                         WHERE sql IS NOT NULL AND name NOT LIKE 'sqlite_%'
+                         ORDER BY CASE type WHEN 'table' THEN 0 WHEN 'index' THEN 1
+                                            WHEN 'trigger' THEN 2 ELSE 3 END, name''').fetchall()
+    # FTS5 shadow tables are created by their virtual table
+    shadows = {f'{row[1]}_{suffix}' for row in rows if 'VIRTUAL TABLE' in row[2].upper()
+               for suffix in ('data', 'idx', 'content', 'docsize', 'config')}
+    return ''.join(f'{sql};\n\n' for kind, name, sql in rows if name not in shadows)
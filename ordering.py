@@ -0,0 +1,160 @@
+"""Reading order of chapters, kept in gap-spaced sort keys.
+
+Each chapter has an integer sort_key. New chapters are placed GAP after
+the author's last one, so the keys start out GAP apart. Moving a chapter
+between two others gives it the midpoint of their keys: one UPDATE,
+however long the manuscript is. Only when two neighbours have no integer
+left between them does rebalance() space the author's keys GAP apart
+again. That is O(n) but needs about log2(GAP) moves into the same spot
+first, and `flask chapters-rebalance` can do it ahead of time off-peak.
+
+The number shown to the author ("Chapter 7") is not stored. It is the
+chapter's rank by (sort_key, id), counted at read time over the
+(user_id, sort_key) index. The legacy chapter_number column is still
+written, with the position a chapter had when it was created or last
+rebalanced, but nothing reads it.
+
+Rows inserted without a sort_key (imports, scripts) are appended by the
+trg_chapters_sort_key trigger.
+"""
+
+import database
+
+GAP = 1024
+
+TRIGGER = f'''CREATE TRIGGER IF NOT EXISTS trg_chapters_sort_key
+    AFTER INSERT ON chapters WHEN NEW.sort_key IS NULL BEGIN
+        UPDATE chapters
+        SET sort_key = (SELECT COALESCE(MAX(sort_key), 0) FROM chapters
+                        WHERE user_id = NEW.user_id AND id != NEW.id) + {GAP}
+        WHERE id = NEW.id;
+    END'''
+
+
+class OrderingError(ValueError):
+    """A move that refers to chapters the author does not have"""
+
+
+def key_between(low, high):
+    """An integer strictly between two keys (None = open end), or None if there is none"""
+    if low is None and high is None:
+        return GAP
+    if low is None:
+        return high - GAP
+    if high is None:
+        return low + GAP
+    if high - low < 2:
+        return None
+    return (low + high) // 2
+
+
+def number(db, user_id, sort_key, chapter_id):
+    """The 1-based position of a chapter in reading order"""
+    return db.execute('''SELECT COUNT(*) + 1 FROM chapters
+                         WHERE user_id = ? AND (sort_key, id) < (?, ?)''',
+                      (user_id, sort_key, chapter_id)).fetchone()[0]
+
+
+def count(db, user_id):
+    return db.execute('SELECT COUNT(*) FROM chapters WHERE user_id = ?', (user_id,)).fetchone()[0]
+
+
+def key_at(db, user_id, position):
+    """sort_key of the chapter at 1-based `position`, None past the end"""
+    if position < 1:
+        position = 1
+    row = db.execute('''SELECT sort_key FROM chapters WHERE user_id = ?
+                        ORDER BY sort_key, id LIMIT 1 OFFSET ?''', (user_id, position - 1)).fetchone()
+    return row[0] if row else None
+
+
+def _neighbours_at(db, user_id, position, exclude):
+    """Keys either side of slot `position` (None = the end) among the chapters other than `exclude`"""
+    if position is None:
+        row = db.execute('SELECT MAX(sort_key) FROM chapters WHERE user_id = ? AND id IS NOT ?',
+                         (user_id, exclude)).fetchone()
+        return row[0], None
+    if position <= 1:
+        row = db.execute('''SELECT sort_key FROM chapters WHERE user_id = ? AND id IS NOT ?
+                            ORDER BY sort_key, id LIMIT 1''', (user_id, exclude)).fetchone()
+        return None, row[0] if row else None
+    rows = db.execute('''SELECT sort_key FROM chapters WHERE user_id = ? AND id IS NOT ?
+                         ORDER BY sort_key, id LIMIT 2 OFFSET ?''', (user_id, exclude, position - 2)).fetchall()
+    if not rows:
+        return _neighbours_at(db, user_id, None, exclude)
+    return rows[0][0], rows[1][0] if len(rows) > 1 else None
+
+
+def _neighbours_after(db, user_id, after_id, exclude):
+    """Keys either side of the slot right after chapter `after_id` (None = first)"""
+    if after_id is None:
+        return _neighbours_at(db, user_id, 1, exclude)
+    anchor = db.execute('SELECT sort_key FROM chapters WHERE id = ? AND user_id = ?',
+                        (after_id, user_id)).fetchone()
+    if anchor is None or after_id == exclude:
+        raise OrderingError('unknown chapter to place after')
+    row = db.execute('''SELECT sort_key FROM chapters WHERE user_id = ? AND id IS NOT ?
+                        AND (sort_key, id) > (?, ?) ORDER BY sort_key, id LIMIT 1''',
+                     (user_id, exclude, anchor[0], after_id)).fetchone()
+    return anchor[0], row[0] if row else None
+
+
+def rebalance(db, user_id):
+    """Space the author's keys GAP apart again, keeping their order; returns rows changed"""
+    return db.execute(f'''UPDATE chapters SET sort_key = ranked.position * {GAP},
+                                            chapter_number = ranked.position
+                          FROM (SELECT id, ROW_NUMBER() OVER (ORDER BY sort_key, id) AS position
+                                FROM chapters WHERE user_id = ?) AS ranked
+                          WHERE chapters.id = ranked.id
+                            AND chapters.sort_key IS NOT ranked.position * {GAP}''', (user_id,)).rowcount
+
+
+def _place(db, user_id, neighbours):
+    """A free key between the neighbours, rebalancing once if there is none"""
+    key = key_between(*neighbours())
+    if key is None:
+        rebalance(db, user_id)
+        key = key_between(*neighbours())
+    return key
+
+
+def key_for_position(db, user_id, position=None, exclude=None):
+    """A sort key that puts a chapter at 1-based `position` (None = the end)"""
+    return _place(db, user_id, lambda: _neighbours_at(db, user_id, position, exclude))
+
+
+def move(db, user_id, chapter_id, after_id=None, position=None):
+    """Move a chapter right after `after_id` (None = to the front), or to `position`.
+
+    Touches the moved row only, unless the gap ran out and the author's
+    keys were rebalanced. Commits. Returns the chapter's new position.
+    """
+    if not db.in_transaction:
+        db.execute('BEGIN IMMEDIATE')  # read the neighbours and write as one step
+    try:
+        if db.execute('SELECT 1 FROM chapters WHERE id = ? AND user_id = ?', (chapter_id, user_id)).fetchone() is None:
+            raise OrderingError('unknown chapter')
+        if position is not None:
+            key = key_for_position(db, user_id, position, exclude=chapter_id)
+        else:
+            key = _place(db, user_id, lambda: _neighbours_after(db, user_id, after_id, chapter_id))
+        db.execute('UPDATE chapters SET sort_key = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ? AND user_id = ?',
+                   (key, chapter_id, user_id))
+        new_position = number(db, user_id, key, chapter_id)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return new_position
+
+
+def create_schema(db):
+    """Add sort_key, fill it from the old chapter numbers and index it"""
+    if database.add_column(db, 'chapters', 'sort_key', 'INTEGER'):
+        db.execute(f'''UPDATE chapters SET sort_key = ranked.position * {GAP}
+                       FROM (SELECT id, ROW_NUMBER() OVER (PARTITION BY user_id
+                                                           ORDER BY chapter_number, id) AS position
+                             FROM chapters) AS ranked
+                       WHERE chapters.id = ranked.id''')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_chapters_user_sort ON chapters(user_id, sort_key)')
+    db.execute(TRIGGER)
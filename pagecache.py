@@ -0,0 +1,133 @@
+"""Rendered page fragments and HTTP validators for chapter pages.
+
+Chapters are read far more often than they are written. chapter_detail()
+renders the chapter card once and keeps the HTML in a FragmentCache,
+keyed by chapter id and stamped with an ETag built from the chapter's
+version, updated_at and position in reading order, so a cached fragment can never be served for
+newer content: a stale stamp is simply a miss. The views that change a
+chapter also call invalidate() so the memory is given back at once.
+
+The cache is bounded by the size of the HTML it holds and evicts the
+least recently used fragment first. It lives in this process only; other
+workers keep their own, which is safe because every lookup checks the
+stamp.
+
+The browser gets that ETag plus viewer(), since the page around the card
+shows who is logged in, and the Last-Modified; is_fresh() answers
+conditional requests with 304 before anything is rendered.
+"""
+
+import threading
+import zlib
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+MAX_BYTES = 32 * 1024 * 1024
+# Bump when chapter_body.html or chapter_detail.html change, so browsers
+# revalidate instead of keeping pages rendered by the old templates
+RENDER_VERSION = 2
+
+
+def etag(chapter_id, version, updated_at, number=None, extra=None):
+    """Strong ETag (unquoted) for one saved state of a chapter at one position.
+
+    `extra` tags anything else the page shows that can change on its own.
+    """
+    stamp = ''.join(ch for ch in str(updated_at or '') if ch.isdigit())
+    tag = f'ch{chapter_id}.{version}.{stamp}.n{number}.r{RENDER_VERSION}'
+    return f'{tag}.{extra}' if extra is not None else tag
+
+
+def viewer(user_id, username):
+    """Short tag for the logged-in author the page shell shows, to fold into the page's ETag"""
+    return f'u{user_id}.{zlib.crc32(str(username).encode()):08x}'
+
+
+def last_modified(updated_at):
+    """updated_at (SQLite CURRENT_TIMESTAMP, UTC) as an aware datetime"""
+    try:
+        return datetime.strptime(str(updated_at), '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+    except ValueError:
+        return None
+
+
+def is_fresh(request, tag, modified):
+    """True when the browser's copy is current and a 304 can be sent.
+
+    If-None-Match wins over If-Modified-Since, which only has one-second
+    resolution. The comparison is weak: a compressed page carries a weak
+    form of the tag (see compression.py).
+    """
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(tag)
+    since = request.if_modified_since
+    return since is not None and modified is not None and modified <= since
+
+
+class FragmentCache:
+    """Thread-safe LRU of rendered HTML, bounded by total size"""
+
+    def __init__(self, max_bytes=MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.not_modified = 0
+        self._items = OrderedDict()  # key -> (stamp, owner, html)
+        self._lock = threading.Lock()
+
+    def get(self, key, stamp):
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None and item[0] == stamp:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return item[2]
+            self.misses += 1
+            return None
+
+    def set(self, key, stamp, html, owner=None):
+        if len(html) > self.max_bytes:
+            return
+        with self._lock:
+            self._discard(key)
+            self._items[key] = (stamp, owner, html)
+            self.size += len(html)
+            while self.size > self.max_bytes:
+                _, (_, _, evicted) = self._items.popitem(last=False)
+                self.size -= len(evicted)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            self._discard(key)
+
+    def invalidate_owner(self, owner):
+        """Drop every fragment rendered for one author"""
+        with self._lock:
+            for key in [key for key, item in self._items.items() if item[1] == owner]:
+                self._discard(key)
+
+    def _discard(self, key):
+        item = self._items.pop(key, None)
+        if item is not None:
+            self.size -= len(item[2])
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.size = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._items),
+            'bytes': self.size,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+            'evictions': self.evictions,
+            'not_modified': self.not_modified,
+        }
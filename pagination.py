@@ -0,0 +1,105 @@
+"""Keyset (seek) pagination for the list pages.
+
+Instead of OFFSET, each page remembers the sort key of its last row and the
+next query asks for rows strictly after it, so with a matching index every
+page costs O(page size) however deep the author scrolls. Cursors are opaque
+URL-safe tokens holding the sort key values.
+"""
+
+import base64
+import json
+
+PAGE_SIZE = 24
+
+
+class Page:
+    """One page of rows plus the cursors needed to move around"""
+
+    def __init__(self, items, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __bool__(self):
+        return bool(self.items)
+
+
+def encode_cursor(values):
+    raw = json.dumps(list(values), separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token, size):
+    """Return the key values in `token`, or None if it is missing or malformed"""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(values, list) or len(values) != size:
+        return None
+    return tuple(values)
+
+
+def seek(db, query, params, order, descending=False, after=None, before=None,
+         limit=PAGE_SIZE):
+    """Fetch one page of `query` ordered by `order`.
+
+    `query` is a SELECT ending in its WHERE clause. `order` is a list of
+    (sql expression, row key) pairs; every row must expose the row keys so the
+    page's boundary can be turned into a cursor, and the last pair should be
+    unique (usually the id). `after`/`before` are cursors from a previous page.
+    """
+    exprs = ', '.join(expr for expr, _ in order)
+    keys = [key for _, key in order]
+    backwards = False
+    cursor = decode_cursor(after, len(order))
+    if cursor is None:
+        cursor = decode_cursor(before, len(order))
+        backwards = cursor is not None
+
+    # Walking backwards flips both the comparison and the sort direction
+    reverse = descending != backwards
+    sql = query
+    args = list(params)
+    if cursor is not None:
+        marks = ', '.join('?' * len(cursor))
+        sql += f" AND ({exprs}) {'<' if reverse else '>'} ({marks})"
+        args.extend(cursor)
+    direction = 'DESC' if reverse else 'ASC'
+    sql += ' ORDER BY ' + ', '.join(f'{expr} {direction}' for expr, _ in order)
+    sql += ' LIMIT ?'
+    args.append(limit + 1)
+
+    rows = db.execute(sql, args).fetchall()
+    more = len(rows) > limit
+    rows = rows[:limit]
+    if backwards:
+        rows.reverse()
+
+    def boundary(row):
+        return encode_cursor(row[key] for key in keys)
+
+    next_cursor = prev_cursor = None
+    if rows:
+        if more or backwards:
+            next_cursor = boundary(rows[-1])
+        if (more and backwards) or (cursor is not None and not backwards):
+            prev_cursor = boundary(rows[0])
+    return Page(rows, next_cursor, prev_cursor)
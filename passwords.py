@@ -0,0 +1,237 @@
+"""Password hashing off the request thread, with admission control.
+
+Werkzeug's scrypt hashes take around a hundred milliseconds of CPU and
+32 MB of memory each, by design. Run in the request threads, a burst of logins
+(or a credential-stuffing run) occupies every thread and starves all other
+routes. So:
+
+- RateLimiter token buckets, one per client address and one per username,
+  turn excess attempts away with 429 before anything is hashed,
+- a Hasher runs the hashing in a small process pool at a lower CPU
+  priority (NICE), so at most WORKERS hashes per app process are computed
+  at once and request threads win the CPU over them,
+- at most MAX_PENDING request threads may wait for a hash; any more are
+  refused with Busy (503) at once. Keep it below the server's threads per
+  worker (GUNICORN_THREADS) so that a flood of logins can never occupy
+  every thread and the other routes keep being served.
+
+The pool starts its processes with spawn, not fork: the app process runs
+threads, and a forked copy of a lock held by another thread would never
+be released. spawn imports the main script again in each new process, so
+that script must keep its startup code under `if __name__ == '__main__'`
+(app.py, gunicorn and the benchmarks do). With workers=0 the Hasher hashes
+in the calling thread instead, still bounded by MAX_PENDING.
+
+A hash that times out is cancelled if it has not started, and otherwise
+counts as pending until its process is done with it. If a pool process
+dies (scrypt's memory makes it a likely target for the OOM killer), the
+broken pool is dropped, that attempt gets Busy, and the next hash starts
+a new pool. Hashes still queued when a pool is closed or dropped get Busy
+too.
+
+needs_rehash() compares a stored hash with the configured METHOD, so when
+the cost parameters are raised the login view re-hashes the password the
+author has just typed and stores the new hash.
+
+Buckets and pools live in one process: under gunicorn every worker keeps
+its own, so an address can make up to `workers` times the configured
+attempts per minute. Behind a reverse proxy, remote_addr is the proxy
+unless the app is wrapped in werkzeug's ProxyFix.
+"""
+
+import math
+import multiprocessing
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import CancelledError, ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+METHOD = 'scrypt:32768:8:1'
+WORKERS = 2
+MAX_PENDING = 2
+NICE = 10
+TIMEOUT = 10
+IP_PER_MINUTE = 20
+USER_PER_MINUTE = 5
+MAX_BUCKETS = 100_000
+
+
+class Busy(Exception):
+    """Too many hashes are running or queued; try again shortly"""
+
+    retry_after = 1
+
+
+class RateLimited(Exception):
+    """A rate limit bucket is empty"""
+
+    def __init__(self, retry_after):
+        super().__init__(f'rate limited, retry after {retry_after}s')
+        self.retry_after = retry_after
+
+
+def _init_worker(parent, nice):
+    """Run in each pool process: lower its priority and exit with the app process"""
+    if hasattr(os, 'nice'):
+        os.nice(nice)
+
+    # The pool's pipes are shared by its processes, so a killed parent would
+    # not end them by itself
+    def watch():
+        while os.getppid() == parent:
+            time.sleep(1)
+        os._exit(0)
+
+    threading.Thread(target=watch, daemon=True).start()
+
+
+def needs_rehash(pwhash, method=METHOD):
+    """True when `pwhash` was made with other parameters than `method`"""
+    return pwhash.split('$', 1)[0] != method
+
+
+class RateLimiter:
+    """Token buckets per key: `per_minute` attempts, refilled continuously.
+
+    A full bucket is the same as no bucket, so the least recently used
+    ones are dropped once there are more than max_keys.
+    """
+
+    def __init__(self, per_minute, max_keys=MAX_BUCKETS):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.max_keys = max_keys
+        self.limited = 0
+        self._buckets = OrderedDict()  # key -> (tokens, monotonic time)
+        self._lock = threading.Lock()
+
+    def take(self, key):
+        """Spend one token for `key`; raises RateLimited when there is none"""
+        if self.capacity <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            tokens, stamp = self._buckets.pop(key, (self.capacity, now))
+            tokens = min(self.capacity, tokens + (now - stamp) * self.rate)
+            if tokens < 1:
+                self._buckets[key] = (tokens, now)
+                self.limited += 1
+                raise RateLimited(math.ceil((1 - tokens) / self.rate))
+            self._buckets[key] = (tokens - 1, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class Hasher:
+    """Bounded process pool for generate_password_hash and check_password_hash"""
+
+    def __init__(self, workers=WORKERS, max_pending=MAX_PENDING, method=METHOD, timeout=TIMEOUT):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.method = method
+        self.timeout = timeout
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, pwhash, password):
+        return self._run(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        return needs_rehash(pwhash, self.method)
+
+    def _run(self, func, *args):
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                raise Busy()
+            self.pending += 1
+            if self.workers > 0 and self._executor is None:
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'),
+                                                     initializer=_init_worker, initargs=(os.getpid(), NICE))
+            executor = self._executor
+        if executor is None:
+            done = False
+            try:
+                result = func(*args)
+                done = True
+                return result
+            finally:
+                with self._lock:
+                    self.pending -= 1
+                    self.completed += done
+        try:
+            future = executor.submit(func, *args)
+        except (BrokenProcessPool, RuntimeError):  # RuntimeError: closed since we took it
+            with self._lock:
+                self.pending -= 1
+            self._discard(executor)
+            raise Busy() from None
+        # A hash stays pending until it has left the pool, not just until
+        # the request stops waiting for it, so MAX_PENDING bounds the queue
+        future.add_done_callback(self._finished)
+        try:
+            return future.result(self.timeout)
+        except FutureTimeout:
+            future.cancel()
+            raise Busy() from None
+        except CancelledError:  # close() or a broken pool cancelled it before it ran
+            raise Busy() from None
+        except BrokenProcessPool:
+            self._discard(executor)
+            raise Busy() from None
+
+    def _finished(self, future):
+        with self._lock:
+            self.pending -= 1
+            self.completed += not future.cancelled() and future.exception() is None
+
+    def _discard(self, executor):
+        """Drop a pool whose process died (e.g. killed for memory); the next hash starts a new one"""
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        return {'workers': self.workers, 'pending': self.pending, 'max_pending': self.max_pending,
+                'completed': self.completed, 'rejected': self.rejected, 'method': self.method}
+
+    def close(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        # Outside the lock: cancelling queued hashes runs _finished(), which takes it
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+_hashers = {}
+_hashers_lock = threading.Lock()
+
+
+def get_hasher(workers=WORKERS, max_pending=MAX_PENDING, method=METHOD):
+    """Return the process-wide Hasher for these settings, creating it once"""
+    with _hashers_lock:
+        hasher = _hashers.get((workers, max_pending, method))
+        if hasher is None:
+            hasher = _hashers[(workers, max_pending, method)] = Hasher(workers, max_pending, method)
+        return hasher
+
+
+def close_hashers():
+    with _hashers_lock:
+        for hasher in _hashers.values():
+            hasher.close()
+        _hashers.clear()
@@ -0,0 +1,227 @@
+"""Writing progress over time: per-save word-count events and rollups.
+
+Every change to a chapter's word_count, from any view, autosave, import or
+restore, appends a row to progress_events through a trigger on chapters:
+the change in words, the chapter and the day (UTC). A new chapter counts
+its words as written, a deleted one as removed.
+
+A trigger on progress_events adds each event to three rollups in
+progress_rollups, keyed by (user, grain, period):
+
+- day: 'YYYY-MM-DD',
+- week: the Monday the week starts on, 'YYYY-MM-DD',
+- month: 'YYYY-MM',
+
+with the words added and removed and the number of saves. The chart and
+goal queries read a primary-key range of these rows, one per period
+shown, so they cost the same after years of saves. streak() needs the
+whole history to find the longest run: it reads the author's day rows,
+one per day they wrote, so its cost grows with the days written (about
+365 rows a year, under a millisecond for several years), not with the
+saves. Raw events are kept for KEEP_DAYS and then removed by compact();
+the rollups stay.
+
+Progress measures changes in word count, not keystrokes: rewriting a
+paragraph with as many words as before adds nothing. The first time the
+schema is created, backfill() replays the word counts stored with chapter
+revisions, so existing projects start with as much history as their
+revisions still hold.
+"""
+
+from datetime import date, datetime, timedelta, timezone
+
+import database
+
+GRAINS = ('day', 'week', 'month')
+KEEP_DAYS = 365
+MAX_PERIODS = 366
+
+# grain -> SQL for the period a day ('YYYY-MM-DD' in `day`) falls in
+_PERIOD_SQL = {
+    'day': '{day}',
+    'week': "date({day}, 'weekday 0', '-6 days')",
+    'month': "strftime('%Y-%m', {day})",
+}
+
+
+def _rollup(grain):
+    """Upsert adding NEW (a progress_events row) to one rollup"""
+    period = _PERIOD_SQL[grain].format(day='NEW.day')
+    return f'''INSERT INTO progress_rollups (user_id, grain, period, added, removed, saves)
+        VALUES (NEW.user_id, '{grain}', {period}, max(NEW.delta, 0), max(-NEW.delta, 0), 1)
+        ON CONFLICT(user_id, grain, period) DO UPDATE SET
+            added = added + excluded.added, removed = removed + excluded.removed, saves = saves + 1;'''
+
+
+def _event(user, chapter, delta):
+    # While a user is being deleted the cascade removes their chapters;
+    # there is no one left to record progress for
+    return f'''INSERT INTO progress_events (user_id, chapter_id, day, delta)
+        SELECT {user}, {chapter}, date('now'), {delta}
+        WHERE {delta} != 0 AND EXISTS (SELECT 1 FROM users WHERE id = {user});'''
+
+
+TRIGGERS = {
+    'trg_progress_chapters_insert': f'''AFTER INSERT ON chapters BEGIN
+        {_event('NEW.user_id', 'NEW.id', 'COALESCE(NEW.word_count, 0)')}
+    END''',
+    'trg_progress_chapters_update': f'''AFTER UPDATE OF word_count ON chapters
+        WHEN OLD.word_count IS NOT NEW.word_count BEGIN
+        {_event('NEW.user_id', 'NEW.id', 'COALESCE(NEW.word_count, 0) - COALESCE(OLD.word_count, 0)')}
+    END''',
+    'trg_progress_chapters_delete': f'''AFTER DELETE ON chapters BEGIN
+        {_event('OLD.user_id', 'OLD.id', '-COALESCE(OLD.word_count, 0)')}
+    END''',
+    'trg_progress_rollups': f'''AFTER INSERT ON progress_events BEGIN
+        {' '.join(_rollup(grain) for grain in GRAINS)}
+    END''',
+}
+
+
+def create_schema(db):
+    """Create the event and rollup tables, their triggers and the goal column"""
+    db.execute('''CREATE TABLE IF NOT EXISTS progress_events (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        chapter_id INTEGER,
+        day TEXT NOT NULL,
+        delta INTEGER NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+    )''')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_progress_events_day ON progress_events(day)')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_progress_events_user ON progress_events(user_id, day)')
+    db.execute('''CREATE TABLE IF NOT EXISTS progress_rollups (
+        user_id INTEGER NOT NULL,
+        grain TEXT NOT NULL,
+        period TEXT NOT NULL,
+        added INTEGER NOT NULL DEFAULT 0,
+        removed INTEGER NOT NULL DEFAULT 0,
+        saves INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, grain, period),
+        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+    ) WITHOUT ROWID''')
+    for name, body in TRIGGERS.items():
+        db.execute(f'CREATE TRIGGER IF NOT EXISTS {name} {body}')
+    database.add_column(db, 'users', 'daily_word_goal', 'INTEGER NOT NULL DEFAULT 0')
+
+
+def backfill(db):
+    """Replay revision word counts as events, once; returns the number of events"""
+    if db.execute('SELECT 1 FROM progress_events LIMIT 1').fetchone():
+        return 0
+    # Each revision's change from the one before it, oldest kept revision
+    # counting in full, then whatever the chapter has that no revision does
+    cursor = db.execute('''
+        INSERT INTO progress_events (user_id, chapter_id, day, delta, created_at)
+        SELECT user_id, chapter_id, date(created_at), delta, created_at FROM (
+            SELECT r.user_id, r.chapter_id, r.created_at,
+                   COALESCE(r.word_count, 0) - COALESCE(LAG(r.word_count) OVER (
+                       PARTITION BY r.chapter_id ORDER BY r.revision), 0) AS delta
+            FROM chapter_revisions r JOIN chapters c ON c.id = r.chapter_id
+            UNION ALL
+            SELECT c.user_id, c.id, COALESCE(c.updated_at, c.created_at),
+                   COALESCE(c.word_count, 0) - COALESCE((
+                       SELECT r.word_count FROM chapter_revisions r WHERE r.chapter_id = c.id
+                       ORDER BY r.revision DESC LIMIT 1), 0)
+            FROM chapters c)
+        WHERE delta != 0 AND created_at IS NOT NULL
+        ORDER BY created_at''')
+    return cursor.rowcount
+
+
+def record(db, user_id, delta, day, chapter_id=None):
+    """Add an event for a given day (the triggers record today's saves)"""
+    db.execute('INSERT INTO progress_events (user_id, chapter_id, day, delta) VALUES (?, ?, ?, ?)',
+               (user_id, chapter_id, str(day), delta))
+
+
+def today():
+    return datetime.now(timezone.utc).date()
+
+
+def period_of(grain, day):
+    """Rollup key of the period `day` (a date) falls in"""
+    if grain == 'week':
+        return (day - timedelta(days=day.weekday())).isoformat()
+    if grain == 'month':
+        return day.strftime('%Y-%m')
+    return day.isoformat()
+
+
+def _previous(grain, day):
+    """A day in the period before the one `day` is in"""
+    if grain == 'week':
+        return day - timedelta(days=7)
+    if grain == 'month':
+        return day.replace(day=1) - timedelta(days=1)
+    return day - timedelta(days=1)
+
+
+def series(db, user_id, grain='day', periods=30, until=None):
+    """The last `periods` periods up to `until` (today), oldest first, gaps filled with zeros"""
+    day = until or today()
+    keys = []
+    for _ in range(periods):
+        keys.append(period_of(grain, day))
+        day = _previous(grain, day)
+    keys.reverse()
+    rows = {row['period']: row for row in db.execute(
+        '''SELECT period, added, removed, saves FROM progress_rollups
+           WHERE user_id = ? AND grain = ? AND period BETWEEN ? AND ?''',
+        (user_id, grain, keys[0], keys[-1]))}
+    result = []
+    for key in keys:
+        row = rows.get(key)
+        added, removed, saves = (row['added'], row['removed'], row['saves']) if row else (0, 0, 0)
+        result.append({'period': key, 'added': added, 'removed': removed, 'net': added - removed, 'saves': saves})
+    return result
+
+
+def get_goal(db, user_id):
+    """The author's daily word goal; 0 when they have none"""
+    row = db.execute('SELECT daily_word_goal FROM users WHERE id = ?', (user_id,)).fetchone()
+    return row[0] if row is not None else 0
+
+
+def set_goal(db, user_id, goal):
+    """Store the author's daily word goal (0 turns it off)"""
+    db.execute('UPDATE users SET daily_word_goal = ? WHERE id = ?', (goal, user_id))
+
+
+def streak(db, user_id, goal=None, until=None):
+    """Current and longest runs of days meeting the daily goal (any words added without one).
+
+    Today only extends the current streak; not having written yet today
+    does not break it. Reads every day row meeting the goal, for the
+    longest run.
+    """
+    if goal is None:
+        goal = get_goal(db, user_id)
+    day = until or today()
+    threshold = max(goal, 1)
+    days = [date.fromisoformat(row[0]) for row in db.execute(
+        '''SELECT period FROM progress_rollups
+           WHERE user_id = ? AND grain = 'day' AND added >= ? AND period <= ?
+           ORDER BY period''', (user_id, threshold, day.isoformat()))]
+
+    longest = run = 0
+    previous = None
+    for met in days:
+        run = run + 1 if previous is not None and met - previous == timedelta(days=1) else 1
+        longest = max(longest, run)
+        previous = met
+    current = run if previous is not None and day - previous <= timedelta(days=1) else 0
+
+    written = db.execute('''SELECT added, removed FROM progress_rollups
+                            WHERE user_id = ? AND grain = 'day' AND period = ?''',
+                         (user_id, day.isoformat())).fetchone()
+    added, removed = written if written else (0, 0)
+    return {'current': current, 'longest': longest, 'today': {'added': added, 'removed': removed},
+            'goal': goal, 'goal_met': bool(goal) and added >= goal}
+
+
+def compact(db, keep_days=KEEP_DAYS, until=None):
+    """Delete raw events older than `keep_days`; the rollups keep their totals"""
+    cutoff = ((until or today()) - timedelta(days=keep_days)).isoformat()
+    return db.execute('DELETE FROM progress_events WHERE day < ?', (cutoff,)).rowcount
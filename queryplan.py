@@ -0,0 +1,124 @@
+"""EXPLAIN QUERY PLAN for every SQL statement in the source.
+
+extract() finds the literal SQL passed to execute()/executemany(), and
+the first-page query of every pagination.seek() call, in a Python file,
+with the function and line it appears on. explain() asks SQLite how it
+would run each one against a real database, binding NULL to every
+parameter, and flags full-table scans: a `SCAN <table>` step that
+does not go through an index. `flask explain-queries` prints them, and
+with --baseline compares the plans with a saved run so a schema change
+that makes the planner give up an index shows up in review.
+
+Statements built with f-strings are listed as dynamic and not planned.
+"""
+
+import ast
+import json
+import re
+from collections import namedtuple
+
+PLANNED = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH', 'REPLACE')
+
+Statement = namedtuple('Statement', ['function', 'line', 'sql'])
+Plan = namedtuple('Plan', ['statement', 'steps', 'scans', 'error'])
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NAMED_RE = re.compile(r'[:@$]([A-Za-z_]\w*)')
+_SCAN_RE = re.compile(r'^SCAN (\w+)(.*)$')
+_SPACE_RE = re.compile(r'\s+')
+
+
+def extract(path):
+    """Statements passed as string literals to execute/executemany in `path`"""
+    with open(path, encoding='utf-8') as f:
+        tree = ast.parse(f.read(), path)
+
+    statements = []
+
+    def visit(node, function):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            function = node.name
+        if (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)
+                and node.func.attr in ('execute', 'executemany') and node.args):
+            sql = node.args[0]
+            if isinstance(sql, ast.Constant) and isinstance(sql.value, str):
+                statements.append(Statement(function, node.lineno, sql.value))
+            elif isinstance(sql, ast.JoinedStr):
+                statements.append(Statement(function, node.lineno, None))
+        if (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)
+                and node.func.attr == 'seek' and len(node.args) >= 4):
+            statements.append(Statement(function, node.lineno, _seek_sql(node.args[1], node.args[3])))
+        for child in ast.iter_child_nodes(node):
+            visit(child, function)
+
+    visit(tree, '<module>')
+    return statements
+
+
+def _seek_sql(query, order):
+    """The statement pagination.seek() runs for its first page"""
+    if not (isinstance(query, ast.Constant) and isinstance(query.value, str) and isinstance(order, ast.List)):
+        return None
+    exprs = []
+    for pair in order.elts:
+        if not (isinstance(pair, ast.Tuple) and isinstance(pair.elts[0], ast.Constant)):
+            return None
+        exprs.append(pair.elts[0].value)
+    return f"{query.value} ORDER BY {', '.join(exprs)} LIMIT ?"
+
+
+def _parameters(sql):
+    bare = _STRING_RE.sub("''", sql)
+    names = _NAMED_RE.findall(bare)
+    if names:
+        return {name: None for name in names}
+    return (None,) * bare.count('?')
+
+
+def explain(db, statements):
+    """A Plan for every statement that reads or writes rows"""
+    tables = {row[0] for row in db.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    plans = []
+    for statement in statements:
+        if statement.sql is None:
+            plans.append(Plan(statement, [], [], 'dynamic SQL'))
+            continue
+        if not statement.sql.lstrip().upper().startswith(PLANNED):
+            continue
+        try:
+            rows = db.execute('EXPLAIN QUERY PLAN ' + statement.sql, _parameters(statement.sql)).fetchall()
+        except Exception as e:  # sqlite3.Error, or a binding count we guessed wrong
+            plans.append(Plan(statement, [], [], str(e)))
+            continue
+        steps = [row[3] for row in rows]
+        scans = []
+        for step in steps:
+            match = _SCAN_RE.match(step)
+            if match and match.group(1) in tables and 'USING' not in match.group(2):
+                scans.append(match.group(1))
+        plans.append(Plan(statement, steps, scans, None))
+    return plans
+
+
+def check(db, paths):
+    plans = []
+    for path in paths:
+        plans.extend(explain(db, extract(path)))
+    return plans
+
+
+def _key(statement):
+    return f'{statement.function}: {_SPACE_RE.sub(" ", statement.sql or "").strip()}'
+
+
+def save_baseline(plans, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({_key(p.statement): p.steps for p in plans if not p.error}, f, indent=1, sort_keys=True)
+
+
+def compare(plans, path):
+    """[(plan, old steps)] for statements whose plan differs from the baseline"""
+    with open(path, encoding='utf-8') as f:
+        baseline = json.load(f)
+    return [(p, baseline[_key(p.statement)]) for p in plans
+            if not p.error and _key(p.statement) in baseline and baseline[_key(p.statement)] != p.steps]
@@ -0,0 +1,219 @@
+"""Chapter revision history stored as compressed deltas.
+
+Every save of a chapter becomes a row in chapter_revisions. Most rows hold a
+zlib-compressed delta against the previous revision; every SNAPSHOT_EVERY-th
+row holds a full compressed snapshot, so rebuilding any revision means
+reading one snapshot and at most SNAPSHOT_EVERY - 1 deltas.
+
+Deltas work on chunks of the chapter HTML (split after closing tags, line
+breaks and sentence ends) rather than on lines, because TinyMCE often saves
+a whole chapter on one line. Opening tags stay attached to the text after
+them: a chunk per `<p style="...">` would repeat thousands of times and make
+matching slow. A delta is a JSON list of operations: [i1, i2] copies chunks
+i1..i2 of the previous revision, a list of strings inserts new chunks.
+"""
+
+import difflib
+import json
+import re
+import zlib
+
+import database
+import textstats
+
+SNAPSHOT_EVERY = 25
+KEEP_REVISIONS = 200
+
+_BREAK_RE = re.compile(r'</[^>]*>|<br\s*/?>|\n|[.!?] ')
+
+
+def create_schema(db):
+    db.execute('''CREATE TABLE IF NOT EXISTS chapter_revisions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        chapter_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        revision INTEGER NOT NULL,
+        is_snapshot INTEGER NOT NULL DEFAULT 0,
+        data BLOB NOT NULL,
+        size INTEGER NOT NULL,
+        word_count INTEGER DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (chapter_id) REFERENCES chapters(id) ON DELETE CASCADE,
+        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+    )''')
+    db.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_revisions_chapter ON chapter_revisions(chapter_id, revision)')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_revisions_user ON chapter_revisions(user_id)')
+    database.add_column(db, 'chapter_revisions', 'autosave', 'INTEGER NOT NULL DEFAULT 0')
+
+
+def split_chunks(content):
+    content = content or ''
+    chunks, start = [], 0
+    for match in _BREAK_RE.finditer(content):
+        chunks.append(content[start:match.end()])
+        start = match.end()
+    chunks.append(content[start:])
+    return chunks
+
+
+def make_delta(old, new):
+    """Encode `new` as operations against `old`"""
+    old_chunks = split_chunks(old)
+    new_chunks = split_chunks(new)
+
+    # Most saves touch one spot, so only the middle needs a real diff
+    limit = min(len(old_chunks), len(new_chunks))
+    head = 0
+    while head < limit and old_chunks[head] == new_chunks[head]:
+        head += 1
+    tail = 0
+    while tail < limit - head and old_chunks[-1 - tail] == new_chunks[-1 - tail]:
+        tail += 1
+
+    ops = [[0, head]] if head else []
+    matcher = difflib.SequenceMatcher(None, old_chunks[head:len(old_chunks) - tail],
+                                      new_chunks[head:len(new_chunks) - tail], autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            ops.append([head + i1, head + i2])
+        elif j2 > j1:
+            ops.append(new_chunks[head + j1:head + j2])
+    if tail:
+        ops.append([len(old_chunks) - tail, len(old_chunks)])
+    return ops
+
+
+def apply_delta(old_chunks, ops):
+    """Rebuild the chunk list of a revision from its predecessor's"""
+    chunks = []
+    for op in ops:
+        if isinstance(op[0], str):
+            chunks.extend(op)
+        else:
+            chunks.extend(old_chunks[op[0]:op[1]])
+    return chunks
+
+
+def _pack(value):
+    return zlib.compress(json.dumps(value, separators=(',', ':')).encode(), 6)
+
+
+def _unpack(data):
+    return json.loads(zlib.decompress(data))
+
+
+def latest(db, chapter_id):
+    """Return the newest revision row of a chapter, or None"""
+    return db.execute('''SELECT * FROM chapter_revisions WHERE chapter_id = ?
+                         ORDER BY revision DESC LIMIT 1''', (chapter_id,)).fetchone()
+
+
+def record(db, chapter_id, user_id, content, word_count=0, previous=None, coalesce=0):
+    """Store `content` as the next revision of a chapter.
+
+    `previous` is the content of the newest stored revision (normally the
+    chapter's content before this save), which saves rebuilding it. For a
+    chapter written before it had any history, `previous` is stored first
+    as its baseline. Nothing is stored when the content has not changed.
+
+    With `coalesce` (seconds) the save is an autosave: when the newest
+    revision is an autosave started less than that long ago it is rewritten
+    instead of adding another one.
+
+    Returns the revision number the content was stored as, or None.
+    """
+    content = content or ''
+    last = latest(db, chapter_id)
+    if last is None and previous and previous != content:
+        record(db, chapter_id, user_id, previous, textstats.analyze(previous).word_count)
+        last = latest(db, chapter_id)
+    if last is not None and previous is None:
+        previous = reconstruct(db, chapter_id, last['revision'])
+    if last is not None and previous == content:
+        return None
+    if coalesce and last is not None and last['autosave'] and db.execute(
+            "SELECT created_at >= datetime('now', ?) FROM chapter_revisions WHERE id = ?",
+            (f'-{int(coalesce)} seconds', last['id'])).fetchone()[0]:
+        return _rewrite(db, chapter_id, last, content, word_count)
+
+    revision = last['revision'] + 1 if last is not None else 1
+    if (revision - 1) % SNAPSHOT_EVERY == 0 or last is None:
+        is_snapshot, data = 1, _pack(content)
+    else:
+        is_snapshot, data = 0, _pack(make_delta(previous, content))
+
+    db.execute('''INSERT INTO chapter_revisions
+                  (chapter_id, user_id, revision, is_snapshot, data, size, word_count, autosave)
+                  VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+               (chapter_id, user_id, revision, is_snapshot, data, len(content), word_count, int(bool(coalesce))))
+    return revision
+
+
+def _rewrite(db, chapter_id, last, content, word_count):
+    """Replace the content of the newest revision"""
+    if last['is_snapshot']:
+        data = _pack(content)
+    else:
+        data = _pack(make_delta(reconstruct(db, chapter_id, last['revision'] - 1), content))
+    db.execute('UPDATE chapter_revisions SET data = ?, size = ?, word_count = ? WHERE id = ?',
+               (data, len(content), word_count, last['id']))
+    return last['revision']
+
+
+def reconstruct(db, chapter_id, revision):
+    """Rebuild the content of one revision, or return None if it does not exist"""
+    base = db.execute('''SELECT revision, data FROM chapter_revisions
+                         WHERE chapter_id = ? AND revision <= ? AND is_snapshot = 1
+                         ORDER BY revision DESC LIMIT 1''', (chapter_id, revision)).fetchone()
+    if base is None:
+        return None
+    chunks = split_chunks(_unpack(base['data']))
+    deltas = db.execute('''SELECT revision, data FROM chapter_revisions
+                           WHERE chapter_id = ? AND revision > ? AND revision <= ?
+                           ORDER BY revision''', (chapter_id, base['revision'], revision)).fetchall()
+    if (deltas[-1]['revision'] if deltas else base['revision']) != revision:
+        return None
+    for row in deltas:
+        chunks = apply_delta(chunks, _unpack(row['data']))
+    return ''.join(chunks)
+
+
+def list_revisions(db, chapter_id):
+    """A chapter's revisions, newest first, without their data"""
+    return db.execute('''SELECT revision, is_snapshot, autosave, size, word_count, length(data) as stored, created_at
+                         FROM chapter_revisions WHERE chapter_id = ?
+                         ORDER BY revision DESC''', (chapter_id,)).fetchall()
+
+
+def diff(old, new, old_label='', new_label=''):
+    """Unified diff of two revisions, one chunk per line"""
+    return difflib.unified_diff([chunk.rstrip('\n') for chunk in split_chunks(old)],
+                                [chunk.rstrip('\n') for chunk in split_chunks(new)],
+                                old_label, new_label, lineterm='')
+
+
+def compact(db, keep=KEEP_REVISIONS, chapter_id=None):
+    """Drop all but the newest `keep` revisions of each chapter.
+
+    The oldest surviving revision is rewritten as a snapshot first so the
+    remaining delta chain can still be rebuilt. Returns the number of
+    revisions deleted.
+    """
+    where, params = ('WHERE chapter_id = ?', (chapter_id,)) if chapter_id is not None else ('', ())
+    chapters = db.execute(f'''SELECT chapter_id, MAX(revision) as newest FROM chapter_revisions
+                              {where} GROUP BY chapter_id HAVING COUNT(*) > ?''',
+                          params + (keep,)).fetchall()
+    deleted = 0
+    for row in chapters:
+        oldest_kept = row['newest'] - keep + 1
+        kept = db.execute('SELECT is_snapshot FROM chapter_revisions WHERE chapter_id = ? AND revision = ?',
+                          (row['chapter_id'], oldest_kept)).fetchone()
+        if kept is not None and not kept['is_snapshot']:
+            content = reconstruct(db, row['chapter_id'], oldest_kept)
+            db.execute('''UPDATE chapter_revisions SET is_snapshot = 1, data = ?
+                          WHERE chapter_id = ? AND revision = ?''',
+                       (_pack(content), row['chapter_id'], oldest_kept))
+        cursor = db.execute('DELETE FROM chapter_revisions WHERE chapter_id = ? AND revision < ?',
+                            (row['chapter_id'], oldest_kept))
+        deleted += cursor.rowcount
+    return deleted
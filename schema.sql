@@ -1,86 +1,348 @@
--- حذف الجداول القديمة إذا كانت موجودة
-DROP TABLE IF EXISTS relationships;
-DROP TABLE IF EXISTS timeline;
-DROP TABLE IF EXISTS chapters;
-DROP TABLE IF EXISTS characters;
-DROP TABLE IF EXISTS users;
-
--- جدول المستخدمين
-CREATE TABLE users (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    username TEXT UNIQUE NOT NULL,
-    email TEXT UNIQUE NOT NULL,
-    password_hash TEXT NOT NULL,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-);
-
--- جدول الشخصيات
-CREATE TABLE characters (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    user_id INTEGER NOT NULL,
-    name TEXT NOT NULL,
-    age INTEGER,
-    role TEXT,
-    description TEXT,
-    personality TEXT,
-    background TEXT,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
-);
-
--- جدول الفصول
+-- Generated by `flask schema-dump` at schema version 15.
+-- Reference only: create and upgrade databases with `flask migrate`.
+
+CREATE TABLE chapter_mentions (
+        chapter_id INTEGER NOT NULL,
+        character_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        mentions INTEGER NOT NULL,
+        first_offset INTEGER NOT NULL,
+        PRIMARY KEY (chapter_id, character_id),
+        FOREIGN KEY (chapter_id) REFERENCES chapters(id) ON DELETE CASCADE,
+        FOREIGN KEY (character_id) REFERENCES characters(id) ON DELETE CASCADE,
+        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+    ) WITHOUT ROWID;
+
+CREATE TABLE chapter_revisions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        chapter_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        revision INTEGER NOT NULL,
+        is_snapshot INTEGER NOT NULL DEFAULT 0,
+        data BLOB NOT NULL,
+        size INTEGER NOT NULL,
+        word_count INTEGER DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, autosave INTEGER NOT NULL DEFAULT 0,
+        FOREIGN KEY (chapter_id) REFERENCES chapters(id) ON DELETE CASCADE,
+        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+    );
+
 CREATE TABLE chapters (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    user_id INTEGER NOT NULL,
-    title TEXT NOT NULL,
-    chapter_number INTEGER NOT NULL,
-    content TEXT,
-    word_count INTEGER DEFAULT 0,
-    status TEXT DEFAULT 'draft',
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
-);
-
--- جدول الأحداث (Timeline)
-CREATE TABLE timeline (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    user_id INTEGER NOT NULL,
-    event_title TEXT NOT NULL,
-    event_date TEXT,
-    description TEXT,
-    chapter_id INTEGER,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
-    FOREIGN KEY (chapter_id) REFERENCES chapters(id) ON DELETE SET NULL
-);
-
--- جدول العلاقات بين الشخصيات
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        title TEXT NOT NULL,
+        chapter_number INTEGER NOT NULL,
+        content TEXT,
+        word_count INTEGER DEFAULT 0,
+        status TEXT DEFAULT 'draft',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, char_count INTEGER DEFAULT 0, paragraph_count INTEGER DEFAULT 0, sentence_count INTEGER DEFAULT 0, reading_minutes INTEGER DEFAULT 0, excerpt TEXT, version INTEGER NOT NULL DEFAULT 1, sort_key INTEGER,
+        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+    );
+
+CREATE VIRTUAL TABLE chapters_fts USING fts5(
+            owner, title, body, tokenize = 'porter unicode61 remove_diacritics 2', prefix = '2 3');
+
+CREATE TABLE characters (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        age INTEGER,
+        role TEXT,
+        description TEXT,
+        personality TEXT,
+        background TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, aliases TEXT,
+        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+    );
+
+CREATE VIRTUAL TABLE characters_fts USING fts5(
+            owner, name, description, personality, background, tokenize = 'porter unicode61 remove_diacritics 2', prefix = '2 3');
+
+CREATE TABLE progress_events (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        chapter_id INTEGER,
+        day TEXT NOT NULL,
+        delta INTEGER NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+    );
+
+CREATE TABLE progress_rollups (
+        user_id INTEGER NOT NULL,
+        grain TEXT NOT NULL,
+        period TEXT NOT NULL,
+        added INTEGER NOT NULL DEFAULT 0,
+        removed INTEGER NOT NULL DEFAULT 0,
+        saves INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, grain, period),
+        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+    ) WITHOUT ROWID;
+
 CREATE TABLE relationships (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    user_id INTEGER NOT NULL,
-    character1_id INTEGER NOT NULL,
-    character2_id INTEGER NOT NULL,
-    relationship_type TEXT NOT NULL,
-    description TEXT,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
-    FOREIGN KEY (character1_id) REFERENCES characters(id) ON DELETE CASCADE,
-    FOREIGN KEY (character2_id) REFERENCES characters(id) ON DELETE CASCADE
-);
-
--- إنشاء Indexes لتحسين الأداء
-CREATE INDEX idx_characters_user_id ON characters(user_id);
-CREATE INDEX idx_chapters_user_id ON chapters(user_id);
-CREATE INDEX idx_chapters_number ON chapters(chapter_number);
-CREATE INDEX idx_timeline_user_id ON timeline(user_id);
-CREATE INDEX idx_timeline_chapter_id ON timeline(chapter_id);
-CREATE INDEX idx_relationships_user_id ON relationships(user_id);
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        character1_id INTEGER NOT NULL,
+        character2_id INTEGER NOT NULL,
+        relationship_type TEXT NOT NULL,
+        description TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+        FOREIGN KEY (character1_id) REFERENCES characters(id) ON DELETE CASCADE,
+        FOREIGN KEY (character2_id) REFERENCES characters(id) ON DELETE CASCADE
+    );
+
+CREATE TABLE schema_version (
+        version INTEGER PRIMARY KEY,
+        description TEXT NOT NULL,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        duration_ms INTEGER
+    );
+
+CREATE TABLE timeline (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        event_title TEXT NOT NULL,
+        event_date TEXT,
+        description TEXT,
+        chapter_id INTEGER,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, sort_key REAL,
+        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+        FOREIGN KEY (chapter_id) REFERENCES chapters(id) ON DELETE SET NULL
+    );
+
+CREATE VIRTUAL TABLE timeline_fts USING fts5(
+            owner, event_title, description, tokenize = 'porter unicode61 remove_diacritics 2', prefix = '2 3');
+
+CREATE TABLE user_stats (
+        user_id INTEGER PRIMARY KEY,
+        characters INTEGER NOT NULL DEFAULT 0,
+        chapters INTEGER NOT NULL DEFAULT 0,
+        words INTEGER NOT NULL DEFAULT 0,
+        timeline INTEGER NOT NULL DEFAULT 0,
+        relationships INTEGER NOT NULL DEFAULT 0, data_version INTEGER NOT NULL DEFAULT 0,
+        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+    );
+
+CREATE TABLE users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE NOT NULL,
+        email TEXT UNIQUE NOT NULL,
+        password_hash TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    , daily_word_goal INTEGER NOT NULL DEFAULT 0);
+
+CREATE INDEX idx_chapters_user ON chapters(user_id);
+
+CREATE INDEX idx_chapters_user_number ON chapters(user_id, chapter_number);
+
+CREATE INDEX idx_chapters_user_sort ON chapters(user_id, sort_key);
+
+CREATE INDEX idx_characters_user ON characters(user_id);
+
+CREATE INDEX idx_characters_user_created ON characters(user_id, created_at);
+
+CREATE INDEX idx_mentions_character ON chapter_mentions(character_id);
+
+CREATE INDEX idx_mentions_user ON chapter_mentions(user_id);
+
+CREATE INDEX idx_progress_events_day ON progress_events(day);
+
+CREATE INDEX idx_progress_events_user ON progress_events(user_id, day);
+
+CREATE INDEX idx_relationships_char2 ON relationships(character2_id);
+
 CREATE INDEX idx_relationships_chars ON relationships(character1_id, character2_id);
 
--- إدراج بيانات تجريبية (اختياري)
-INSERT INTO users (username, email, password_hash) VALUES
-('demo_user', 'demo@narreyes.com', 'scrypt:32768:8:1$salt$hash');
+CREATE INDEX idx_relationships_user ON relationships(user_id);
+
+CREATE INDEX idx_relationships_user_created ON relationships(user_id, created_at);
+
+CREATE UNIQUE INDEX idx_revisions_chapter ON chapter_revisions(chapter_id, revision);
+
+CREATE INDEX idx_revisions_user ON chapter_revisions(user_id);
+
+CREATE INDEX idx_timeline_chapter ON timeline(chapter_id);
+
+CREATE INDEX idx_timeline_user ON timeline(user_id);
+
+CREATE INDEX idx_timeline_user_sort ON timeline(user_id, sort_key, id);
+
+CREATE TRIGGER trg_chapters_fts_delete AFTER DELETE ON chapters BEGIN
+            DELETE FROM chapters_fts WHERE rowid = OLD.id;
+        END;
+
+CREATE TRIGGER trg_chapters_fts_insert AFTER INSERT ON chapters BEGIN
+            INSERT INTO chapters_fts (rowid, owner, title, body) VALUES (NEW.id, 'u' || NEW.user_id, NEW.title, strip_html(NEW.content));
+        END;
+
+CREATE TRIGGER trg_chapters_fts_update
+            AFTER UPDATE OF user_id, title, content ON chapters BEGIN
+            DELETE FROM chapters_fts WHERE rowid = OLD.id;
+            INSERT INTO chapters_fts (rowid, owner, title, body) VALUES (NEW.id, 'u' || NEW.user_id, NEW.title, strip_html(NEW.content));
+        END;
+
+CREATE TRIGGER trg_chapters_sort_key
+    AFTER INSERT ON chapters WHEN NEW.sort_key IS NULL BEGIN
+        UPDATE chapters
+        SET sort_key = (SELECT COALESCE(MAX(sort_key), 0) FROM chapters
+                        WHERE user_id = NEW.user_id AND id != NEW.id) + 1024
+        WHERE id = NEW.id;
+    END;
+
+CREATE TRIGGER trg_characters_fts_delete AFTER DELETE ON characters BEGIN
+            DELETE FROM characters_fts WHERE rowid = OLD.id;
+        END;
+
+CREATE TRIGGER trg_characters_fts_insert AFTER INSERT ON characters BEGIN
+            INSERT INTO characters_fts (rowid, owner, name, description, personality, background) VALUES (NEW.id, 'u' || NEW.user_id, NEW.name, NEW.description, NEW.personality, NEW.background);
+        END;
+
+CREATE TRIGGER trg_characters_fts_update
+            AFTER UPDATE OF user_id, name, description, personality, background ON characters BEGIN
+            DELETE FROM characters_fts WHERE rowid = OLD.id;
+            INSERT INTO characters_fts (rowid, owner, name, description, personality, background) VALUES (NEW.id, 'u' || NEW.user_id, NEW.name, NEW.description, NEW.personality, NEW.background);
+        END;
+
+CREATE TRIGGER trg_progress_chapters_delete AFTER DELETE ON chapters BEGIN
+        INSERT INTO progress_events (user_id, chapter_id, day, delta)
+        SELECT OLD.user_id, OLD.id, date('now'), -COALESCE(OLD.word_count, 0)
+        WHERE -COALESCE(OLD.word_count, 0) != 0 AND EXISTS (SELECT 1 FROM users WHERE id = OLD.user_id);
+    END;
+
+CREATE TRIGGER trg_progress_chapters_insert AFTER INSERT ON chapters BEGIN
+        INSERT INTO progress_events (user_id, chapter_id, day, delta)
+        SELECT NEW.user_id, NEW.id, date('now'), COALESCE(NEW.word_count, 0)
+        WHERE COALESCE(NEW.word_count, 0) != 0 AND EXISTS (SELECT 1 FROM users WHERE id = NEW.user_id);
+    END;
+
+CREATE TRIGGER trg_progress_chapters_update AFTER UPDATE OF word_count ON chapters
+        WHEN OLD.word_count IS NOT NEW.word_count BEGIN
+        INSERT INTO progress_events (user_id, chapter_id, day, delta)
+        SELECT NEW.user_id, NEW.id, date('now'), COALESCE(NEW.word_count, 0) - COALESCE(OLD.word_count, 0)
+        WHERE COALESCE(NEW.word_count, 0) - COALESCE(OLD.word_count, 0) != 0 AND EXISTS (SELECT 1 FROM users WHERE id = NEW.user_id);
+    END;
+
+CREATE TRIGGER trg_progress_rollups AFTER INSERT ON progress_events BEGIN
+        INSERT INTO progress_rollups (user_id, grain, period, added, removed, saves)
+        VALUES (NEW.user_id, 'day', NEW.day, max(NEW.delta, 0), max(-NEW.delta, 0), 1)
+        ON CONFLICT(user_id, grain, period) DO UPDATE SET
+            added = added + excluded.added, removed = removed + excluded.removed, saves = saves + 1; INSERT INTO progress_rollups (user_id, grain, period, added, removed, saves)
+        VALUES (NEW.user_id, 'week', date(NEW.day, 'weekday 0', '-6 days'), max(NEW.delta, 0), max(-NEW.delta, 0), 1)
+        ON CONFLICT(user_id, grain, period) DO UPDATE SET
+            added = added + excluded.added, removed = removed + excluded.removed, saves = saves + 1; INSERT INTO progress_rollups (user_id, grain, period, added, removed, saves)
+        VALUES (NEW.user_id, 'month', strftime('%Y-%m', NEW.day), max(NEW.delta, 0), max(-NEW.delta, 0), 1)
+        ON CONFLICT(user_id, grain, period) DO UPDATE SET
+            added = added + excluded.added, removed = removed + excluded.removed, saves = saves + 1;
+    END;
+
+CREATE TRIGGER trg_stats_chapters_delete AFTER DELETE ON chapters BEGIN
+        INSERT INTO user_stats (user_id, chapters) VALUES (OLD.user_id, -1) ON CONFLICT(user_id) DO UPDATE SET chapters = chapters + (-1);
+        INSERT INTO user_stats (user_id, words) VALUES (OLD.user_id, -COALESCE(OLD.word_count, 0)) ON CONFLICT(user_id) DO UPDATE SET words = words + (-COALESCE(OLD.word_count, 0));
+    END;
+
+CREATE TRIGGER trg_stats_chapters_insert AFTER INSERT ON chapters BEGIN
+        INSERT INTO user_stats (user_id, chapters) VALUES (NEW.user_id, 1) ON CONFLICT(user_id) DO UPDATE SET chapters = chapters + (1);
+        INSERT INTO user_stats (user_id, words) VALUES (NEW.user_id, COALESCE(NEW.word_count, 0)) ON CONFLICT(user_id) DO UPDATE SET words = words + (COALESCE(NEW.word_count, 0));
+    END;
+
+CREATE TRIGGER trg_stats_chapters_update AFTER UPDATE OF word_count, user_id ON chapters BEGIN
+        INSERT INTO user_stats (user_id, words) VALUES (OLD.user_id, -COALESCE(OLD.word_count, 0)) ON CONFLICT(user_id) DO UPDATE SET words = words + (-COALESCE(OLD.word_count, 0));
+        INSERT INTO user_stats (user_id, words) VALUES (NEW.user_id, COALESCE(NEW.word_count, 0)) ON CONFLICT(user_id) DO UPDATE SET words = words + (COALESCE(NEW.word_count, 0));
+    END;
+
+CREATE TRIGGER trg_stats_characters_delete AFTER DELETE ON characters BEGIN
+        INSERT INTO user_stats (user_id, characters) VALUES (OLD.user_id, -1) ON CONFLICT(user_id) DO UPDATE SET characters = characters + (-1);
+    END;
+
+CREATE TRIGGER trg_stats_characters_insert AFTER INSERT ON characters BEGIN
+        INSERT INTO user_stats (user_id, characters) VALUES (NEW.user_id, 1) ON CONFLICT(user_id) DO UPDATE SET characters = characters + (1);
+    END;
+
+CREATE TRIGGER trg_stats_relationships_delete AFTER DELETE ON relationships BEGIN
+        INSERT INTO user_stats (user_id, relationships) VALUES (OLD.user_id, -1) ON CONFLICT(user_id) DO UPDATE SET relationships = relationships + (-1);
+    END;
+
+CREATE TRIGGER trg_stats_relationships_insert AFTER INSERT ON relationships BEGIN
+        INSERT INTO user_stats (user_id, relationships) VALUES (NEW.user_id, 1) ON CONFLICT(user_id) DO UPDATE SET relationships = relationships + (1);
+    END;
+
+CREATE TRIGGER trg_stats_timeline_delete AFTER DELETE ON timeline BEGIN
+        INSERT INTO user_stats (user_id, timeline) VALUES (OLD.user_id, -1) ON CONFLICT(user_id) DO UPDATE SET timeline = timeline + (-1);
+    END;
+
+CREATE TRIGGER trg_stats_timeline_insert AFTER INSERT ON timeline BEGIN
+        INSERT INTO user_stats (user_id, timeline) VALUES (NEW.user_id, 1) ON CONFLICT(user_id) DO UPDATE SET timeline = timeline + (1);
+    END;
+
+CREATE TRIGGER trg_stats_users_delete AFTER DELETE ON users BEGIN
+        DELETE FROM user_stats WHERE user_id = OLD.id;
+    END;
+
+CREATE TRIGGER trg_stats_users_insert AFTER INSERT ON users BEGIN
+        INSERT OR IGNORE INTO user_stats (user_id) VALUES (NEW.id);
+    END;
+
+CREATE TRIGGER trg_timeline_fts_delete AFTER DELETE ON timeline BEGIN
+            DELETE FROM timeline_fts WHERE rowid = OLD.id;
+        END;
+
+CREATE TRIGGER trg_timeline_fts_insert AFTER INSERT ON timeline BEGIN
+            INSERT INTO timeline_fts (rowid, owner, event_title, description) VALUES (NEW.id, 'u' || NEW.user_id, NEW.event_title, NEW.description);
+        END;
+
+CREATE TRIGGER trg_timeline_fts_update
+            AFTER UPDATE OF user_id, event_title, description ON timeline BEGIN
+            DELETE FROM timeline_fts WHERE rowid = OLD.id;
+            INSERT INTO timeline_fts (rowid, owner, event_title, description) VALUES (NEW.id, 'u' || NEW.user_id, NEW.event_title, NEW.description);
+        END;
+
+CREATE TRIGGER trg_version_chapters_delete AFTER DELETE ON chapters BEGIN
+        INSERT INTO user_stats (user_id, data_version) VALUES (OLD.user_id, 1) ON CONFLICT(user_id) DO UPDATE SET data_version = data_version + (1);
+    END;
+
+CREATE TRIGGER trg_version_chapters_insert AFTER INSERT ON chapters BEGIN
+        INSERT INTO user_stats (user_id, data_version) VALUES (NEW.user_id, 1) ON CONFLICT(user_id) DO UPDATE SET data_version = data_version + (1);
+    END;
+
+CREATE TRIGGER trg_version_chapters_update AFTER UPDATE ON chapters BEGIN
+        INSERT INTO user_stats (user_id, data_version) VALUES (NEW.user_id, 1) ON CONFLICT(user_id) DO UPDATE SET data_version = data_version + (1);
+    END;
+
+CREATE TRIGGER trg_version_characters_delete AFTER DELETE ON characters BEGIN
+        INSERT INTO user_stats (user_id, data_version) VALUES (OLD.user_id, 1) ON CONFLICT(user_id) DO UPDATE SET data_version = data_version + (1);
+    END;
+
+CREATE TRIGGER trg_version_characters_insert AFTER INSERT ON characters BEGIN
+        INSERT INTO user_stats (user_id, data_version) VALUES (NEW.user_id, 1) ON CONFLICT(user_id) DO UPDATE SET data_version = data_version + (1);
+    END;
+
+CREATE TRIGGER trg_version_characters_update AFTER UPDATE ON characters BEGIN
+        INSERT INTO user_stats (user_id, data_version) VALUES (NEW.user_id, 1) ON CONFLICT(user_id) DO UPDATE SET data_version = data_version + (1);
+    END;
+
+CREATE TRIGGER trg_version_relationships_delete AFTER DELETE ON relationships BEGIN
+        INSERT INTO user_stats (user_id, data_version) VALUES (OLD.user_id, 1) ON CONFLICT(user_id) DO UPDATE SET data_version = data_version + (1);
+    END;
+
+CREATE TRIGGER trg_version_relationships_insert AFTER INSERT ON relationships BEGIN
+        INSERT INTO user_stats (user_id, data_version) VALUES (NEW.user_id, 1) ON CONFLICT(user_id) DO UPDATE SET data_version = data_version + (1);
+    END;
+
+CREATE TRIGGER trg_version_relationships_update AFTER UPDATE ON relationships BEGIN
+        INSERT INTO user_stats (user_id, data_version) VALUES (NEW.user_id, 1) ON CONFLICT(user_id) DO UPDATE SET data_version = data_version + (1);
+    END;
+
+CREATE TRIGGER trg_version_timeline_delete AFTER DELETE ON timeline BEGIN
+        INSERT INTO user_stats (user_id, data_version) VALUES (OLD.user_id, 1) ON CONFLICT(user_id) DO UPDATE SET data_version = data_version + (1);
+    END;
+
+CREATE TRIGGER trg_version_timeline_insert AFTER INSERT ON timeline BEGIN
+        INSERT INTO user_stats (user_id, data_version) VALUES (NEW.user_id, 1) ON CONFLICT(user_id) DO UPDATE SET data_version = data_version + (1);
+    END;
+
+CREATE TRIGGER trg_version_timeline_update AFTER UPDATE ON timeline BEGIN
+        INSERT INTO user_stats (user_id, data_version) VALUES (NEW.user_id, 1) ON CONFLICT(user_id) DO UPDATE SET data_version = data_version + (1);
+    END;
 
--- رسالة نجاح
-SELECT 'Database created successfully!' AS message;
@@ -0,0 +1,186 @@
+"""Full-text search over chapters, characters and timeline events.
+
+Each source table has an FTS5 mirror whose rowid is the source row's id.
+Triggers keep the mirrors in sync on insert, update and delete; chapter HTML
+is indexed as plain text through the strip_html() SQL function that
+database.connect() registers on every connection.
+
+Every mirror also indexes an `owner` token (u<user id>) so a search is
+scoped to one author inside the FTS index itself instead of filtering
+matches afterwards. Results are ranked with bm25 and carry a highlighted
+snippet. Snippets are cut in Python around the first hit of the top rows
+only, because FTS5's snippet() rescans every hit of every matching row and
+gets very slow on long chapters full of a common word.
+"""
+
+import re
+
+from markupsafe import Markup, escape
+
+TOKENIZER = 'porter unicode61 remove_diacritics 2'
+SNIPPET_CHARS = 200
+
+# kind -> (FTS table, source table, indexed columns, column weights). The
+# first column is the result title, the others are used for the snippet.
+SOURCES = {
+    'chapter': ('chapters_fts', 'chapters', ('title', 'body'), (10.0, 1.0)),
+    'character': ('characters_fts', 'characters',
+                  ('name', 'description', 'personality', 'background'), (10.0, 2.0, 1.0, 1.0)),
+    'event': ('timeline_fts', 'timeline', ('event_title', 'description'), (10.0, 1.0)),
+}
+
+# Source columns each mirror column is filled from, in order
+_SOURCE_COLUMNS = {
+    'chapter': ('title', 'content'),
+    'character': ('name', 'description', 'personality', 'background'),
+    'event': ('event_title', 'description'),
+}
+
+# Source columns that need converting before they are indexed
+_TRANSFORMS = {
+    ('chapter', 'content'): 'strip_html({})',
+}
+
+_TERM_RE = re.compile(r'\w+\*?', re.UNICODE)
+
+
+def create_schema(db):
+    """Create the FTS5 mirrors and their triggers, filling them the first time"""
+    for kind, (fts, source, columns, _) in SOURCES.items():
+        exists = db.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (fts,)).fetchone()
+        db.execute(f'''CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+            owner, {", ".join(columns)}, tokenize = '{TOKENIZER}', prefix = '2 3')''')
+
+        values = _source_values(kind, 'NEW.')
+        insert = (f"INSERT INTO {fts} (rowid, owner, {', '.join(columns)}) "
+                  f"VALUES (NEW.id, 'u' || NEW.user_id, {values});")
+        db.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_{fts}_insert AFTER INSERT ON {source} BEGIN
+            {insert}
+        END''')
+        db.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_{fts}_update
+            AFTER UPDATE OF user_id, {', '.join(_SOURCE_COLUMNS[kind])} ON {source} BEGIN
+            DELETE FROM {fts} WHERE rowid = OLD.id;
+            {insert}
+        END''')
+        db.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_{fts}_delete AFTER DELETE ON {source} BEGIN
+            DELETE FROM {fts} WHERE rowid = OLD.id;
+        END''')
+
+        if not exists:
+            _fill(db, kind)
+
+
+def _source_values(kind, prefix=''):
+    """SQL expressions producing a mirror row from a source row"""
+    values = []
+    for column in _SOURCE_COLUMNS[kind]:
+        values.append(_TRANSFORMS.get((kind, column), '{}').format(prefix + column))
+    return ', '.join(values)
+
+
+def _fill(db, kind):
+    fts, source, columns, _ = SOURCES[kind]
+    values = _source_values(kind)
+    db.execute(f"INSERT INTO {fts} (rowid, owner, {', '.join(columns)}) "
+               f"SELECT id, 'u' || user_id, {values} FROM {source}")
+
+
+def rebuild(db):
+    """Drop and refill every FTS mirror from the source tables"""
+    for kind, (fts, _, _, _) in SOURCES.items():
+        db.execute(f'DELETE FROM {fts}')
+        _fill(db, kind)
+        db.execute(f"INSERT INTO {fts} ({fts}) VALUES ('optimize')")
+
+
+def parse_terms(text):
+    """Words of a search box entry, as matched against the index"""
+    return _TERM_RE.findall(text or '')
+
+
+def build_query(terms):
+    """Turn search terms into a safe FTS5 query.
+
+    Every word becomes a quoted term, so FTS5 operators typed by the user are
+    treated as words. A trailing * asks for a prefix match; it is not added
+    automatically because expanding a long prefix merges the doclists of
+    every matching term and is far slower than an exact term. Returns None
+    when there is nothing to search for.
+    """
+    if not terms:
+        return None
+    return ' '.join(f'"{term.rstrip("*")}"*' if term.endswith('*') else f'"{term}"' for term in terms)
+
+
+def scoped_query(kind, user_id, query):
+    """Restrict an FTS5 query to one author's rows and to the content columns.
+
+    Without the column filter, a search for "u<id>" would match the owner
+    column of every row the author has.
+    """
+    columns = ' '.join(SOURCES[kind][2])
+    return f'owner : "u{int(user_id)}" AND {{{columns}}} : ({query})'
+
+
+def make_snippet(text, terms, length=SNIPPET_CHARS):
+    """Cut a window of `text` around the first search hit and mark the hits.
+
+    Returns safe HTML. Words that only match through stemming are not
+    highlighted; the window then starts at the beginning of the text.
+    """
+    if not text:
+        return Markup('')
+    words = [term.rstrip('*') for term in terms]
+
+    # A few str.find calls for the usual capitalisations locate the first hit
+    # much faster than a case-insensitive regex over a long chapter
+    variants = {variant for word in words for variant in (word.lower(), word.capitalize(), word.upper())}
+    hits = [index for index in map(text.find, variants) if index >= 0]
+    start = max(0, min(hits) - length // 3) if hits else 0
+    end = start + length
+    window = text[start:end]
+    if start > 0:
+        window = window.partition(' ')[2]
+    if end < len(text):
+        window = window.rpartition(' ')[0]
+
+    pattern = re.compile(r'(?<![&#])\b(?:' + '|'.join(map(re.escape, words)) + r')\w*', re.IGNORECASE)
+    marked = pattern.sub(lambda hit: f'<mark>{hit.group()}</mark>', str(escape(window)))
+    return Markup(('…' if start > 0 else '') + marked + ('…' if end < len(text) else ''))
+
+
+def search(db, user_id, text, kinds=None, limit=20):
+    """Search one author's project.
+
+    Returns a list of dicts with kind, id, title, snippet (safe HTML) and
+    score (lower is better, as with bm25), best matches first.
+    """
+    terms = parse_terms(text)
+    query = build_query(terms)
+    if query is None:
+        return []
+
+    results = []
+    for kind in kinds or SOURCES:
+        fts, _, columns, weights = SOURCES[kind]
+        match = scoped_query(kind, user_id, query)
+        # The owner column carries no weight in the ranking
+        rank = f"bm25({fts}, 0.0, {', '.join(str(w) for w in weights)})"
+        top = db.execute(f'''SELECT rowid, {rank} as score FROM {fts}
+                              WHERE {fts} MATCH ?
+                              ORDER BY score
+                              LIMIT ?''', (match, limit)).fetchall()
+        for row in top:
+            texts = db.execute(f'SELECT {", ".join(columns)} FROM {fts} WHERE rowid = ?',
+                               (row['rowid'],)).fetchone()
+            body = ' · '.join(texts[column] for column in columns[1:] if texts[column])
+            results.append({
+                'kind': kind,
+                'id': row['rowid'],
+                'title': texts[columns[0]],
+                'snippet': make_snippet(body, terms),
+                'score': row['score'],
+            })
+
+    results.sort(key=lambda result: result['score'])
+    return results[:limit]
@@ -0,0 +1,85 @@
+"""Configuration from the environment.
+
+create_app() calls load() once at startup. It reads a .env file from the
+working directory if python-dotenv is installed, without overriding
+variables that are already set, and copies every variable listed in
+SETTINGS into app.config, converting it to the setting's type. Variables
+that are not set leave the defaults from app.py alone.
+
+Secrets (SECRET_KEY, OPENROUTER_API_KEY, METRICS_TOKEN) have no usable
+default and are only ever read from here. See .env.example for the full
+list.
+"""
+
+import json
+import os
+
+try:
+    from dotenv import load_dotenv
+except ImportError:  # optional: plain environment variables work without it
+    load_dotenv = None
+
+
+class ConfigError(RuntimeError):
+    """A required setting is missing or a value cannot be parsed"""
+
+
+def _bool(value):
+    value = value.strip().lower()
+    if value in ('1', 'true', 'yes', 'on'):
+        return True
+    if value in ('0', 'false', 'no', 'off', ''):
+        return False
+    raise ValueError(f'expected a boolean, got {value!r}')
+
+
+# config key -> (environment variable, parser)
+SETTINGS = {
+    'SECRET_KEY': ('SECRET_KEY', str),
+    'DATABASE': ('DATABASE', str),
+    'DB_POOL_SIZE': ('DB_POOL_SIZE', int),
+    'AI_API_URL': ('OPENROUTER_API_URL', str),
+    'AI_API_KEY': ('OPENROUTER_API_KEY', str),
+    'AI_WORKERS': ('AI_WORKERS', int),
+    'AI_STREAM': ('AI_STREAM', _bool),
+    'AI_CONTEXT_TOKENS': ('AI_CONTEXT_TOKENS', int),
+    'TIMELINE_CALENDAR': ('TIMELINE_CALENDAR', json.loads),
+    'IMPORT_MAX_BYTES': ('IMPORT_MAX_BYTES', int),
+    'RENDER_CACHE_BYTES': ('RENDER_CACHE_BYTES', int),
+    'PASSWORD_HASH_METHOD': ('PASSWORD_HASH_METHOD', str),
+    'PASSWORD_WORKERS': ('PASSWORD_WORKERS', int),
+    'PASSWORD_MAX_PENDING': ('PASSWORD_MAX_PENDING', int),
+    'AUTH_IP_PER_MINUTE': ('AUTH_IP_PER_MINUTE', int),
+    'AUTH_USER_PER_MINUTE': ('AUTH_USER_PER_MINUTE', int),
+    'INSTRUMENTATION': ('INSTRUMENTATION', _bool),
+    'SLOW_QUERY_MS': ('SLOW_QUERY_MS', int),
+    'PROFILING': ('PROFILING', _bool),
+    'PROFILE_SAMPLE_RATE': ('PROFILE_SAMPLE_RATE', float),
+    'PROFILE_DIR': ('PROFILE_DIR', str),
+    'METRICS_TOKEN': ('METRICS_TOKEN', str),
+    'COMPRESSION': ('COMPRESSION', _bool),
+    'COMPRESS_MIN_BYTES': ('COMPRESS_MIN_BYTES', int),
+    'SESSION_COOKIE_SECURE': ('SESSION_COOKIE_SECURE', _bool),
+}
+
+
+def load(config, environ=None, dotenv=True):
+    """Copy the settings found in `environ` (os.environ) into `config`.
+
+    Returns the set of config keys that were set.
+    """
+    if environ is None:
+        if dotenv and load_dotenv is not None:
+            load_dotenv(os.path.join(os.getcwd(), '.env'), override=False)
+        environ = os.environ
+    loaded = set()
+    for key, (variable, parse) in SETTINGS.items():
+        raw = environ.get(variable)
+        if raw is None:
+            continue
+        try:
+            config[key] = parse(raw)
+        except ValueError as e:
+            raise ConfigError(f'{variable}: {e}') from None
+        loaded.add(key)
+    return loaded
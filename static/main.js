@@ -1,29 +1,3 @@
-// Auto-dismiss alerts
-document.addEventListener('DOMContentLoaded', function() {
-    // إخفاء الرسائل تلقائياً بعد 5 ثواني
-    const alerts = document.querySelectorAll('.alert');
-    alerts.forEach(function(alert) {
-        setTimeout(function() {
-            const bsAlert = new bootstrap.Alert(alert);
-            bsAlert.close();
-        }, 5000);
-    });
-
-    // Smooth scroll
-    document.querySelectorAll('a[href^="#"]').forEach(anchor => {
-        anchor.addEventListener('click', function(e) {
-            e.preventDefault();
-            const target = document.querySelector(this.getAttribute('href'));
-            if (target) {
-                target.scrollIntoView({
-                    behavior: 'smooth',
-                    block: 'start'
-                });
-            }
-        });
-    });
-});
-
 // قوالب جاهزة للكتّاب
 const chapterTemplates = {
     basic: `<h2>عنوان الفصل</h2>
@@ -63,16 +37,6 @@ function loadTemplate(templateName) {
     }
 }
 
-// تأكيد الحذف
-document.querySelectorAll('[onclick*="confirm"]').forEach(function(element) {
-    element.addEventListener('click', function(e) {
-        if (!confirm('هل أنت متأكد من هذا الإجراء؟')) {
-            e.preventDefault();
-            return false;
-        }
-    });
-});
-
 // Print Chapter
 function printChapter() {
     window.print();
@@ -126,9 +90,9 @@ document.addEventListener('keydown', function(e) {
     // Ctrl + S للحفظ
     if (e.ctrlKey && e.key === 's') {
         e.preventDefault();
-        const form = document.querySelector('form');
+        const form = document.getElementById('chapterForm');
         if (form) {
-            form.submit();
+            form.requestSubmit();
         }
     }
 
@@ -143,13 +107,12 @@ document.addEventListener('keydown', function(e) {
     }
 });
 
-console.log('NarrEyes App Loaded Successfully! 📚✨');
 // ==================== Enhanced Mobile Experience ====================
 
 document.addEventListener('DOMContentLoaded', function() {
 
-    // Auto-dismiss alerts
-    const alerts = document.querySelectorAll('.alert');
+    // Auto-dismiss flash messages
+    const alerts = document.querySelectorAll('.alert-dismissible');
     alerts.forEach(function(alert) {
         setTimeout(function() {
             const bsAlert = bootstrap.Alert.getInstance(alert) || new bootstrap.Alert(alert);
@@ -158,7 +121,7 @@ document.addEventListener('DOMContentLoaded', function() {
     });
 
     // Smooth scroll
-    document.querySelectorAll('a[href^="#"]').forEach(anchor => {
+    document.querySelectorAll('a[href^="#"]:not([href="#"])').forEach(anchor => {
         anchor.addEventListener('click', function(e) {
             e.preventDefault();
             const target = document.querySelector(this.getAttribute('href'));
@@ -171,29 +134,6 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     });
 
-    // Add loading state to forms
-    const forms = document.querySelectorAll('form');
-    forms.forEach(form => {
-        form.addEventListener('submit', function() {
-            const submitBtn = this.querySelector('button[type="submit"]');
-            if (submitBtn) {
-                submitBtn.disabled = true;
-                submitBtn.classList.add('loading');
-                submitBtn.innerHTML = '<span class="spinner-border spinner-border-sm me-2"></span>Loading...';
-            }
-        });
-    });
-
-    // Confirm delete actions
-    document.querySelectorAll('[onclick*="confirm"]').forEach(function(element) {
-        element.addEventListener('click', function(e) {
-            if (!confirm('Are you sure you want to delete this?')) {
-                e.preventDefault();
-                return false;
-            }
-        });
-    });
-
     // Auto-resize textareas
     const textareas = document.querySelectorAll('textarea');
     textareas.forEach(textarea => {
@@ -222,30 +162,6 @@ document.addEventListener('DOMContentLoaded', function() {
         observer.observe(card);
     });
 
-    // Touch swipe support for mobile
-    let touchStartX = 0;
-    let touchEndX = 0;
-
-    document.addEventListener('touchstart', e => {
-        touchStartX = e.changedTouches[0].screenX;
-    });
-
-    document.addEventListener('touchend', e => {
-        touchEndX = e.changedTouches[0].screenX;
-        handleSwipe();
-    });
-
-    function handleSwipe() {
-        if (touchEndX < touchStartX - 50) {
-            // Swiped left
-            console.log('Swiped left');
-        }
-        if (touchEndX > touchStartX + 50) {
-            // Swiped right
-            console.log('Swiped right');
-        }
-    }
-
     // Add ripple effect to buttons
     const buttons = document.querySelectorAll('.btn');
     buttons.forEach(button => {
@@ -362,5 +278,3 @@ style.textContent = `
     }
 `;
 document.head.appendChild(style);
-
-console.log('✨ NarrEyes Enhanced - Mobile Optimized');
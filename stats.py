@@ -0,0 +1,159 @@
+"""Per-user counters for the dashboard and profile pages.
+
+user_stats holds one row per user with the number of characters, chapters,
+timeline events and relationships and the total word count. Triggers on the
+base tables keep it up to date on every insert, update and delete, so reading
+the stats is a single primary-key lookup no matter how big the project is.
+rebuild() and verify() recompute the counters from the base tables to repair
+or detect drift (see `flask --app app stats`).
+
+data_version goes up by one on every change to an author's characters,
+chapters, timeline or relationships. It is not a count of anything; caches
+of data derived from the whole project (see context.py) put it in their
+keys so that any edit makes them miss.
+"""
+
+import database
+
+COUNTERS = ('characters', 'chapters', 'words', 'timeline', 'relationships')
+
+# Subqueries that compute each counter from the base tables for user `u.id`
+_RECOMPUTE = {
+    'characters': 'SELECT COUNT(*) FROM characters WHERE user_id = u.id',
+    'chapters': 'SELECT COUNT(*) FROM chapters WHERE user_id = u.id',
+    'words': 'SELECT COALESCE(SUM(word_count), 0) FROM chapters WHERE user_id = u.id',
+    'timeline': 'SELECT COUNT(*) FROM timeline WHERE user_id = u.id',
+    'relationships': 'SELECT COUNT(*) FROM relationships WHERE user_id = u.id',
+}
+
+
+def _bump(user, column, delta):
+    """Upsert statement adding `delta` to one counter of `user`"""
+    return (f'INSERT INTO user_stats (user_id, {column}) VALUES ({user}, {delta}) '
+            f'ON CONFLICT(user_id) DO UPDATE SET {column} = {column} + ({delta});')
+
+
+TRIGGERS = {
+    'trg_stats_users_insert': '''AFTER INSERT ON users BEGIN
+        INSERT OR IGNORE INTO user_stats (user_id) VALUES (NEW.id);
+    END''',
+    'trg_stats_users_delete': '''AFTER DELETE ON users BEGIN
+        DELETE FROM user_stats WHERE user_id = OLD.id;
+    END''',
+    'trg_stats_characters_insert': f'''AFTER INSERT ON characters BEGIN
+        {_bump('NEW.user_id', 'characters', 1)}
+    END''',
+    'trg_stats_characters_delete': f'''AFTER DELETE ON characters BEGIN
+        {_bump('OLD.user_id', 'characters', -1)}
+    END''',
+    'trg_stats_chapters_insert': f'''AFTER INSERT ON chapters BEGIN
+        {_bump('NEW.user_id', 'chapters', 1)}
+        {_bump('NEW.user_id', 'words', 'COALESCE(NEW.word_count, 0)')}
+    END''',
+    'trg_stats_chapters_update': f'''AFTER UPDATE OF word_count, user_id ON chapters BEGIN
+        {_bump('OLD.user_id', 'words', '-COALESCE(OLD.word_count, 0)')}
+        {_bump('NEW.user_id', 'words', 'COALESCE(NEW.word_count, 0)')}
+    END''',
+    'trg_stats_chapters_delete': f'''AFTER DELETE ON chapters BEGIN
+        {_bump('OLD.user_id', 'chapters', -1)}
+        {_bump('OLD.user_id', 'words', '-COALESCE(OLD.word_count, 0)')}
+    END''',
+    'trg_stats_timeline_insert': f'''AFTER INSERT ON timeline BEGIN
+        {_bump('NEW.user_id', 'timeline', 1)}
+    END''',
+    'trg_stats_timeline_delete': f'''AFTER DELETE ON timeline BEGIN
+        {_bump('OLD.user_id', 'timeline', -1)}
+    END''',
+    'trg_stats_relationships_insert': f'''AFTER INSERT ON relationships BEGIN
+        {_bump('NEW.user_id', 'relationships', 1)}
+    END''',
+    'trg_stats_relationships_delete': f'''AFTER DELETE ON relationships BEGIN
+        {_bump('OLD.user_id', 'relationships', -1)}
+    END''',
+}
+
+
+VERSIONED = ('characters', 'chapters', 'timeline', 'relationships')
+
+VERSION_TRIGGERS = {
+    f'trg_version_{table}_{event.lower()}': f'''AFTER {event} ON {table} BEGIN
+        {_bump(f'{row}.user_id', 'data_version', 1)}
+    END'''
+    for table in VERSIONED
+    for event, row in (('INSERT', 'NEW'), ('UPDATE', 'NEW'), ('DELETE', 'OLD'))
+}
+
+
+def create_schema(db):
+    """Create user_stats and its triggers, backfilling it the first time"""
+    exists = db.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'user_stats'").fetchone()
+
+    db.execute('''CREATE TABLE IF NOT EXISTS user_stats (
+        user_id INTEGER PRIMARY KEY,
+        characters INTEGER NOT NULL DEFAULT 0,
+        chapters INTEGER NOT NULL DEFAULT 0,
+        words INTEGER NOT NULL DEFAULT 0,
+        timeline INTEGER NOT NULL DEFAULT 0,
+        relationships INTEGER NOT NULL DEFAULT 0,
+        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+    )''')
+    for name, body in TRIGGERS.items():
+        db.execute(f'CREATE TRIGGER IF NOT EXISTS {name} {body}')
+
+    if not exists:
+        rebuild(db)
+
+
+def create_version_schema(db):
+    """Add data_version to user_stats and the triggers that bump it"""
+    database.add_column(db, 'user_stats', 'data_version', 'INTEGER NOT NULL DEFAULT 0')
+    for name, body in VERSION_TRIGGERS.items():
+        db.execute(f'CREATE TRIGGER IF NOT EXISTS {name} {body}')
+
+
+def data_version(db, user_id):
+    """The author's data_version; 0 before their first edit"""
+    row = db.execute('SELECT data_version FROM user_stats WHERE user_id = ?', (user_id,)).fetchone()
+    return row[0] if row is not None else 0
+
+
+def get_stats(db, user_id):
+    """Return the counters for one user as a dict"""
+    row = db.execute('SELECT * FROM user_stats WHERE user_id = ?', (user_id,)).fetchone()
+    if row is None:
+        return dict.fromkeys(COUNTERS, 0)
+    return {name: row[name] for name in COUNTERS}
+
+
+def _recompute_select(where=''):
+    columns = ', '.join(f'({sql}) AS {name}' for name, sql in _RECOMPUTE.items())
+    return f'SELECT u.id AS user_id, {columns} FROM users u {where}'
+
+
+def rebuild(db, user_id=None):
+    """Recompute counters from the base tables; returns the number of users"""
+    where, params = ('WHERE u.id = ?', (user_id,)) if user_id is not None else ('WHERE true', ())
+    # An upsert rather than INSERT OR REPLACE, which would reset data_version
+    cursor = db.execute(f'INSERT INTO user_stats (user_id, {", ".join(COUNTERS)}) '
+                        f'{_recompute_select(where)} '
+                        f'ON CONFLICT(user_id) DO UPDATE SET '
+                        f'{", ".join(f"{name} = excluded.{name}" for name in COUNTERS)}', params)
+    db.execute('DELETE FROM user_stats WHERE user_id NOT IN (SELECT id FROM users)')
+    return cursor.rowcount
+
+
+def verify(db):
+    """Compare stored counters with the base tables.
+
+    Returns a list of (user_id, counter, stored, actual) tuples, one per
+    counter that has drifted. An empty list means everything matches.
+    """
+    drift = []
+    stored = {row['user_id']: row for row in db.execute('SELECT * FROM user_stats')}
+    for actual in db.execute(_recompute_select()):
+        row = stored.get(actual['user_id'])
+        for name in COUNTERS:
+            value = row[name] if row is not None else None
+            if value != actual[name]:
+                drift.append((actual['user_id'], name, value, actual[name]))
+    return drift
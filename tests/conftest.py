@@ -0,0 +1,40 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import app as narreyes  # noqa: E402
+import database  # noqa: E402
+
+
+@pytest.fixture
+def app(tmp_path):
+    """The app on a fresh, migrated database, hashing passwords inline"""
+    saved = dict(narreyes.app.config)
+    narreyes.app.config.update(DATABASE=str(tmp_path / 'test.db'), TESTING=True, PASSWORD_WORKERS=0,
+                               AUTH_IP_PER_MINUTE=0, AUTH_USER_PER_MINUTE=0)
+    narreyes.init_db()
+    yield narreyes.app
+    database.close_pools()
+    narreyes.app.config.clear()
+    narreyes.app.config.update(saved)
+
+
+@pytest.fixture
+def db(app):
+    conn = database.connect(app.config['DATABASE'])
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def client(app):
+    """A test client logged in as a new author, `writer`"""
+    client = app.test_client()
+    client.post('/register', data={'username': 'writer', 'email': 'writer@example.com',
+                                   'password': 'secret1', 'confirm_password': 'secret1'})
+    response = client.post('/login', data={'username': 'writer', 'password': 'secret1'})
+    assert response.status_code == 302
+    return client
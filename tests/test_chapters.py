@@ -0,0 +1,24 @@
+def test_chapter_page_revalidates_per_author_name(client, db):
+    client.post('/add_chapter', data={'title': 'One', 'content': 'Once upon a time.'})
+    chapter_id = db.execute('SELECT id FROM chapters').fetchone()[0]
+
+    tag = client.get(f'/chapter/{chapter_id}').headers['ETag']
+    assert client.get(f'/chapter/{chapter_id}', headers={'If-None-Match': tag}).status_code == 304
+
+    # The navbar shows the username, so the browser's copy is stale after a rename
+    with client.session_transaction() as session:
+        session['username'] = 'renamed'
+    response = client.get(f'/chapter/{chapter_id}', headers={'If-None-Match': tag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != tag
+    assert b'renamed' in response.get_data()
+
+
+def test_autosave_rejects_a_bool_base_version(client, db):
+    client.post('/add_chapter', data={'title': 'One', 'content': 'Once upon a time.'})
+    chapter_id = db.execute('SELECT id FROM chapters').fetchone()[0]
+
+    # True == 1, the version of a new chapter, so it would otherwise save
+    response = client.patch(f'/api/chapters/{chapter_id}/autosave', json={'base_version': True, 'content': 'x'})
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'base_version is required'}
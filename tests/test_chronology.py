@@ -0,0 +1,26 @@
+import pytest
+
+import chronology
+
+
+@pytest.mark.parametrize('text, same_as', [
+    ('12/05/2020', '2020-05-12'),  # day first
+    ('05/25/2020', '2020-05-25'),  # month first, as 25 is no month
+    ('2020/05/12', '2020-05-12'),
+    ('12/05/2020 BC', '2020-05-12 BC'),
+])
+def test_slash_dates(text, same_as):
+    calendar = chronology.Calendar()
+    assert calendar.parse(text) == calendar.parse(same_as)
+
+
+def test_impossible_slash_date_is_undated():
+    calendar = chronology.Calendar()
+    assert calendar.parse('31/31/2020') is None
+    assert chronology.sort_key(calendar, '31/31/2020') == chronology.UNDATED
+
+
+def test_slash_dates_sort_within_their_year():
+    calendar = chronology.Calendar()
+    dates = ['12/05/2020', '2020', '01/02/2020', '31/12/2019']
+    assert sorted(dates, key=calendar.parse) == ['31/12/2019', '2020', '01/02/2020', '12/05/2020']
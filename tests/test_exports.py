@@ -0,0 +1,13 @@
+import pytest
+
+
+@pytest.mark.parametrize('export_format, content_type', [
+    ('md', 'text/markdown; charset=utf-8'),
+    ('txt', 'text/plain; charset=utf-8'),
+])
+def test_text_exports_have_one_charset(client, export_format, content_type):
+    client.post('/add_chapter', data={'title': 'One', 'chapter_number': '1', 'content': '<p>Hello.</p>'})
+    with client.get(f'/export/{export_format}') as response:
+        assert response.status_code == 200
+        assert response.headers['Content-Type'] == content_type
+        assert b'Hello.' in response.get_data()
@@ -0,0 +1,31 @@
+import pytest
+
+
+@pytest.fixture
+def profiling(app, tmp_path):
+    directory = tmp_path / 'profiles'
+    app.config.update(INSTRUMENTATION=True, PROFILING=True, PROFILE_DIR=str(directory), PROFILE_MAX_FILES=2)
+    return directory
+
+
+def _profiles(directory):
+    return sorted(directory.glob('*.prof')) if directory.exists() else []
+
+
+def test_anonymous_requests_cannot_ask_for_a_profile(app, profiling):
+    app.test_client().get('/login?_profile=1')
+    assert _profiles(profiling) == []
+
+
+def test_profiles_stop_at_the_cap(client, profiling):
+    for _ in range(3):
+        client.get('/chapters?_profile=1')
+    assert len(_profiles(profiling)) == 2
+
+
+def test_token_is_required_when_set(client, app, profiling):
+    app.config['METRICS_TOKEN'] = 'token'
+    client.get('/chapters?_profile=1')
+    assert _profiles(profiling) == []
+    client.get('/chapters?_profile=1', headers={'Authorization': 'Bearer token'})
+    assert len(_profiles(profiling)) == 1
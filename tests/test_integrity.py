@@ -0,0 +1,42 @@
+import integrity
+
+
+def _author(db):
+    db.execute("INSERT INTO users (id, username, email, password_hash) VALUES (1, 'a', 'a@x', 'x')")
+    db.execute("INSERT INTO characters (id, user_id, name) VALUES (1, 1, 'Ann')")
+    db.execute("INSERT INTO chapters (id, user_id, title, chapter_number, content) VALUES (1, 1, 'One', 1, 'Ann')")
+    db.execute('INSERT INTO chapter_mentions VALUES (1, 1, 1, 1, 0)')
+
+
+def test_scan_and_repair_find_every_orphan(db):
+    _author(db)
+    db.commit()
+    db.execute('PRAGMA foreign_keys = OFF')
+    # Mentions of a chapter and a character that are gone, and rows of a user who is
+    db.execute('INSERT INTO chapter_mentions VALUES (9, 1, 1, 1, 0)')
+    db.execute('INSERT INTO chapter_mentions VALUES (1, 9, 1, 1, 0)')
+    db.execute("INSERT INTO characters (id, user_id, name) VALUES (2, 7, 'Bo')")
+    db.execute("INSERT INTO chapters (id, user_id, title, chapter_number) VALUES (2, 7, 'Two', 1)")
+    db.execute('INSERT INTO chapter_mentions VALUES (2, 2, 7, 1, 0)')
+    db.execute("INSERT INTO timeline (user_id, event_title, chapter_id) VALUES (1, 'Event', 9)")
+    db.execute("INSERT INTO progress_events (user_id, day, delta) VALUES (7, '2024-01-01', 5)")
+    db.commit()
+    db.execute('PRAGMA foreign_keys = ON')
+
+    found = {(table, reference): count for table, reference, count in integrity.scan(db)}
+    assert found == {
+        ('characters', 'user'): 1,
+        ('chapters', 'user'): 1,
+        ('chapter_mentions', 'user'): 1,
+        ('chapter_mentions', 'chapter'): 1,
+        ('chapter_mentions', 'character'): 1,
+        ('timeline', 'chapter'): 1,
+        ('progress_events', 'user'): 1,
+        ('progress_rollups', 'user'): 3,
+    }
+
+    fixed = {(table, reference): count for table, reference, count in integrity.repair(db)}
+    assert fixed == found
+    assert integrity.scan(db) == []
+    assert [tuple(row) for row in db.execute('SELECT chapter_id, character_id, user_id FROM chapter_mentions')] == [(1, 1, 1)]
+    assert db.execute('SELECT COUNT(*) FROM chapters').fetchone()[0] == 1
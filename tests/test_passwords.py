@@ -0,0 +1,30 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import passwords
+
+
+def test_hash_queued_when_the_pool_closes_is_busy():
+    hasher = passwords.Hasher(workers=1, max_pending=5, timeout=5)
+    hasher._executor = ThreadPoolExecutor(1)  # stands in for the process pool
+    gate = threading.Event()
+    hasher._executor.submit(gate.wait)  # keeps the worker occupied
+    outcome = []
+
+    def login():
+        try:
+            outcome.append(hasher._run(time.sleep, 0))
+        except passwords.Busy:
+            outcome.append('busy')
+
+    thread = threading.Thread(target=login)
+    thread.start()
+    while hasher.pending == 0:
+        time.sleep(0.01)
+    hasher.close()
+    gate.set()
+    thread.join(5)
+    assert outcome == ['busy']
+    assert hasher.pending == 0
+
@@ -0,0 +1,175 @@
+"""Text statistics for chapter HTML produced by TinyMCE.
+
+analyze() walks the HTML once with a single compiled regex, classifying each
+token as markup, entity, whitespace, word text or sentence punctuation, and
+keeps running counters instead of stripping the markup into a new string
+first. Tags and attributes are never counted as words, inline tags such as
+<em> do not split a word, and block tags end words and paragraphs.
+"""
+
+import html
+import math
+import re
+from collections import namedtuple
+
+EXCERPT_LENGTH = 150
+WORDS_PER_MINUTE = 238
+
+TextStats = namedtuple('TextStats', [
+    'word_count',       # words of visible text
+    'char_count',       # visible characters, not counting whitespace
+    'paragraph_count',  # block elements (or bare text runs) containing words
+    'sentence_count',   # runs of text ended by . ! ? or a block boundary
+    'reading_minutes',  # estimated at WORDS_PER_MINUTE, rounded up
+    'excerpt',          # plain-text preview for the chapters list
+])
+
+# Word text (with any whitespace after it, so most words cost one match) is
+# tried first because it is by far the most common token.
+_TOKEN_RE = re.compile(r'''
+    (?P<word>[^\s<&.!?…]+)(?P<wordspace>\s+)?
+  | (?P<space>\s+)
+  | (?P<skip><(?:script|style)\b.*?</(?:script|style)\s*>|<!--.*?-->)
+  | </?(?P<tag>[a-zA-Z][a-zA-Z0-9]*)[^>]*>
+  | (?P<markup><[^>]*>)
+  | (?P<entity>&(?:\#[0-9]+|\#[xX][0-9a-fA-F]+|[a-zA-Z][a-zA-Z0-9]*);)
+  | (?P<end>[.!?…]+["'”’)\]]*(?=[\s<&]|$))
+  | (?P<text>[.!?…&<])
+''', re.VERBOSE | re.DOTALL | re.IGNORECASE)
+
+# Tags that separate words; the first group also separates paragraphs
+_PARAGRAPH_TAGS = frozenset([
+    'p', 'div', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'li', 'blockquote', 'pre',
+    'td', 'th', 'section', 'article', 'header', 'footer', 'figcaption', 'dd', 'dt',
+])
+_BREAK_TAGS = frozenset(['br', 'hr', 'tr', 'ul', 'ol', 'table', 'img'])
+_SENTENCE_END = frozenset('.!?…')
+
+
+def analyze(content, excerpt_length=EXCERPT_LENGTH):
+    """Compute TextStats for an HTML fragment in one pass.
+
+    The excerpt keeps the first `excerpt_length` visible characters, or the
+    whole text when `excerpt_length` is None.
+    """
+    words = chars = paragraphs = sentences = 0
+    in_word = para_has_words = sentence_has_words = False
+    excerpt = []
+    excerpt_len = 0
+    pending_space = False
+    collecting = True
+
+    for match in _TOKEN_RE.finditer(content or ''):
+        kind = match.lastgroup
+        if kind == 'word' or kind == 'wordspace':
+            # Fast path: plain word text, the bulk of any chapter
+            value = match.group('word')
+            if not in_word:
+                words += 1
+                para_has_words = sentence_has_words = True
+            chars += len(value)
+            if collecting:
+                if pending_space and excerpt:
+                    excerpt.append(' ')
+                    excerpt_len += 1
+                excerpt.append(value)
+                excerpt_len += len(value)
+                collecting = excerpt_length is None or excerpt_len <= excerpt_length
+            in_word = kind == 'word'
+            pending_space = not in_word
+            continue
+
+        if kind == 'entity':
+            value = html.unescape(match.group())
+            if value.isspace():
+                kind = 'space'
+            elif value in _SENTENCE_END:
+                kind = 'end'
+        elif kind == 'end' or kind == 'text':
+            value = match.group()
+
+        if kind == 'tag':
+            name = match.group('tag').lower()
+            if name in _PARAGRAPH_TAGS:
+                if sentence_has_words:
+                    sentences += 1
+                    sentence_has_words = False
+                if para_has_words:
+                    paragraphs += 1
+                    para_has_words = False
+            elif name not in _BREAK_TAGS:
+                # Inline tags (<em>, <span>, ...) do not split words
+                continue
+        elif kind == 'space' or kind == 'skip' or kind == 'markup':
+            pass
+        else:
+            if kind == 'end':
+                if sentence_has_words:
+                    sentences += 1
+                    sentence_has_words = False
+            elif not in_word:
+                words += 1
+                in_word = para_has_words = sentence_has_words = True
+            chars += len(value)
+            if collecting:
+                if pending_space and excerpt:
+                    excerpt.append(' ')
+                    excerpt_len += 1
+                excerpt.append(value)
+                excerpt_len += len(value)
+                collecting = excerpt_length is None or excerpt_len <= excerpt_length
+            pending_space = False
+            continue
+
+        in_word = False
+        pending_space = True
+
+    if sentence_has_words:
+        sentences += 1
+    if para_has_words:
+        paragraphs += 1
+
+    text = ''.join(excerpt)
+    if excerpt_length is not None and len(text) > excerpt_length:
+        text = text[:excerpt_length].rstrip() + '...'
+    reading_minutes = math.ceil(words / WORDS_PER_MINUTE) if words else 0
+    return TextStats(words, chars, paragraphs, sentences, reading_minutes, text)
+
+
+def strip_html(content):
+    """Return the visible text of an HTML fragment with whitespace collapsed"""
+    return analyze(content, excerpt_length=None).excerpt
+
+
+def make_excerpt(content, length=EXCERPT_LENGTH):
+    """Short plain-text preview of a chapter for the list page"""
+    return analyze(content, length).excerpt
+
+
+def backfill(db, batch_size=500):
+    """Recompute the stored statistics for every chapter, one batch at a time.
+
+    Rows are walked in id order and each batch is committed on its own, so a
+    large database never holds more than `batch_size` chapters in memory or
+    keeps the write lock for long. Returns the number of chapters updated.
+    """
+    updated = 0
+    last_id = 0
+    while True:
+        rows = db.execute('SELECT id, content FROM chapters WHERE id > ? ORDER BY id LIMIT ?',
+                          (last_id, batch_size)).fetchall()
+        if not rows:
+            break
+        params = []
+        for row in rows:
+            result = analyze(row['content'])
+            params.append((result.word_count, result.char_count, result.paragraph_count,
+                           result.sentence_count, result.reading_minutes, result.excerpt, row['id']))
+        db.executemany('''UPDATE chapters
+                          SET word_count=?, char_count=?, paragraph_count=?, sentence_count=?,
+                              reading_minutes=?, excerpt=?
+                          WHERE id=?''', params)
+        db.commit()
+        updated += len(rows)
+        last_id = rows[-1]['id']
+    return updated
@@ -0,0 +1,12 @@
+"""WSGI entry point for production servers.
+
+    flask --app wsgi migrate                 # once per deploy, before starting workers
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Settings come from the environment or a .env file (see .env.example);
+SECRET_KEY is required so that every worker signs sessions alike.
+"""
+
+from app import create_app
+
+app = create_app(require_secret=True)